@@ -0,0 +1,215 @@
+# audit_log.py
+# 匿名投稿の監査ログ（追記専用・セグメント分割のJSONL）
+import bisect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+COUNTER_FILE = "counter"
+# 採番のたびにファイルを書かないよう、IDはこの数ずつまとめて予約して保存する
+COUNTER_RESERVE = 100
+
+class AuditLog:
+    """
+    - seg_<先頭ID>.jsonl に1行1レコードで追記し、一定件数でセグメントを切り替える
+    - 投稿IDは再起動をまたいで単調増加（予約済みの上限を counter に保存）
+    - ID検索は「セグメント → 疎なオフセット索引 → 数行だけ読む」の順で行う
+    - 最近のレコードは LRU でメモリに持つ
+    """
+    def __init__(self, directory, segment_records=5000, index_every=64, cache_size=1024, retention_days=90):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.index_every = index_every
+        self.cache_size = cache_size
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments = []   # 先頭IDの昇順
+        self._indexes = {}    # 先頭ID -> [(ID, オフセット), ...]
+        for name in os.listdir(directory):
+            if name.startswith("seg_") and name.endswith(".jsonl"):
+                self._segments.append(int(name[4:-6]))
+        self._segments.sort()
+
+        self._active = None
+        self._active_count = 0
+        last_id = 0
+        if self._segments:
+            first = self._segments[-1]
+            self._active_count, last_id = self._scan_segment(first)
+            for seg in self._segments[:-1]:
+                self._load_index(seg)
+            self._active = open(self._segment_path(first), "ab")
+            # 途中で落ちて最終行が欠けていたら、次のレコードがくっつかないよう改行しておく
+            if self._active.tell() > 0:
+                with open(self._segment_path(first), "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        self._active.write(b"\n")
+
+        # 予約済みの上限の次から採番する（欠番は出ても、IDが巻き戻ることはない）
+        self._reserved = max(self._read_counter(), last_id)
+        self._next_id = self._reserved + 1
+
+    # --- ファイル名 ---
+    def _segment_path(self, first_id):
+        return os.path.join(self.directory, f"seg_{first_id:012d}.jsonl")
+
+    def _index_path(self, first_id):
+        return os.path.join(self.directory, f"seg_{first_id:012d}.idx")
+
+    # --- 採番 ---
+    def _read_counter(self):
+        try:
+            with open(os.path.join(self.directory, COUNTER_FILE), "r") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_counter(self, value):
+        path = os.path.join(self.directory, COUNTER_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(value))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _allocate_id(self):
+        post_id = self._next_id
+        if post_id > self._reserved:
+            self._reserved = post_id + COUNTER_RESERVE - 1
+            self._write_counter(self._reserved)
+        self._next_id += 1
+        return post_id
+
+    # --- 索引 ---
+    def _scan_segment(self, first_id):
+        """セグメントを読み直して疎な索引を作ります。(件数, 最後のID) を返します。"""
+        index, count, last_id, offset = [], 0, 0, 0
+        with open(self._segment_path(first_id), "rb") as f:
+            for line in f:
+                try:
+                    record_id = json.loads(line)["id"]
+                except (ValueError, KeyError):
+                    offset += len(line)
+                    continue
+                if count % self.index_every == 0:
+                    index.append((record_id, offset))
+                count += 1
+                last_id = record_id
+                offset += len(line)
+        self._indexes[first_id] = index
+        return count, last_id
+
+    def _load_index(self, first_id):
+        try:
+            with open(self._index_path(first_id), "r") as f:
+                self._indexes[first_id] = [tuple(p) for p in json.load(f)]
+        except (OSError, ValueError):
+            self._scan_segment(first_id)
+
+    def _save_index(self, first_id):
+        with open(self._index_path(first_id), "w") as f:
+            json.dump(self._indexes.get(first_id, []), f)
+
+    # --- 書き込み ---
+    def append(self, **fields):
+        """レコードを追記して、採番した投稿IDを返します。"""
+        with self._lock:
+            post_id = self._allocate_id()
+            record = {"id": post_id, "ts": int(time.time()), **fields}
+            if self._active is None or self._active_count >= self.segment_records:
+                self._rotate(post_id)
+            line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+            offset = self._active.tell()
+            self._active.write(line)
+            self._active.flush()
+            if self._active_count % self.index_every == 0:
+                self._indexes[self._segments[-1]].append((post_id, offset))
+            self._active_count += 1
+            self._remember(post_id, record)
+            return post_id
+
+    def _rotate(self, first_id):
+        if self._active is not None:
+            self._active.close()
+            self._save_index(self._segments[-1])
+        self._segments.append(first_id)
+        self._indexes[first_id] = []
+        self._active = open(self._segment_path(first_id), "ab")
+        self._active_count = 0
+
+    # --- 読み込み ---
+    def _remember(self, post_id, record):
+        self._cache[post_id] = record
+        self._cache.move_to_end(post_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get(self, post_id):
+        """投稿IDからレコードを返します。見つからなければ None"""
+        post_id = int(post_id)
+        with self._lock:
+            record = self._cache.get(post_id)
+            if record is not None:
+                self._cache.move_to_end(post_id)
+                return record
+
+            i = bisect.bisect_right(self._segments, post_id) - 1
+            if i < 0: return None
+            first_id = self._segments[i]
+            index = self._indexes.get(first_id, [])
+            j = bisect.bisect_right(index, (post_id, float("inf"))) - 1
+            if j < 0: return None
+            path = self._segment_path(first_id)
+            if not os.path.exists(path): return None
+            with open(path, "rb") as f:
+                f.seek(index[j][1])
+                # 索引の間隔分だけ読めば必ず見つかる
+                for _ in range(self.index_every):
+                    line = f.readline()
+                    if not line: break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("id") == post_id:
+                        self._remember(post_id, record)
+                        return record
+                    if record.get("id", 0) > post_id: break
+            return None
+
+    # --- 古いセグメントの整理 ---
+    def compact(self):
+        """保存期間を過ぎたセグメント（書き込み中のものを除く）を削除し、消した数を返します。"""
+        if not self.retention_days: return 0
+        limit = time.time() - self.retention_days * 86400
+        removed = 0
+        with self._lock:
+            for first_id in list(self._segments[:-1]):
+                path = self._segment_path(first_id)
+                try:
+                    if os.path.getmtime(path) >= limit: continue
+                    os.remove(path)
+                except OSError:
+                    pass
+                try: os.remove(self._index_path(first_id))
+                except OSError: pass
+                self._segments.remove(first_id)
+                self._indexes.pop(first_id, None)
+                removed += 1
+            for post_id in [p for p in self._cache if self._segments and p < self._segments[0]]:
+                del self._cache[post_id]
+        return removed
+
+    def close(self):
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._save_index(self._segments[-1])
+                self._active = None
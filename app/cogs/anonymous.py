@@ -1,9 +1,13 @@
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
+import asyncio
 import datetime
-import json
-import os
+import time
+import config
+import config_store
+import ratelimit
+from audit_log import AuditLog
 
 # --- モーダル・ボタン設定 ---
 class PostModal(discord.ui.Modal):
@@ -44,31 +48,95 @@ class PostView(discord.ui.View):
         self.add_item(btn)
 
     async def callback(self, interaction: discord.Interaction):
-        retry = self.cog.check_cooldown(interaction.user.id)
+        retry = self.cog.check_cooldown(interaction.user.id, interaction.guild_id)
         if retry: 
             return await interaction.response.send_message(f"連投制限中です。あと {int(retry)} 秒お待ちください。", ephemeral=True)
         await interaction.response.send_modal(PostModal(self.cog, self.is_anon, self.is_image))
 
+# --- パネル貼り直しのまとめ役 ---
+class PanelBumpScheduler:
+    """
+    投稿のたびにパネルを貼り直すと REST 呼び出しが積み上がるので、
+    チャンネルごとに「quiet 秒投稿が止まったら1回だけ」貼り直します。
+    投稿が途切れなくても max_wait 秒に1回は貼り直します。
+    """
+    def __init__(self, cog, quiet=4.0, max_wait=30.0):
+        self.cog = cog
+        self.quiet = quiet
+        self.max_wait = max_wait
+        self._last = {}    # channel_id -> 最後の投稿時刻
+        self._first = {}   # channel_id -> 未反映の最初の投稿時刻
+        self._panel = {}   # channel_id -> (channel, is_anon, p_type)
+        self._tasks = {}
+
+    def bump(self, channel, is_anon, p_type):
+        now = time.monotonic()
+        self._last[channel.id] = now
+        self._first.setdefault(channel.id, now)
+        self._panel[channel.id] = (channel, is_anon, p_type)
+        if channel.id not in self._tasks:
+            self._tasks[channel.id] = asyncio.create_task(self._run(channel.id))
+
+    async def _run(self, channel_id):
+        try:
+            while channel_id in self._first:
+                # 静かになるか、最初の投稿から max_wait 経つまで待つ
+                while True:
+                    deadline = min(self._last[channel_id] + self.quiet, self._first[channel_id] + self.max_wait)
+                    delay = deadline - time.monotonic()
+                    if delay <= 0: break
+                    await asyncio.sleep(delay)
+                # ここから先に来た投稿は次の回でまとめる
+                del self._first[channel_id]
+                channel, is_anon, p_type = self._panel[channel_id]
+                try:
+                    await self.cog.repost_panel(channel, is_anon, p_type)
+                except Exception as e:
+                    print(f"[Anon] Panel repost failed for #{channel}: {e}")
+        finally:
+            self._tasks.pop(channel_id, None)
+
+    def cancel_all(self):
+        for task in self._tasks.values():
+            task.cancel()
+
 # --- メインロジック ---
 class Anonymous(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.post_count = 0
-        self.logs = {}
-        self.cooldowns = {}
+        # 投稿者の記録はディスク上の監査ログへ（投稿IDも再起動をまたいで連番）
+        # 開くときに最後のセグメントを読み直すので、作るのは cog_load でスレッドから
+        self.audit = None
+        # 連投制限（90秒に1回）
+        self.cooldowns = ratelimit.cooldown(90)
         self.settings_file = "anon_settings.json"
-        self.panel_data = self.load_settings()
+        # パネル設定は共有の設定ストアに置き、保存はまとめて後から行う
+        self.settings = config_store.get_config(self.settings_file, indent=None)
+        self.panel_data = self.settings.data
+        self.bumps = PanelBumpScheduler(self)
         self.default_avatar = "https://cdn.discordapp.com/embed/avatars/0.png"
+        # チャンネルID -> Webhook（毎回 channel.webhooks() を叩かないためのキャッシュ）
+        self.webhooks = {}
+        self._webhook_locks = {}
 
-    def load_settings(self):
-        if os.path.exists(self.settings_file):
-            try:
-                with open(self.settings_file, "r") as f: return json.load(f)
-            except: return {}
-        return {}
+    async def cog_load(self):
+        self.audit = await asyncio.to_thread(AuditLog, config.ANON_LOG_DIR, retention_days=config.ANON_LOG_RETENTION_DAYS)
+        self.compact_logs.start()
+
+    async def cog_unload(self):
+        self.compact_logs.cancel()
+        self.bumps.cancel_all()
+        await self.settings.flush()
+        if self.audit: await asyncio.to_thread(self.audit.close)
+
+    @tasks.loop(hours=24)
+    async def compact_logs(self):
+        removed = await asyncio.to_thread(self.audit.compact)
+        if removed:
+            print(f"[Anon Log] Removed {removed} expired log segments")
 
     def save_settings(self):
-        with open(self.settings_file, "w") as f: json.dump(self.panel_data, f)
+        self.settings.save()
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -78,42 +146,58 @@ class Anonymous(commands.Cog):
         ここではパネルのメッセージを最新化（再送信）するロジックを維持しています。
         """
         print("🔄 匿名パネルの状態を確認中...")
+        channels = []
         for channel_id, data in list(self.panel_data.items()):
             channel = self.bot.get_channel(int(channel_id))
             if channel:
                 # 必要に応じてパネルを再送して最新の状態にする
                 # (前回のメッセージが残っていても add_view 済みならボタンは動きます)
-                pass
-        print("✅ 全パネルの確認が完了しました。")
+                channels.append(channel)
+        # 全パネルのWebhookを並行して先読みしておく（初回投稿の待ち時間をなくす）
+        results = await asyncio.gather(*(self.get_webhook(ch) for ch in channels), return_exceptions=True)
+        failed = sum(1 for r in results if isinstance(r, Exception))
+        print(f"✅ 全パネルの確認が完了しました。(Webhook {len(results) - failed}/{len(results)})")
+
+    def check_cooldown(self, user_id, guild_id=None):
+        return self.cooldowns.retry_after(("anon_post", user_id, guild_id))
 
-    def check_cooldown(self, user_id):
-        now = datetime.datetime.now()
-        if user_id in self.cooldowns:
-            elapsed = (now - self.cooldowns[user_id]).total_seconds()
-            if elapsed < 90: return 90 - elapsed
-        return None
+    async def get_webhook(self, channel, refresh=False):
+        if not refresh and channel.id in self.webhooks:
+            return self.webhooks[channel.id]
+        # 同じチャンネルで同時に取得・作成しないようロック
+        async with self._webhook_locks.setdefault(channel.id, asyncio.Lock()):
+            if not refresh and channel.id in self.webhooks:
+                return self.webhooks[channel.id]
+            webhooks = await channel.webhooks()
+            webhook = discord.utils.get(webhooks, name="ProxyWebhook")
+            webhook = webhook or await channel.create_webhook(name="ProxyWebhook")
+            self.webhooks[channel.id] = webhook
+            return webhook
 
-    async def get_webhook(self, channel):
-        webhooks = await channel.webhooks()
-        webhook = discord.utils.get(webhooks, name="ProxyWebhook")
-        return webhook or await channel.create_webhook(name="ProxyWebhook")
+    async def send_via_webhook(self, channel, **kwargs):
+        webhook = await self.get_webhook(channel)
+        try:
+            await webhook.send(**kwargs)
+        except (discord.NotFound, discord.Forbidden):
+            # Webhookが消された・差し替えられた場合はキャッシュを捨てて1回だけ取り直す
+            self.webhooks.pop(channel.id, None)
+            webhook = await self.get_webhook(channel, refresh=True)
+            await webhook.send(**kwargs)
+
+    async def warm_webhook(self, channel):
+        try:
+            await self.get_webhook(channel)
+        except Exception as e:
+            print(f"[Anon] Webhook preload failed for #{channel}: {e}")
 
     async def process_post(self, interaction, is_anon, content=None, image_url=None):
         await interaction.response.defer(ephemeral=True)
-        self.post_count += 1
-        p_id = str(self.post_count)
-        self.logs[p_id] = f"{interaction.user} ({interaction.user.id}) [{'匿名' if is_anon else '代理'}]"
-        self.cooldowns[interaction.user.id] = datetime.datetime.now()
-
-        webhook = await self.get_webhook(interaction.channel)
-        
-        # 旧パネル削除（常に最新のパネルを下に置くための仕様を継続）
-        data = self.panel_data.get(str(interaction.channel.id))
-        if data and "last_msg_id" in data:
-            try:
-                msg = await interaction.channel.fetch_message(data["last_msg_id"])
-                await msg.delete()
-            except: pass
+        p_id = str(await asyncio.to_thread(
+            self.audit.append,
+            user_id=interaction.user.id, user=str(interaction.user), mode="匿名" if is_anon else "代理",
+            guild_id=interaction.guild_id, channel_id=interaction.channel_id
+        ))
+        self.cooldowns.consume(("anon_post", interaction.user.id, interaction.guild_id))
 
         name = p_id if is_anon else f"{p_id} | {interaction.user.display_name}"
         avatar = self.default_avatar if is_anon else interaction.user.display_avatar.url
@@ -121,13 +205,23 @@ class Anonymous(commands.Cog):
         
         if image_url:
             embed = discord.Embed(color=0x2f3136).set_image(url=image_url)
-            await webhook.send(username=name, avatar_url=avatar, embed=embed, allowed_mentions=allowed_mentions)
+            await self.send_via_webhook(interaction.channel, username=name, avatar_url=avatar, embed=embed, allowed_mentions=allowed_mentions)
         else:
-            await webhook.send(content=content, username=name, avatar_url=avatar, allowed_mentions=allowed_mentions)
+            await self.send_via_webhook(interaction.channel, content=content, username=name, avatar_url=avatar, allowed_mentions=allowed_mentions)
 
-        await self.send_proper_panel(interaction.channel, is_anon, "image" if image_url else "text")
+        # 常に最新のパネルを下に置く仕様は継続。ただし貼り直しはまとめて後で行う
+        self.bumps.bump(interaction.channel, is_anon, "image" if image_url else "text")
         await interaction.followup.send("投稿完了いたしましたわ、ご主人様。", ephemeral=True)
 
+    async def repost_panel(self, channel, is_anon, p_type):
+        """旧パネルを（取得し直さずに）IDで直接削除して、新しいパネルを送ります。"""
+        data = self.panel_data.get(str(channel.id))
+        if data and "last_msg_id" in data:
+            try:
+                await channel.get_partial_message(data["last_msg_id"]).delete()
+            except discord.HTTPException: pass
+        await self.send_proper_panel(channel, is_anon, p_type)
+
     async def send_proper_panel(self, channel, is_anon, p_type):
         title = f"🎭 {'匿名' if is_anon else '代理投稿'}{'画像掲示板' if p_type == 'image' else '雑談'}"
         embed = discord.Embed(title=title, description="ご主人様、こちらからお手紙をお送りくださいませ。", color=0x3498db if p_type == "image" else 0x2ecc71)
@@ -148,29 +242,38 @@ class Anonymous(commands.Cog):
     async def s_a_t(self, interaction: discord.Interaction):
         await self.send_proper_panel(interaction.channel, True, "text")
         await interaction.response.send_message("匿名テキストパネルを設置しましたわ。", ephemeral=True)
+        await self.warm_webhook(interaction.channel)
 
     @app_commands.command(name="setup_proxy_text")
     @app_commands.checks.has_permissions(administrator=True)
     async def s_p_t(self, interaction: discord.Interaction):
         await self.send_proper_panel(interaction.channel, False, "text")
         await interaction.response.send_message("代理投稿パネルを設置しましたわ。", ephemeral=True)
+        await self.warm_webhook(interaction.channel)
 
     @app_commands.command(name="setup_anon_image")
     @app_commands.checks.has_permissions(administrator=True)
     async def s_a_i(self, interaction: discord.Interaction):
         await self.send_proper_panel(interaction.channel, True, "image")
         await interaction.response.send_message("匿名画像パネルを設置しましたわ。", ephemeral=True)
+        await self.warm_webhook(interaction.channel)
 
     @app_commands.command(name="setup_proxy_image")
     @app_commands.checks.has_permissions(administrator=True)
     async def s_p_i(self, interaction: discord.Interaction):
         await self.send_proper_panel(interaction.channel, False, "image")
         await interaction.response.send_message("代理投稿画像パネルを設置しましたわ。", ephemeral=True)
+        await self.warm_webhook(interaction.channel)
 
     @app_commands.command(name="post_log")
     @app_commands.checks.has_permissions(administrator=True)
     async def show_log(self, interaction: discord.Interaction, post_id: str):
-        user = self.logs.get(post_id, "不明なIDですわ。")
+        record = await asyncio.to_thread(self.audit.get, post_id) if post_id.isdigit() else None
+        if record:
+            posted_at = datetime.datetime.fromtimestamp(record["ts"]).strftime("%Y-%m-%d %H:%M")
+            user = f"{record['user']} ({record['user_id']}) [{record['mode']}] / {posted_at}"
+        else:
+            user = "不明なIDですわ。"
         await interaction.response.send_message(f"ID: {post_id} の投稿者は {user} ですわ。", ephemeral=True)
 
 async def setup(bot):
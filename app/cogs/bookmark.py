@@ -6,6 +6,69 @@ import random
 from datetime import datetime
 import config
 import utils
+import storage
+
+PAGE_SIZE = 15
+# 埋め込みの本文は 4096 文字まで。1ページ15行が必ず収まるよう、1行あたりの長さを決めておく
+MAX_DESCRIPTION_LENGTH = 3500
+MAX_LINE_LENGTH = MAX_DESCRIPTION_LENGTH // PAGE_SIZE
+MAX_TITLE_LENGTH = 80
+
+def format_bookmark(bm):
+    title = bm['title'] if len(bm['title']) <= MAX_TITLE_LENGTH else bm['title'][:MAX_TITLE_LENGTH - 1] + "…"
+    if bm.get('url'):
+        line = f"**[{bm['index']}] [{title}]({bm['url']})**"
+        # URL が長すぎるときはリンクを諦めてタイトルだけ（URL は途中で切ると壊れる）
+        if len(line) <= MAX_LINE_LENGTH: return line
+    return f"**[{bm['index']}] {title}**"
+
+# --- ページ送り付き一覧 ---
+class BookmarkPageView(discord.ui.View):
+    def __init__(self, user, total):
+        super().__init__(timeout=300)
+        self.user, self.total, self.page = user, total, 0
+        self.pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.user.id:
+            await interaction.response.send_message("ちょっと！それは他人のリストよ！😠", ephemeral=True)
+            return False
+        return True
+
+    async def render(self):
+        """表示中のページの分だけDBから読み込んで埋め込みを作ります。"""
+        items = await storage.get_store().list_bookmarks_page(self.user.id, self.page * PAGE_SIZE, PAGE_SIZE)
+        embed = discord.Embed(title=f"📚 {self.user.display_name} のブックマーク", color=discord.Color.magenta())
+        embed.description = "\n".join(format_bookmark(bm) for bm in items) or "（このページは空よ）"
+        embed.set_footer(text=f"{self.page + 1} / {self.pages} ページ ・ 全{self.total}件")
+        self.prev_btn.disabled = self.page == 0
+        self.next_btn.disabled = self.page >= self.pages - 1
+        self.page_btn.label = f"{self.page + 1} / {self.pages}"
+        return embed
+
+    async def show(self, interaction: discord.Interaction, page):
+        self.page = max(0, min(page, self.pages - 1))
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+    @discord.ui.button(emoji="⏮️", style=discord.ButtonStyle.secondary)
+    async def first_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, 0)
+
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.primary)
+    async def prev_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.page - 1)
+
+    @discord.ui.button(label="1 / 1", style=discord.ButtonStyle.secondary, disabled=True)
+    async def page_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        pass
+
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.primary)
+    async def next_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.page + 1)
+
+    @discord.ui.button(emoji="⏭️", style=discord.ButtonStyle.secondary)
+    async def last_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.pages - 1)
 
 class BookmarkGroup(app_commands.Group):
     def __init__(self):
@@ -18,6 +81,12 @@ class BookmarkGroup(app_commands.Group):
             return
         await interaction.response.defer(ephemeral=False)
 
+        # 重複チェックは (ユーザー, URL) のユニーク索引で一発。タイトル取得より先に済ませる
+        store = storage.get_store()
+        if url and await store.has_bookmark_url(interaction.user.id, url):
+            await interaction.followup.send("そのURLはもう保存してるじゃない！😠")
+            return
+
         fetched = False
         if url and not title:
             found = await utils.fetch_url_title(url)
@@ -28,17 +97,11 @@ class BookmarkGroup(app_commands.Group):
                 title = "（タイトルなし）"
         if not title and url: title = url
 
-        data = utils.load_json(config.BOOKMARK_FILE)
-        uid = str(interaction.user.id)
-        if uid not in data: data[uid] = []
-
-        if url and any(bm.get('url') == url for bm in data[uid]):
+        added = await store.add_bookmark(interaction.user.id, title, url, datetime.now().strftime("%Y-%m-%d %H:%M"))
+        if not added:
             await interaction.followup.send("そのURLはもう保存してるじゃない！😠")
             return
 
-        data[uid].append({"title": title, "url": url, "date": datetime.now().strftime("%Y-%m-%d %H:%M")})
-        utils.save_json(config.BOOKMARK_FILE, data)
-
         msg = random.choice(config.NAO_ADD_MESSAGES)
         if fetched: msg += "\n(わざわざタイトルまで調べてあげたんだからね！)"
         
@@ -51,33 +114,33 @@ class BookmarkGroup(app_commands.Group):
 
     @app_commands.command(name="list", description="一覧を表示")
     async def bookmark_list(self, interaction: discord.Interaction):
-        data = utils.load_json(config.BOOKMARK_FILE)
-        bookmarks = data.get(str(interaction.user.id), [])
-        if not bookmarks:
+        total = await storage.get_store().count_bookmarks(interaction.user.id)
+        if not total:
             await interaction.response.send_message("まだ何も保存してないじゃない。……私の出番、ないわけ？😠", ephemeral=False)
             return
 
         msg = random.choice(config.NAO_LIST_MESSAGES)
-        embed = discord.Embed(title=f"📚 {interaction.user.display_name} のブックマーク", color=discord.Color.magenta())
-        text = ""
-        for i, bm in enumerate(bookmarks):
-            line = f"**[{i+1}] [{bm['title']}]({bm.get('url')})**" if bm.get('url') else f"**[{i+1}] {bm['title']}**"
-            if len(text) + len(line) > 3500:
-                text += "\n...(省略)"
-                break
-            text += line + "\n"
-        embed.description = text
-        await interaction.response.send_message(content=msg, embed=embed)
+        view = BookmarkPageView(interaction.user, total)
+        await interaction.response.send_message(content=msg, embed=await view.render(), view=view)
+
+    @app_commands.command(name="search", description="タイトルで検索")
+    @app_commands.describe(query="タイトルの一部（前方一致が先に出ます）")
+    # 検索語は埋め込みのタイトル（256文字まで）にも入るので、長さは Discord 側で制限する
+    async def bookmark_search(self, interaction: discord.Interaction, query: app_commands.Range[str, 1, 100]):
+        results = await storage.get_store().search_bookmarks(interaction.user.id, query, PAGE_SIZE)
+        if not results:
+            await interaction.response.send_message(f"「{query}」なんて保存してないわよ？🤔", ephemeral=True)
+            return
+        embed = discord.Embed(title=f"🔍 「{query}」の検索結果", color=discord.Color.magenta())
+        embed.description = "\n".join(format_bookmark(bm) for bm in results)
+        embed.set_footer(text="担当: メイドなお ・ 番号は /bm delete で使えるわ")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @app_commands.command(name="delete", description="削除")
     async def bookmark_delete(self, interaction: discord.Interaction, index: int):
-        data = utils.load_json(config.BOOKMARK_FILE)
-        uid = str(interaction.user.id)
-        bookmarks = data.get(uid, [])
+        removed = await storage.get_store().delete_bookmark(interaction.user.id, index-1)
         
-        if 0 <= index-1 < len(bookmarks):
-            removed = bookmarks.pop(index-1)
-            utils.save_json(config.BOOKMARK_FILE, data)
+        if removed:
             msg = random.choice(config.NAO_DELETE_MESSAGES)
             await interaction.response.send_message(f"{msg}\n(削除: **{removed['title']}**)", ephemeral=False)
         else:
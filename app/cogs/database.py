@@ -2,11 +2,12 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import json
-import os
 import asyncio
 import time
 import re
+import config_store
+import storage
+import search_index
 
 CONFIG_FILE = "db_config.json"
 
@@ -15,11 +16,12 @@ CONFIG_FILE = "db_config.json"
 LOG_CHANNEL_ID = 0 
 
 def load_config():
-    if not os.path.exists(CONFIG_FILE): return {}
-    with open(CONFIG_FILE, "r", encoding="utf-8") as f: return json.load(f)
+    # メモリ上の共有設定を返すだけなのでディスクには触れません
+    return config_store.get_config(CONFIG_FILE).data
 
 def save_config(config):
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f: json.dump(config, f, indent=4, ensure_ascii=False)
+    # 書き込みは config_store がまとめて後から行います
+    config_store.get_config(CONFIG_FILE).save()
 
 async def send_log(bot, guild_id, config, message, user=None):
     target_id = LOG_CHANNEL_ID
@@ -35,6 +37,98 @@ async def send_log(bot, guild_id, config, message, user=None):
             embed.set_footer(text=f"発生時刻: {time.strftime('%Y-%m-%d %H:%M:%S')}")
             await channel.send(embed=embed)
 
+# --- コレクション本文の組み立て・索引 ---
+SEPARATOR = "━━━━━━━━━━━━━━━━━━━━━━"
+COLLECTION_COLOR = discord.Color.from_rgb(44, 47, 51)
+MAX_ENTRIES_PER_MESSAGE = 10
+MAX_DESCRIPTION_LENGTH = 3500
+
+# 同じチャンネルへの同時登録で本文を上書きし合わないためのロック
+_channel_locks = {}
+
+def channel_lock(channel_id):
+    return _channel_locks.setdefault(channel_id, asyncio.Lock())
+
+def shorten(text, limit):
+    text = str(text)
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def collection_embed(media, description):
+    return discord.Embed(title=f"📚 {media} コレクション", description=description, color=COLLECTION_COLOR)
+
+def append_entry_text(desc, header_text, entry_text):
+    if header_text in desc:
+        # 既存の種別ブロックの末尾に追加
+        pattern = re.escape(header_text) + r"(.*?)(\n\n📂 \*\*【|$)"
+        def replacer(match):
+            return f"{header_text}{match.group(1)}\n{entry_text}{match.group(2)}"
+        return re.sub(pattern, replacer, desc, count=1, flags=re.DOTALL)
+    # 新しい種別として一番下に追加
+    return desc.strip() + f"\n\n{header_text}\n{entry_text}"
+
+def remove_entry_text(desc, title):
+    # 1件分のブロックを削除する正規表現
+    pattern = r"> 🔖 \*\*" + re.escape(title) + r"\*\*.*?" + re.escape(SEPARATOR) + r"\n?"
+    new_desc = re.sub(pattern, "", desc, count=1, flags=re.DOTALL)
+    # 空になった見出し（カテゴリ）が残っていたら消す
+    new_desc = re.sub(r"(📂 \*\*【[^】]+】\*\*)\n+(?=\n📂|$)", "", new_desc, flags=re.DOTALL)
+    return new_desc.strip()
+
+HEADER_RE = re.compile(r"^📂 \*\*【 (.+?) 】\*\*$")
+TITLE_RE = re.compile(r"^> 🔖 \*\*(.+)\*\*$")
+AUTHOR_RE = re.compile(r"^> └ 👤 \*\*作者\*\*: (.*) ｜ ⭐ \*\*評価\*\*: (.*)$")
+GENRE_RE = re.compile(r"^> └ 🏷️ \*\*ジャンル\*\*: (.*) ｜ 💭 \*\*特徴\*\*: (.*)$")
+MEDIA_TITLE_RE = re.compile(r"📚 (.+?) コレクション")
+
+def parse_collection(desc):
+    """コレクション本文からエントリ（タイトル・種別・作者など）を取り出します。"""
+    entries, sub_type, current = [], "未指定", None
+    for line in (desc or "").splitlines():
+        line = line.strip()
+        if m := HEADER_RE.match(line):
+            sub_type = m.group(1)
+        elif m := TITLE_RE.match(line):
+            current = {"title": m.group(1), "sub_type": sub_type, "author": None, "rating": None, "genre": None, "tags": []}
+            entries.append(current)
+        elif current and (m := AUTHOR_RE.match(line)):
+            current["author"], current["rating"] = m.group(1), m.group(2)
+        elif current and (m := GENRE_RE.match(line)):
+            current["genre"] = m.group(1)
+            current["tags"] = re.findall(r"`([^`]+)`", m.group(2))
+    return entries
+
+async def rebuild_channel_index(bot, channel):
+    """チャンネル履歴を全部読み、エントリ→メッセージの索引を作り直します。"""
+    messages, per_message = [], []
+    async for msg in channel.history(limit=None):
+        if msg.author != bot.user or not msg.embeds: continue
+        embed = msg.embeds[0]
+        m = MEDIA_TITLE_RE.search(embed.title or "")
+        if not m: continue
+        desc = embed.description or ""
+        row = {"message_id": msg.id, "guild_id": channel.guild.id, "channel_id": channel.id, "media": m.group(1),
+               "description": desc, "entry_count": desc.count("🔖")}
+        messages.append(row)
+        entries = parse_collection(desc)
+        for entry in entries:
+            entry.update({"guild_id": channel.guild.id, "channel_id": channel.id, "media": row["media"], "message_id": msg.id})
+        per_message.append(entries)
+    # 履歴は新しい順に来るので、メッセージの順だけ古い順に戻す（1通の中のエントリは本文の順のまま）
+    messages.reverse(); per_message.reverse()
+    entries = [entry for message_entries in per_message for entry in message_entries]
+    store = storage.get_store()
+    await store.replace_media_channel(channel.id, messages, entries)
+    index = search_index.get_index()
+    index.remove_channel(channel.id)
+    for entry in await store.list_media_entries(channel.id):
+        index.add(entry)
+    print(f"[DB Index] #{channel.name}: {len(messages)} messages / {len(entries)} entries")
+    return len(entries)
+
+async def ensure_channel_index(bot, channel):
+    if not await storage.get_store().is_media_channel_indexed(channel.id):
+        await rebuild_channel_index(bot, channel)
+
 # --- 作品登録モーダル ---
 class WorkRegistrationModal(discord.ui.Modal, title='作品登録'):
     title_input = discord.ui.TextInput(label='タイトル', placeholder='作品名を入力...', required=True)
@@ -52,9 +146,12 @@ class WorkRegistrationModal(discord.ui.Modal, title='作品登録'):
         blacklist = guild_config.get("NGユーザー", [])
 
         if interaction.user.id in blacklist:
-            await send_log(self.bot, interaction.guild_id, self.config, f"🚫 **投稿拒否 (NGユーザー)**\n内容: {self.title_input.value}", user=interaction.user)
-            return await interaction.response.send_message("⚠️ 投稿権限がありません（NG設定されています）。", ephemeral=True)
-        
+            await interaction.response.send_message("⚠️ 投稿権限がありません（NG設定されています）。", ephemeral=True)
+            return await send_log(self.bot, interaction.guild_id, self.config, f"🚫 **投稿拒否 (NGユーザー)**\n内容: {self.title_input.value}", user=interaction.user)
+
+        # ロック待ちや初回の索引作り（履歴を全部読む）は3秒を超えうるので、先に応答しておく
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
         # 投稿内容の作成
         author_text = self.author_input.value or '不明'
         tags_text = " ".join([f"`{t}`" for t in self.tags]) if self.tags else "タグなし"
@@ -67,52 +164,47 @@ class WorkRegistrationModal(discord.ui.Modal, title='作品登録'):
         )
         
         header_text = f"📂 **【 {self.sub_type} 】**"
-
-        target_msg = None
-        
-        # 最新のボットメッセージを確認
-        async for msg in self.target_channel.history(limit=20):
-            if msg.author == self.bot.user and msg.embeds:
-                embed = msg.embeds[0]
-                desc = embed.description or ""
-                
-                # 「コレクション」というタイトルの埋め込みのみ対象
-                if "コレクション" in (embed.title or ""):
-                    # 10件埋まっているか、文字数限界なら新規作成へ
-                    if desc.count("🔖") >= 10 or len(desc) > 3500:
-                        target_msg = None 
-                    else:
-                        target_msg = msg
-                    break
-
-        if target_msg:
-            # 追記処理
-            embed = target_msg.embeds[0]
-            desc = embed.description
-
-            if header_text in desc:
-                # 既存の種別ブロックの末尾に追加
-                pattern = re.escape(header_text) + r"(.*?)(\n\n📂 \*\*【|$)"
-                def replacer(match):
-                    return f"{header_text}{match.group(1)}\n{entry_text}{match.group(2)}"
-                new_desc = re.sub(pattern, replacer, desc, count=1, flags=re.DOTALL)
-                embed.description = new_desc
-            else:
-                # 新しい種別として一番下に追加
-                embed.description = desc.strip() + f"\n\n{header_text}\n{entry_text}"
-            
-            await target_msg.edit(embed=embed)
-        else:
-            # 新規メッセージ作成
-            embed = discord.Embed(
-                title=f"📚 {self.media_type} コレクション", 
-                description=f"{header_text}\n{entry_text}", 
-                color=discord.Color.from_rgb(44, 47, 51)
+        store = storage.get_store()
+        channel = self.target_channel
+
+        async with channel_lock(channel.id):
+            await ensure_channel_index(self.bot, channel)
+            # 索引から追記先（最新のコレクション）を引く。10件埋まっているか、文字数限界なら新規作成へ
+            target = await store.get_open_media_message(channel.id)
+            if target and (target["entry_count"] >= MAX_ENTRIES_PER_MESSAGE or len(target["description"]) > MAX_DESCRIPTION_LENGTH):
+                target = None
+
+            message_id = None
+            if target:
+                # 追記処理（取得し直さず、索引の本文から組み立てて1回だけ編集）
+                new_desc = append_entry_text(target["description"], header_text, entry_text)
+                try:
+                    await channel.get_partial_message(target["message_id"]).edit(embed=collection_embed(target["media"], new_desc))
+                    message_id = target["message_id"]
+                except discord.NotFound:
+                    # 手動で消されていたら索引から外して新規作成へ
+                    await store.drop_media_message(target["message_id"])
+                    search_index.get_index().remove_message(target["message_id"])
+
+            if message_id is None:
+                # 新規メッセージ作成
+                new_desc = f"{header_text}\n{entry_text}"
+                msg = await channel.send(embed=collection_embed(self.media_type, new_desc))
+                message_id = msg.id
+                target = {"media": self.media_type}
+
+            entry = {"guild_id": interaction.guild_id, "channel_id": channel.id, "media": target["media"], "title": self.title_input.value,
+                     "message_id": message_id, "sub_type": self.sub_type, "author": author_text, "rating": self.rating,
+                     "genre": self.genre, "tags": list(self.tags)}
+            entry["id"] = await store.save_media_append(
+                {"message_id": message_id, "guild_id": interaction.guild_id, "channel_id": channel.id,
+                 "media": target["media"], "description": new_desc, "entry_count": new_desc.count("🔖")},
+                entry
             )
-            await self.target_channel.send(embed=embed)
+            search_index.get_index().add(entry)
 
+        await interaction.followup.send(f"✅ 「{self.title_input.value}」をデータベースに追加しました！", ephemeral=True)
         await send_log(self.bot, interaction.guild_id, self.config, f"✅ **作品登録**\nタイトル: {self.title_input.value}\nユーザー: {interaction.user.display_name}", user=interaction.user)
-        await interaction.response.send_message(f"✅ 「{self.title_input.value}」をデータベースに追加しました！", ephemeral=True)
 
 # --- 評価タグ選択View ---
 class TagSelectView(discord.ui.View):
@@ -303,10 +395,70 @@ class RegistrationView(discord.ui.View):
     async def movie_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
         await self.start_registration(interaction, "映画")
 
+RATING_CHOICES = [
+    app_commands.Choice(name="🏆 殿堂入り", value="👑 殿堂入り"),
+    app_commands.Choice(name="⭐⭐⭐⭐⭐", value="⭐⭐⭐⭐⭐"),
+    app_commands.Choice(name="⭐⭐⭐⭐", value="⭐⭐⭐⭐"),
+    app_commands.Choice(name="⭐⭐⭐", value="⭐⭐⭐"),
+    app_commands.Choice(name="⭐⭐", value="⭐⭐"),
+    app_commands.Choice(name="⭐", value="⭐"),
+    app_commands.Choice(name="🚫 閲覧注意", value="🚫 閲覧注意"),
+]
+
 class DatabaseCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def cog_load(self):
+        # 検索用インデックスを保存済みの索引から作る（件数が多くてもループを止めないようスレッドで）
+        entries = await storage.get_store().list_media_entries()
+        index = await asyncio.to_thread(search_index.build_index, entries)
+        print(f"[DB Search] Indexed {len(index)} entries")
+
+    @app_commands.command(name="db_search", description="登録された作品を検索します")
+    @app_commands.describe(query="タイトル・作者・ジャンル・タグなどのキーワード", media="媒体で絞り込み", rating="満足度で絞り込み", tag="タグで絞り込み")
+    @app_commands.choices(media=[
+        app_commands.Choice(name="小説", value="小説"), app_commands.Choice(name="漫画", value="漫画"),
+        app_commands.Choice(name="アニメ", value="アニメ"), app_commands.Choice(name="映画", value="映画"),
+    ], rating=RATING_CHOICES)
+    async def db_search(self, interaction: discord.Interaction, query: str = "", media: app_commands.Choice[str] = None,
+                        rating: app_commands.Choice[str] = None, tag: str = None):
+        if not query.strip() and not (media or rating or tag):
+            return await interaction.response.send_message("🔍 キーワードか絞り込み条件を指定してください。", ephemeral=True)
+
+        started = time.perf_counter()
+        results = search_index.get_index().search(
+            interaction.guild_id, query,
+            media=media.value if media else None, rating=rating.value if rating else None, tag=tag
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if not results:
+            return await interaction.response.send_message("❌ 条件に合う作品が見つかりませんでした。", ephemeral=True)
+
+        # 埋め込みの本文は 4096 文字まで。長い項目は切り詰め、入りきらない分は表示しない
+        lines, length = [], 0
+        for _, doc in results:
+            link = f"https://discord.com/channels/{doc['guild_id']}/{doc['channel_id']}/{doc['message_id']}"
+            tags_text = " ".join(f"`{t}`" for t in doc["tags"]) or "タグなし"
+            line = (
+                f"🔖 **[{shorten(doc['title'], 100)}]({link})**\n"
+                f"└ {doc['media']} ＞ {doc['sub_type']} ＞ {doc['genre']} ｜ 👤 {shorten(doc['author'] or '不明', 50)} ｜ ⭐ {doc['rating']}\n"
+                f"└ {shorten(tags_text, 200)}"
+            )
+            if lines and length + len(line) + 2 > MAX_DESCRIPTION_LENGTH: break
+            lines.append(line)
+            length += len(line) + 2
+        embed = discord.Embed(title=f"🔍 検索結果: {shorten(query, 200) or '絞り込み'}", description="\n\n".join(lines), color=COLLECTION_COLOR)
+        embed.set_footer(text=f"{len(lines)}件表示 ・ {elapsed_ms:.1f}ms")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @db_search.autocomplete("tag")
+    async def db_search_tag_autocomplete(self, interaction: discord.Interaction, current: str):
+        counts = search_index.get_index().tag_counts.get(interaction.guild_id, {})
+        tags = sorted((t for t in counts if current in t), key=lambda t: -counts[t])
+        return [app_commands.Choice(name=t, value=t) for t in tags[:25]]
+
     @app_commands.command(name="db_setup", description="保存先を設定します")
     @app_commands.choices(media=[
         app_commands.Choice(name="小説", value="小説"), app_commands.Choice(name="漫画", value="漫画"),
@@ -331,26 +483,31 @@ class DatabaseCog(commands.Cog):
     async def db_delete(self, interaction: discord.Interaction, channel: discord.TextChannel, title: str):
         # 削除は管理者のみ実行可能
         await interaction.response.defer(ephemeral=True)
+        store = storage.get_store()
         found = False
-        async for msg in channel.history(limit=50):
-            if msg.author == self.bot.user and msg.embeds:
-                desc = msg.embeds[0].description
-                if f"**{title}**" in desc:
-                    # 1件分のブロックを削除する正規表現
-                    pattern = r"> 🔖 \*\*" + re.escape(title) + r"\*\*.*?" + re.escape("━━━━━━━━━━━━━━━━━━━━━━") + r"\n?"
-                    new_desc = re.sub(pattern, "", desc, flags=re.DOTALL)
-                    
-                    # 空になった見出し（カテゴリ）が残っていたら消す
-                    new_desc = re.sub(r"(📂 \*\*【[^】]+】\*\*)\n+(?=\n📂|$)", "", new_desc, flags=re.DOTALL)
-                    new_desc = new_desc.strip()
-
-                    if not new_desc: 
-                        await msg.delete()
+        async with channel_lock(channel.id):
+            await ensure_channel_index(self.bot, channel)
+            # 索引でタイトル → メッセージを引き、1回の編集（または削除）で済ませる
+            entry = await store.find_media_entry(channel.id, title)
+            if entry:
+                new_desc = remove_entry_text(entry["description"], title)
+                partial = channel.get_partial_message(entry["message_id"])
+                try:
+                    if not new_desc:
+                        await partial.delete()
                     else:
-                        msg.embeds[0].description = new_desc
-                        await msg.edit(embed=msg.embeds[0])
-                    found = True
-                    break
+                        await partial.edit(embed=collection_embed(entry["media"], new_desc))
+                except discord.NotFound:
+                    new_desc = ""
+                await store.save_media_removal(entry["entry_id"], {
+                    "message_id": entry["message_id"], "guild_id": entry["guild_id"], "channel_id": entry["channel_id"],
+                    "media": entry["media"], "description": new_desc, "entry_count": new_desc.count("🔖")
+                })
+                index = search_index.get_index()
+                index.remove(entry["entry_id"])
+                if not new_desc:
+                    index.remove_message(entry["message_id"])
+                found = True
         
         if found:
             await send_log(self.bot, interaction.guild_id, load_config(), f"🗑️ **作品削除**\nタイトル: {title}", user=interaction.user)
@@ -358,6 +515,14 @@ class DatabaseCog(commands.Cog):
         else:
             await interaction.followup.send("❌ 指定されたタイトルの作品が見つかりませんでした。", ephemeral=True)
 
+    @app_commands.command(name="db_reindex", description="保存先チャンネルの索引を履歴から作り直します（管理者のみ）")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def db_reindex(self, interaction: discord.Interaction, channel: discord.TextChannel):
+        await interaction.response.defer(ephemeral=True)
+        async with channel_lock(channel.id):
+            count = await rebuild_channel_index(self.bot, channel)
+        await interaction.followup.send(f"✅ {channel.mention} の索引を作り直しました（{count}件）。", ephemeral=True)
+
     @app_commands.command(name="db_blacklist", description="NGユーザーを登録/解除します")
     @app_commands.checks.has_permissions(administrator=True)
     async def db_blacklist(self, interaction: discord.Interaction, user: discord.User):
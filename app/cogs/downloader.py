@@ -1,147 +1,301 @@
 # cogs/downloader.py
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
-import yt_dlp
 import os
-import uuid
 import time
 import random
 import asyncio
 import traceback
-from datetime import datetime
 import config
 import utils
+import ratelimit
+import dl_cache
+import dl_engine
+import progress
+import dl_probe
+import dl_batch
+import scratch
+import job_queue
+import url_matcher
+import metrics
+
+QUEUE_FULL_MESSAGES = {
+    "user": "今、あなたの分を準備中ですよ！終わるまで待ってくださいね💦",
+    "backlog": "順番待ちがいっぱいです…🙏 少し時間をおいて送り直してください",
+}
+
+def queue_full_text(reason, refunded=True):
+    text = QUEUE_FULL_MESSAGES[reason]
+    if refunded and reason == "backlog": text += "（連投制限はリセットしておきました）"
+    return text
+
+def queue_text(position, eta):
+    if position == 0 and eta == 0: return "受け付けました！すぐ取り掛かりますね📝"
+    return f"受け付けました！📝 順番待ち: **{position + 1}番目** （目安 約{int(eta)}秒）"
+
+class CancelView(discord.ui.View):
+    """順番待ち・実行中のジョブを依頼した本人だけが取り消せるボタン"""
+    def __init__(self, cog, job):
+        super().__init__(timeout=None)
+        self.cog = cog
+        self.job = job
+
+    @discord.ui.button(label="キャンセル", style=discord.ButtonStyle.secondary, emoji="✖️")
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != self.job.user_id:
+            await interaction.response.send_message("ご本人しか取り消せませんよ🙅‍♀️", ephemeral=True)
+            return
+        self.cog.queue.cancel(self.job)
+        await interaction.response.edit_message(content="キャンセルしました🗑️", view=None)
 
 class Downloader(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.user_last_download = {}
-        # 同時実行制限（サーバー全体の負荷を抑える）
-        self.download_semaphore = asyncio.Semaphore(2) 
-        # 重複実行防止用のセット
-        self.active_users = set()
-        # 最初の1つだけを捕まえるURLパターン
-        self.url_pattern = utils.re.compile(r'https?://(?:www\.)?(?:youtube\.com|youtu\.be|soundcloud\.com|bandcamp\.com|twitter\.com|x\.com|tiktok\.com|instagram\.com)[^\s]+')
-
-    async def process_download(self, ctx_or_interaction, url, file_format, quality_kbps):
+        # 連投制限（COOLDOWN_SECONDS 秒に1回）
+        self.dl_cooldown = ratelimit.cooldown(config.COOLDOWN_SECONDS)
+        # 完成ファイルのキャッシュ（同じURL・形式・音質ならすぐ返す）
+        self.cache = dl_cache.get_cache()
+        # yt-dlp を動かす子プロセスのプール
+        self.engine = dl_engine.get_engine()
+        self.probe_engine = dl_engine.get_engine("probe")
+        # 下見結果のキャッシュ（同じURLなら抽出をやり直さない）
+        self.probes = dl_probe.ProbeCache(ttl=config.DL_PROBE_TTL)
+        # ジョブごとの作業ディレクトリ（容量の予約つき）
+        self.scratch = scratch.get_area()
+        # 順番待ちキュー（同時実行数・1人あたりの件数・待ち件数の上限つき）
+        self.queue = job_queue.FairJobQueue(workers=config.DL_WORKERS, max_backlog=config.DL_QUEUE_MAX, max_per_user=config.DL_QUEUE_PER_USER)
+        metrics.DL_QUEUE_WAITING.set_function(self.queue.backlog)
+        metrics.DL_QUEUE_RUNNING.set_function(self.queue.running)
+        # 貼られたURLの判定（許可ドメインの集合で引く）
+        self.urls = url_matcher.UrlMatcher(config.DL_ALLOWED_DOMAINS)
+
+    async def cog_load(self):
+        # 前回落ちたときの取り残しは全部消してから始める（DOWNLOAD_DIR なら以前の版の直置きファイルも）
+        removed, freed = await asyncio.to_thread(self.scratch.sweep, 0, True)
+        if removed: print(f"[Scratch] Removed {removed} leftovers ({freed / 1024 / 1024:.1f}MB)")
+        self.sweep_scratch.start()
+        self.queue.start()
+        # 子プロセスは裏で先に立ち上げて温めておく
+        asyncio.create_task(self.engine.prestart())
+        asyncio.create_task(self.probe_engine.prestart())
+        if config.DL_DOMAINS_FROM_EXTRACTORS:
+            asyncio.create_task(self.load_extractor_domains())
+
+    async def cog_unload(self):
+        self.sweep_scratch.cancel()
+        await self.queue.stop()
+
+    async def load_extractor_domains(self):
+        try:
+            domains = await self.probe_engine.run("domains")
+        except dl_engine.EngineError as e:
+            print(f"[URL] Could not load extractor domains: {e}")
+            return
+        self.urls.add_domains(domains)
+        print(f"[URL] {len(self.urls.domains)} domains allowed")
+
+    @tasks.loop(minutes=30)
+    async def sweep_scratch(self):
+        removed, freed = await asyncio.to_thread(self.scratch.sweep)
+        if removed: print(f"[Scratch] Swept {removed} orphans ({freed / 1024 / 1024:.1f}MB)")
+
+    async def process_download(self, ctx_or_interaction, url, file_format, quality_kbps, refund=True):
+        """refund: 受付できなかったときにクールダウンを返すか（1通に複数URLがあるときは最初の1件だけ）"""
         is_interaction = isinstance(ctx_or_interaction, discord.Interaction)
         user = ctx_or_interaction.user if is_interaction else ctx_or_interaction.author
         user_id = user.id
 
-        # 重複実行チェック（一人が同時に複数は不可）
-        if user_id in self.active_users:
-            msg = "今、あなたの分を準備中ですよ！終わるまで待ってくださいね💦"
+        # キャッシュにあれば順番待ちもせず、そのまま送る
+        cached = self.cache.get(url, file_format, quality_kbps)
+        if cached:
+            fp, display_filename, size = cached
+            metrics.DOWNLOADS.inc(result="cached")
+            res = f"はい、どうぞ！🎁✨\n⚡ `cached` / `{(size/1024/1024):.1f}MB`"
+            file = discord.File(fp, filename=display_filename)
+            try:
+                # /dl は defer 済みなので followup で返す（返さないと「考え中…」のまま失敗する）
+                if is_interaction: await ctx_or_interaction.followup.send(res, file=file, view=utils.PraiseView())
+                else: await ctx_or_interaction.channel.send(res, file=file, view=utils.PraiseView())
+            finally:
+                # File() は渡したファイルを閉じないので自分で
+                file.close()
+                fp.close()
+            return
+
+        # 受付できない場合は、クールダウンを返してから理由を伝える（送り直しの連打を防ぐ）
+        cooldown_key = ("dl", user_id, ctx_or_interaction.guild.id if ctx_or_interaction.guild else None)
+        reason = self.queue.check(user_id)
+        if reason:
+            metrics.DOWNLOADS.inc(result="rejected")
+            if refund: self.dl_cooldown.reset(cooldown_key)
+            msg = queue_full_text(reason, refund)
             if is_interaction: await ctx_or_interaction.followup.send(msg, ephemeral=True)
+            else: await ctx_or_interaction.channel.send(msg, delete_after=10)
+            return
+
+        # 並ぶ前に下見して、上限に収まる音質・解像度を決める。どうやっても入らないものはここで断る（これもクールダウンは返す）
+        probe = await self.probe(url, file_format)
+        plan = dl_probe.plan_download(probe, file_format, quality_kbps, config.MAX_FILE_SIZE)
+        if plan is None:
+            metrics.DOWNLOADS.inc(result="too_large")
+            if refund: self.dl_cooldown.reset(cooldown_key)
+            size_estimate = dl_probe.estimate_size(probe, file_format, quality_kbps) or 0
+            msg = f"長すぎてどうやっても上限に収まらなさそうです…😭 (見込み {(size_estimate/1024/1024):.1f}MB / 上限 {(config.MAX_FILE_SIZE/1024/1024):.0f}MB)\n短いものでお願いします🙏"
+            if is_interaction: await ctx_or_interaction.followup.send(msg, ephemeral=True)
+            else: await ctx_or_interaction.channel.send(msg, delete_after=15)
             return
 
-        # サーバー全体の同時実行数チェック
-        if self.download_semaphore.locked():
-            msg = "今、他の方のファイルを準備しています。少し待ってから送り直してください🙏"
+        # 作業領域には 元ファイル + 出力 の分を予約する（見積もれなければ元ファイルの上限）
+        reserve = ((probe or {}).get("source_bytes") or config.DL_MAX_SOURCE_SIZE) + config.MAX_FILE_SIZE
+        await self.enqueue(ctx_or_interaction, user_id, lambda job: self.run_download(job, ctx_or_interaction, url, file_format, quality_kbps, plan, reserve),
+                           cooldown_key if refund else None)
+
+    async def enqueue(self, ctx_or_interaction, user_id, run, cooldown_key=None):
+        """
+        ジョブを積んでから状況メッセージ（順番待ち → 開始 → 結果 を1通で編集していく）を出します。
+        下見の間に埋まって受付できなかったら、cooldown_key のクールダウンを返して断ります。
+        """
+        is_interaction = isinstance(ctx_or_interaction, discord.Interaction)
+        posted = asyncio.Event()
+
+        async def run_when_posted(job):
+            # すぐ順番が来ても、状況メッセージが出るまでは始めない
+            await posted.wait()
+            await run(job)
+
+        job = job_queue.Job(user_id, run_when_posted, on_position=self.show_position)
+        job.status_msg = None
+        try:
+            position = self.queue.submit(job)
+        except job_queue.QueueFull as e:
+            metrics.DOWNLOADS.inc(result="rejected")
+            if cooldown_key: self.dl_cooldown.reset(cooldown_key)
+            msg = queue_full_text(e.reason, cooldown_key is not None)
             if is_interaction: await ctx_or_interaction.followup.send(msg, ephemeral=True)
             else: await ctx_or_interaction.channel.send(msg, delete_after=10)
             return
 
-        async with self.download_semaphore:
-            self.active_users.add(user_id)
-            status_msg = None
+        text = queue_text(position, self.queue.eta(position))
+        view = CancelView(self, job)
+        try:
+            if is_interaction:
+                job.status_msg = await ctx_or_interaction.followup.send(text, view=view)
+            else:
+                job.status_msg = await ctx_or_interaction.channel.send(text, view=view)
+        except BaseException:
+            # 状況メッセージを出せなかったジョブは取り下げる
+            self.queue.cancel(job)
+            raise
+        finally:
+            posted.set()
+        # 送っている間に待ち順が変わっていたら直す
+        if job.position != position:
+            await self.show_position(job, job.position, self.queue.eta(job.position))
+
+    async def probe(self, url, file_format):
+        """下見結果を返します（キャッシュ優先）。取れなかったら None"""
+        probe = self.probes.get(url, file_format)
+        if probe is None:
+            try:
+                probe = await self.probe_engine.run("probe", url, file_format)
+            except dl_engine.EngineError as e:
+                # 下見できないサイトもあるので、その場合は本番のダウンロードに任せる
+                print(f"[Downloader] Probe failed: {e}")
+                return None
+            self.probes.put(url, file_format, probe)
+        return probe
+
+    async def show_position(self, job, position, eta):
+        if job.status_msg is None: return
+        if job.task is None and not job.cancelled:
+            await job.status_msg.edit(content=queue_text(position, eta))
+
+    async def run_download(self, job, ctx_or_interaction, url, file_format, quality_kbps, plan, reserve):
+        is_interaction = isinstance(ctx_or_interaction, discord.Interaction)
+        status_msg = job.status_msg
+        work = None
+        try:
+            # 開始メッセージの送信
+            start_msg = random.choice(config.DL_START_MESSAGES)
+            if file_format == "mp4":
+                start_msg = "動画ですね！了解です。1つだけ取ってきます🏃‍♀️💨"
             
+            fit_quality, max_height = plan
+            if fit_quality != quality_kbps:
+                start_msg += f"\n（上限に収まるよう {fit_quality}kbps にしますね）"
+            elif max_height:
+                start_msg += f"\n（上限に収まるよう {max_height}p にしますね）"
+            await status_msg.edit(content=start_msg)
+
+            start_time = time.time()
+            # 作業ディレクトリを確保（ディスクが埋まっているときは空くまで待つ）
+            work = await self.scratch.acquire(reserve)
+            # 実際の処理は別プロセスのエンジンで（時間切れ・キャンセル時は子プロセスごと止まる）
+            # 途中経過は間引いて状況メッセージに反映
+            editor = progress.ThrottledEditor(status_msg, config.DL_PROGRESS_INTERVAL)
+            on_event = lambda ev: editor.update(f"{start_msg}\n{progress.format_progress(ev)}")
             try:
-                # 開始メッセージの送信
-                start_msg = random.choice(config.DL_START_MESSAGES)
-                if file_format == "mp4":
-                    start_msg = "動画ですね！了解です。1つだけ取ってきます🏃‍♀️💨"
-                
-                if is_interaction:
-                    status_msg = await ctx_or_interaction.followup.send(start_msg)
-                else:
-                    status_msg = await ctx_or_interaction.channel.send(start_msg)
-
-                start_time = time.time()
-                unique_id = str(uuid.uuid4())
-                save_path_tmpl = os.path.join(config.DOWNLOAD_DIR, f"{unique_id}_%(title)s.%(ext)s")
-
-                # 強力な単一ファイル制限オプション
-                ydl_opts = {
-                    'outtmpl': save_path_tmpl,
-                    'writethumbnail': True,
-                    'nocheckcertificate': True,
-                    'quiet': True,
-                    'max_filesize': config.MAX_FILE_SIZE,
-                    'extractor_args': {'youtube': {'player_client': ['default']}},
-                    # --- 複数ファイル・プレイリスト対策 ---
-                    'noplaylist': True,            # プレイリスト全体を無視
-                    'playlist_items': '1',         # 最初の1項目のみ指定
-                    'ignoreerrors': False,         # 1つ失敗したら即終了（次を探さない）
-                    'no_entries': False,
-                    # ------------------------------------
-                }
-
-                if file_format == "mp4":
-                    ydl_opts.update({
-                        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-                        'merge_output_format': 'mp4',
-                        'postprocessors': [{'key': 'EmbedThumbnail'}, {'key': 'FFmpegMetadata'}],
-                    })
-                else:
-                    pp = [{'key': 'FFmpegExtractAudio', 'preferredcodec': file_format}, {'key': 'EmbedThumbnail'}, {'key': 'FFmpegMetadata'}]
-                    if quality_kbps != "0": pp[0]['preferredquality'] = quality_kbps
-                    ydl_opts.update({'format': 'bestaudio/best', 'postprocessors': pp})
-
-                loop = asyncio.get_event_loop()
-                def run_dl():
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        # 情報を抽出（download=Trueで実処理）
-                        info = ydl.extract_info(url, download=True)
-                        
-                        # プレイリスト形式でデータが返ってきた場合でも最初の1つだけを参照
-                        if 'entries' in info:
-                            target_data = info['entries'][0]
-                        else:
-                            target_data = info
-
-                        raw_fname = ydl.prepare_filename(target_data)
-                        base, _ = os.path.splitext(raw_fname)
-                        final_path = f"{base}.{file_format}"
-                        
-                        # メタデータ処理
-                        raw_title = target_data.get('title', 'Unknown')
-                        clean_title = utils.sanitize_filename(raw_title)
-                        display_name = f"{clean_title}.{file_format}"
-                        
-                        meta = {"title": raw_title, "artist": target_data.get('uploader'), "album": raw_title}
-                        if os.path.exists(final_path):
-                            utils.save_metadata_to_file(final_path, meta)
-                        
-                        return final_path, display_name
-
-                file_path, display_filename = await loop.run_in_executor(None, run_dl)
-                elapsed = time.time() - start_time
-
-                # ファイル送信と後片付け
-                if os.path.exists(file_path):
-                    size = os.path.getsize(file_path)
-                    if size > config.MAX_FILE_SIZE:
-                        err = f"サイズオーバーです！😭 ({(size/1024/1024):.1f}MB)"
-                        if is_interaction: await ctx_or_interaction.followup.send(err)
-                        else: await status_msg.edit(content=err)
-                        os.remove(file_path)
-                    else:
-                        if not is_interaction and status_msg: await status_msg.delete()
-                        res = f"はい、どうぞ！🎁✨\n⏱️ `{elapsed:.1f}s` / `{(size/1024/1024):.1f}MB`"
-                        await ctx_or_interaction.channel.send(res, file=discord.File(file_path, filename=display_filename), view=utils.PraiseView())
-                        os.remove(file_path)
+                result = await self.engine.run("download", url, file_format, fit_quality, max_height, work.path, on_event=on_event)
+                file_path, display_filename = result["file_path"], result["display_name"]
+                # 見積もりより大きくなったときは、1回だけ補正エンコードする
+                if os.path.exists(file_path) and os.path.getsize(file_path) > config.MAX_FILE_SIZE:
+                    try:
+                        await self.engine.run("shrink", file_path, file_format, config.MAX_FILE_SIZE, on_event=on_event)
+                    except dl_engine.EngineError as e:
+                        if e.kind != "failed": raise
+                        print(f"[Downloader] Shrink failed: {e}")
+            finally:
+                await editor.close()
+            elapsed = time.time() - start_time
+
+            # ファイル送信と後片付け
+            if os.path.exists(file_path):
+                size = os.path.getsize(file_path)
+                if size > config.MAX_FILE_SIZE:
+                    metrics.DOWNLOADS.inc(result="too_large")
+                    err = f"サイズオーバーです！😭 ({(size/1024/1024):.1f}MB)"
+                    if is_interaction: await ctx_or_interaction.followup.send(err)
+                    else: await status_msg.edit(content=err, view=None)
+                    os.remove(file_path)
                 else:
-                    raise Exception("File not found after download.")
+                    if not is_interaction and status_msg: await status_msg.delete()
+                    fp = await self.cache.put(url, file_format, quality_kbps, file_path, display_filename, elapsed)
+                    res = f"はい、どうぞ！🎁✨\n⏱️ `{elapsed:.1f}s` / `{(size/1024/1024):.1f}MB`"
+                    file = discord.File(fp, filename=display_filename)
+                    try:
+                        await ctx_or_interaction.channel.send(res, file=file, view=utils.PraiseView())
+                    finally:
+                        file.close()
+                        fp.close()
+                    metrics.DOWNLOADS.inc(result="ok")
+                    metrics.DOWNLOAD_SECONDS.observe(time.time() - start_time)
+            else:
+                raise Exception("File not found after download.")
 
-            except Exception as e:
-                traceback.print_exc()
+        except dl_engine.EngineError as e:
+            print(f"[Downloader] {e}")
+            if e.details: print(e.details)
+            metrics.DOWNLOADS.inc(result="timeout" if e.kind == "timeout" else "error")
+            if e.kind == "timeout":
+                err = f"時間がかかりすぎたので中断しました…⌛ ({config.DL_JOB_TIMEOUT}秒)"
+            else:
                 err = "ダウンロード中にエラーが起きちゃいました…💦 1動画ずつ、正しいURLで試してみてくださいね。"
-                if is_interaction: await ctx_or_interaction.followup.send(err)
-                elif status_msg: await status_msg.edit(content=err)
-            finally:
-                # ユーザーをアクティブリストから削除（次のリクエストを許可）
-                self.active_users.remove(user_id)
+            if is_interaction: await ctx_or_interaction.followup.send(err)
+            elif status_msg: await status_msg.edit(content=err, view=None)
+        except Exception as e:
+            traceback.print_exc()
+            metrics.DOWNLOADS.inc(result="error")
+            err = "ダウンロード中にエラーが起きちゃいました…💦 1動画ずつ、正しいURLで試してみてくださいね。"
+            if is_interaction: await ctx_or_interaction.followup.send(err)
+            elif status_msg: await status_msg.edit(content=err, view=None)
+        finally:
+            # 作業ディレクトリはサムネイルや途中ファイルごと消す
+            if work: await work.release()
+            # 終わったらキャンセルボタンを外す（メッセージ版は成功時に削除済み）
+            if is_interaction and not job.cancelled:
+                try: await status_msg.edit(view=None)
+                except discord.HTTPException: pass
 
     @app_commands.command(name="dl", description="1つの動画/音楽をダウンロードします")
     async def slash_dl(self, interaction: discord.Interaction, url: str, format: str = "mp3", quality: str = "0"):
@@ -150,34 +304,171 @@ class Downloader(commands.Cog):
             return
 
         # クールダウンチェック
-        user_id = interaction.user.id
-        now = datetime.now()
-        if user_id in self.user_last_download:
-            diff = (now - self.user_last_download[user_id]).total_seconds()
-            if diff < config.COOLDOWN_SECONDS:
-                await interaction.response.send_message(f"連投禁止です！あと {int(config.COOLDOWN_SECONDS - diff)}秒 待ってください🙏", ephemeral=True)
-                return
+        retry = self.dl_cooldown.consume(("dl", interaction.user.id, interaction.guild_id))
+        if retry:
+            await interaction.response.send_message(f"連投禁止です！あと {int(retry)}秒 待ってください🙏", ephemeral=True)
+            return
+
+        await interaction.response.defer()
+        # 音質は自由入力なので、"320k" などもここで数字にそろえる（読めなければおまかせ）
+        await self.process_download(interaction, url, format, dl_probe.normalize_quality(quality))
+
+    @app_commands.command(name="dl_batch", description="プレイリスト/アルバムをまとめてダウンロードします（音声のみ）")
+    async def slash_dl_batch(self, interaction: discord.Interaction, url: str, format: str = "mp3", quality: str = "0"):
+        if interaction.channel_id != config.ALLOWED_DL_CHANNEL_ID:
+            await interaction.response.send_message(f"<#{config.ALLOWED_DL_CHANNEL_ID}> で使ってくださいね🥺", ephemeral=True)
+            return
+        if format == "mp4":
+            await interaction.response.send_message("まとめてダウンロードは音声だけなんです…🙏 動画は `/dl` で1つずつお願いします", ephemeral=True)
+            return
+
+        # まとめて1回分としてクールダウン・順番待ちに数える
+        cooldown_key = ("dl", interaction.user.id, interaction.guild_id)
+        retry = self.dl_cooldown.consume(cooldown_key)
+        if retry:
+            await interaction.response.send_message(f"連投禁止です！あと {int(retry)}秒 待ってください🙏", ephemeral=True)
+            return
 
-        self.user_last_download[user_id] = now
         await interaction.response.defer()
-        await self.process_download(interaction, url, format, quality)
+        reason = self.queue.check(interaction.user.id)
+        if reason:
+            self.dl_cooldown.reset(cooldown_key)
+            await interaction.followup.send(queue_full_text(reason), ephemeral=True)
+            return
+        quality = dl_probe.normalize_quality(quality)
+        await self.enqueue(interaction, interaction.user.id, lambda job: self.run_batch(job, interaction, url, format, quality), cooldown_key)
+
+    async def run_batch(self, job, interaction, url, file_format, quality_kbps):
+        status_msg = job.status_msg
+        items = []
+        work = None
+        outcome = None  # 最後に状況メッセージに書く内容（キャンセル時は None のまま）
+        uploads = 0     # 送れた束の数
+        editor = progress.ThrottledEditor(status_msg, config.DL_PROGRESS_INTERVAL)
+        try:
+            # 同時に取得する数ぶんの元ファイルと、送信待ちの束ぶんを予約
+            work = await self.scratch.acquire(config.DL_BATCH_FETCH_CONCURRENCY * config.DL_MAX_SOURCE_SIZE + 2 * config.MAX_FILE_SIZE)
+            await status_msg.edit(content="プレイリストの中身を確認しています…📋")
+            entries = await self.probe_engine.run("playlist", url, config.DL_BATCH_MAX)
+            items = [dl_batch.BatchItem(i, e["url"], e.get("title")) for i, e in enumerate(entries)]
+            if not items:
+                outcome = "中身が見つかりませんでした…💦"
+                return
+
+            def show():
+                counts = {}
+                for item in items:
+                    stage = "failed" if item.error else item.stage
+                    counts[stage] = counts.get(stage, 0) + 1
+                labels = [("fetch", "📥取得"), ("transcode", "🔧変換"), ("tag", "🏷️タグ"), ("upload", "📤送信"), ("done", "✅完了"), ("failed", "❌失敗")]
+                summary = " / ".join(f"{label} {counts[key]}" for key, label in labels if counts.get(key))
+                editor.update(f"📦 まとめてダウンロード中（全{len(items)}件）\n{summary}")
+
+            async def fetch(item):
+                result = await self.engine.run("fetch", item.url, work.path)
+                item.path, item.title = result["path"], result["title"]
+                item.meta = {"title": result["title"], "artist": result.get("uploader"), "album": result.get("album") or result["title"], "cover": result.get("cover")}
+                # 1曲ずつ上限に収まる音質を決める
+                plan = dl_probe.plan_download({"duration": result.get("duration")}, file_format, quality_kbps, config.MAX_FILE_SIZE)
+                if plan is None: raise ValueError("too long")
+                item.quality = plan[0]
+
+            async def transcode(item):
+                result = await self.engine.run("transcode", item.path, file_format, item.quality)
+                item.path, item.size = result["path"], result["size"]
+                if item.size > config.MAX_FILE_SIZE: raise ValueError("too large")
+
+            async def tag(item):
+                await self.engine.run("tag", item.path, item.meta)
+                item.display_name = f"{utils.sanitize_filename(item.title)}.{file_format}"
+
+            async def send(pack):
+                nonlocal uploads
+                files = []
+                try:
+                    files = [discord.File(item.path, filename=item.display_name) for item in pack]
+                    await interaction.channel.send(" / ".join(f"`{item.index + 1}`" for item in pack), files=files)
+                    uploads += 1
+                    # 束に入っただけではまだ届いていないので、完了にするのは送れてから
+                    for item in pack: item.stage = "done"
+                except Exception as e:
+                    # 送れなかった束は中身を全部失敗にする（ここで投げると add() を呼んだ1件だけが失敗扱いになる）
+                    print(f"[Downloader] Pack upload failed: {e}")
+                    for item in pack: item.error = str(e) or type(e).__name__
+                finally:
+                    for f in files: f.close()
+                    for item in pack: self.remove_file(item)
+                    show()
+
+            packer = dl_batch.UploadPacker(send, config.MAX_FILE_SIZE)
+            stages = [
+                ("fetch", config.DL_BATCH_FETCH_CONCURRENCY, fetch),
+                ("transcode", config.DL_BATCH_TRANSCODE_CONCURRENCY, transcode),
+                ("tag", 1, tag),
+                ("upload", 1, packer.add),
+            ]
+            await dl_batch.run_pipeline(items, stages, on_change=show)
+            await packer.close()
+
+            failed = [item for item in items if item.error]
+            metrics.DOWNLOADS.inc(len(items) - len(failed), result="ok")
+            metrics.DOWNLOADS.inc(len(failed), result="error")
+            text = f"はい、どうぞ！🎁✨ {len(items) - len(failed)}/{len(items)}件を {uploads}回に分けてお届けしました"
+            if failed:
+                text += "\n取れなかったもの: " + ", ".join(f"`{item.index + 1}` {item.title or item.url}" for item in failed[:10])
+            outcome = text
+        except dl_engine.EngineError as e:
+            print(f"[Downloader] Batch failed: {e}")
+            outcome = "プレイリストを読み込めませんでした…💦 URLを確認してくださいね。"
+        except Exception:
+            traceback.print_exc()
+            metrics.DOWNLOADS.inc(result="error")
+            outcome = "まとめてダウンロード中にエラーが起きちゃいました…💦"
+        finally:
+            # 途中経過の編集を止めてから結果を書く（キャンセルボタンもここで外れる）
+            await editor.close()
+            if outcome is not None:
+                try: await status_msg.edit(content=outcome, view=None)
+                except discord.HTTPException: pass
+            for item in items:
+                self.remove_file(item)
+            if work: await work.release()
+
+    @staticmethod
+    def remove_file(item):
+        if item.path and os.path.exists(item.path):
+            try: os.remove(item.path)
+            except OSError: pass
+        item.path = None
+
+    @app_commands.command(name="dl_cache_stats", description="ダウンロードキャッシュの状況を表示します")
+    async def slash_dl_cache_stats(self, interaction: discord.Interaction):
+        s = self.cache.summary()
+        embed = discord.Embed(title="📦 ダウンロードキャッシュ", color=discord.Color.blue())
+        embed.add_field(name="保存数", value=f"{s['entries']}件 / {(s['bytes']/1024/1024):.1f}MB", inline=True)
+        embed.add_field(name="ヒット率", value=f"{s['hit_ratio']*100:.1f}% ({s['hits']}/{s['hits'] + s['misses']})", inline=True)
+        embed.add_field(name="節約", value=f"{(s['bytes_saved']/1024/1024):.1f}MB / {s['seconds_saved']:.0f}秒", inline=True)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author.bot: return
-        match = self.url_pattern.search(message.content)
-        if match:
-            if message.channel.id != config.ALLOWED_DL_CHANNEL_ID: return
-            
-            user_id = message.author.id
-            now = datetime.now()
-            if user_id in self.user_last_download:
-                if (now - self.user_last_download[user_id]).total_seconds() < config.COOLDOWN_SECONDS:
-                    return # 静かにスルー
-            
-            self.user_last_download[user_id] = now
-            # 見つかった最初のURLのみを渡す
-            await self.process_download(message, match.group(0), "mp3", "0")
+        # 安い判定から: チャンネル → URL の切り出し
+        if message.channel.id != config.ALLOWED_DL_CHANNEL_ID: return
+        urls = self.urls.find_all(message.content, limit=config.DL_MESSAGE_MAX_URLS)
+        if not urls: return
+
+        if self.dl_cooldown.consume(("dl", message.author.id, message.guild.id if message.guild else None)):
+            return # 静かにスルー
+
+        # 同じ動画を指すURL（youtu.be と youtube.com など）は1回だけ
+        # 2件目以降が断られてもクールダウンは返さない（1通で積んだうえに連投制限まで消せてしまう）
+        seen = set()
+        for url in urls:
+            key = dl_cache.source_key(url)
+            if key in seen: continue
+            await self.process_download(message, url, "mp3", "0", refund=not seen)
+            seen.add(key)
 
 async def setup(bot):
     await bot.add_cog(Downloader(bot))
\ No newline at end of file
@@ -2,8 +2,7 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import config
-import utils
+import storage
 
 class RoleManager(commands.Cog):
     def __init__(self, bot):
@@ -12,11 +11,10 @@ class RoleManager(commands.Cog):
     # --- イベント: 入室時のロール復元 ---
     @commands.Cog.listener()
     async def on_member_join(self, member):
-        data = utils.load_json(config.ROLE_KEEP_FILE)
-        uid = str(member.id)
-        if uid in data:
+        kept = await storage.get_store().get_kept_roles(member.id)
+        if kept:
             roles = []
-            for rid in data[uid]:
+            for rid in kept:
                 role = member.guild.get_role(rid)
                 if role and member.guild.me.top_role > role and not role.managed:
                     roles.append(role)
@@ -32,9 +30,7 @@ class RoleManager(commands.Cog):
     async def on_member_remove(self, member):
         roles = [r.id for r in member.roles if not r.is_default() and not r.managed]
         if roles:
-            data = utils.load_json(config.ROLE_KEEP_FILE)
-            data[str(member.id)] = roles
-            utils.save_json(config.ROLE_KEEP_FILE, data)
+            await storage.get_store().set_kept_roles(member.id, roles)
             print(f"[Role Keep] Saved for {member.name}")
 
     # --- コマンド: ロールパネル設置 (最大4つ) ---
@@ -2,13 +2,43 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
+import asyncio
 import os
 import random
 import config
+import startup
+import filestore
+import command_sync
+import loop_monitor
+import ratelimit
 
 class System(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # ループを長く止めた処理はログチャンネルに知らせる（連続しても LOOP_ALERT_COOLDOWN 秒に1回）
+        self.monitor = loop_monitor.get_monitor()
+        self.alert_cooldown = ratelimit.cooldown(config.LOOP_ALERT_COOLDOWN)
+
+    async def cog_load(self):
+        self.monitor.on_block = self.on_loop_block
+
+    async def cog_unload(self):
+        self.monitor.on_block = None
+
+    def on_loop_block(self, block):
+        if block.duration < config.LOOP_ALERT_SECONDS: return
+        if self.alert_cooldown.consume("loop_block"): return
+        asyncio.create_task(self.send_loop_alert(block))
+
+    async def send_loop_alert(self, block):
+        channel = self.bot.get_channel(config.LOG_CHANNEL_ID)
+        if not channel: return
+        name = loop_monitor.handler_name(self.bot, block.handler)
+        report = "\n".join(loop_monitor.report_lines(self.bot, self.monitor, n=3))
+        try:
+            await channel.send(f"⚠️ 処理が {block.duration:.1f}秒 止まっていました: **{block.cog} {name}** (`{block.site}`)\n```\n{report}\n```")
+        except discord.HTTPException as e:
+            print(f"[LoopMonitor] Failed to send alert: {e}")
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -19,17 +49,14 @@ class System(commands.Cog):
         channel = self.bot.get_channel(config.STARTUP_CHANNEL_ID)
         if not channel: return
 
-        last_version = ""
-        if os.path.exists(config.VERSION_FILE):
-            with open(config.VERSION_FILE, "r", encoding="utf-8") as f:
-                last_version = f.read().strip()
+        files = filestore.get_store()
+        last_version = (await files.read_text(config.VERSION_FILE, "")).strip()
 
         if last_version != config.BOT_VERSION:
             try:
                 msg = f"🎉 **アップデート完了 (ver {config.BOT_VERSION})** 🎉\n{config.UPDATE_NOTE}"
                 await channel.send(msg)
-                with open(config.VERSION_FILE, "w", encoding="utf-8") as f:
-                    f.write(config.BOT_VERSION)
+                await files.write_text(config.VERSION_FILE, config.BOT_VERSION)
             except Exception as e:
                 print(f"通知エラー: {e}")
         else:
@@ -75,10 +102,25 @@ class System(commands.Cog):
     async def sync_command(self, ctx):
         await ctx.send("コマンドを整理してます…🔄")
         try:
-            synced = await self.bot.tree.sync()
-            await ctx.send(f"{len(synced)}個のコマンドを同期しました！✨")
+            # 変わっていなくても全部送り直す
+            synced = await command_sync.get_sync(self.bot.tree).sync([g.id for g in self.bot.guilds], force=True)
+            await ctx.send(f"{synced.get('global', 0)}個のコマンドを同期しました！✨")
         except Exception as e:
             await ctx.send(f"エラー発生: `{e}`")
 
+    @commands.command(name="startup")
+    @commands.is_owner()
+    async def startup_command(self, ctx):
+        """起動にかかった時間の内訳を表示します。"""
+        report = "\n".join(startup.profile.lines())
+        await ctx.send(f"起動の内訳です⏱️\n```\n{report}\n```")
+
+    @commands.command(name="loopstats")
+    @commands.is_owner()
+    async def loopstats_command(self, ctx):
+        """イベントループを止めた時間の長い処理を表示します。"""
+        report = "\n".join(loop_monitor.report_lines(self.bot, self.monitor, n=10))
+        await ctx.send(f"ループを止めている処理です🐢\n```\n{report}\n```")
+
 async def setup(bot):
     await bot.add_cog(System(bot))
\ No newline at end of file
@@ -0,0 +1,67 @@
+# command_sync.py
+# スラッシュコマンドの同期（中身が変わったときだけ Discord に送る）
+# on_ready は再接続のたびに呼ばれるので、毎回 tree.sync() すると同期のレート制限に当たる
+import hashlib
+import json
+import discord
+import config_store
+
+STATE_FILE = "command_sync.json"
+
+def tree_payload(tree, guild=None):
+    """tree.sync() が送るのと同じ内容（並び順に左右されないよう種類・名前順）"""
+    commands = tree.get_commands(guild=guild)
+    payload = [command.to_dict(tree) for command in commands]
+    return sorted(payload, key=lambda c: (c.get("type", 1), c["name"]))
+
+def fingerprint(payload):
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+class CommandSync:
+    """
+    - グローバルと、ギルド専用コマンドのあるギルドごとに、送る内容のハッシュを保存しておく
+    - sync() はハッシュが前回同期したときと違う範囲だけ同期する（force=True なら全部）
+    - ギルド専用コマンドが無くなったギルドは、空で同期して消す
+    """
+    def __init__(self, tree, path=STATE_FILE):
+        self.tree = tree
+        self.state = config_store.get_config(path)
+
+    def _scopes(self, app_id, guild_ids):
+        saved = self.state.data.get(str(app_id), {})
+        scopes = {"global": None}
+        for guild_id in guild_ids:
+            if self.tree.get_commands(guild=discord.Object(id=guild_id)):
+                scopes[str(guild_id)] = discord.Object(id=guild_id)
+        for key in saved:
+            if key not in scopes: scopes[key] = discord.Object(id=int(key))
+        return scopes
+
+    async def sync(self, guild_ids=(), force=False):
+        """
+        同期した範囲の {"global" or ギルドID: 同期後のコマンド数} を返します。
+        変わっていなければ空の dict（Discord には何も送らない）。
+        """
+        app_id = self.tree.client.application_id
+        saved = self.state.data.setdefault(str(app_id), {})
+        synced = {}
+        for key, guild in self._scopes(app_id, guild_ids).items():
+            digest = fingerprint(tree_payload(self.tree, guild))
+            if not force and saved.get(key) == digest: continue
+            result = await self.tree.sync(guild=guild)
+            synced[key] = len(result)
+            if guild is not None and not result:
+                saved.pop(key, None)
+            else:
+                saved[key] = digest
+            self.state.save()
+        return synced
+
+_sync = None
+
+def get_sync(tree):
+    global _sync
+    if _sync is None:
+        _sync = CommandSync(tree)
+    return _sync
@@ -18,10 +18,44 @@ DOWNLOAD_DIR = "temp_downloads"
 VERSION_FILE = "version_history.txt"
 BOOKMARK_FILE = "bookmarks.json"
 ROLE_KEEP_FILE = "role_keep.json"
+DATABASE_FILE = "maid.db"          # ブックマーク・ロール保持（SQLite）
+ANON_LOG_DIR = "anon_logs"         # 匿名投稿の監査ログ
+DL_CACHE_DIR = "dl_cache"          # ダウンロード結果のキャッシュ
 
 # 設定値
 MAX_FILE_SIZE = 10 * 1024 * 1024 # 10MB
 COOLDOWN_SECONDS = 30
+ANON_LOG_RETENTION_DAYS = 180 # 監査ログの保存期間（日）
+DL_CACHE_MAX_BYTES = 1024 * 1024 * 1024 # 1GB（超えたら古いものから削除）
+DL_CACHE_TTL_HOURS = 72
+DL_WORKERS = 2          # 同時に処理するダウンロード数
+DL_QUEUE_MAX = 20       # 順番待ちの上限（超えたら受付を断る）
+DL_QUEUE_PER_USER = 2   # 1人あたりの受付上限（実行中を含む）
+DL_JOB_TIMEOUT = 600    # 1件あたりの制限時間（秒）。超えたら子プロセスごと止める
+DL_WORKER_MAX_JOBS = 20 # 子プロセスを作り直すまでの処理件数（メモリ対策）
+DL_PROGRESS_INTERVAL = 2.0 # 進捗メッセージを編集する最短間隔（秒）
+DL_PROBE_TIMEOUT = 60   # 下見（情報取得のみ）の制限時間（秒）
+DL_PROBE_TTL = 1800     # 下見結果を覚えておく時間（秒）
+DL_PROBE_WORKERS = 1    # 下見・タイトル取得用の子プロセス数
+DL_MAX_SOURCE_SIZE = 100 * 1024 * 1024 # 変換前の元ファイルの上限（変換後は MAX_FILE_SIZE に収める）
+DL_BATCH_MAX = 15                  # /dl_batch で取る最大件数
+DL_BATCH_FETCH_CONCURRENCY = 2     # /dl_batch の同時取得数
+DL_BATCH_TRANSCODE_CONCURRENCY = 2 # /dl_batch の同時変換数
+DL_SCRATCH_QUOTA = 1024 * 1024 * 1024 # 作業用一時領域の上限（予約の合計）
+DL_SCRATCH_ORPHAN_AGE = 2 * 3600   # これより古い取り残しは定期掃除で消す（秒）
+DL_SCRATCH_TMPFS = os.getenv("DL_SCRATCH_TMPFS") # 例: /dev/shm/maidbot（未設定なら DOWNLOAD_DIR）
+# 貼られたら自動でダウンロードするドメイン（サブドメインも含む）
+DL_ALLOWED_DOMAINS = ["youtube.com", "youtu.be", "soundcloud.com", "bandcamp.com", "twitter.com", "x.com", "tiktok.com", "instagram.com"]
+DL_DOMAINS_FROM_EXTRACTORS = False # True なら yt-dlp が対応している全ドメインも許可する
+DL_MESSAGE_MAX_URLS = 3            # 1メッセージから受け付けるURLの数
+HEALTH_PORT = 8000            # /healthz と /metrics（Dockerfile の EXPOSE に合わせる）
+HEALTH_MAX_DISCONNECT = 60    # ゲートウェイからこれ以上切れていたら異常（秒）
+HEALTH_MAX_LATENCY = 10       # ハートビートの遅延がこれを超えたら異常（秒）
+HEALTH_MAX_LOOP_LAG = 5       # イベントループの遅れがこれを超えたら異常（秒）
+LOG_CHANNEL_ID = 1447846598574084218 # 監視の通知（ループの詰まりなど）
+LOOP_BLOCK_THRESHOLD = 0.25   # これ以上ループが止まったらスタックを取って記録（秒）
+LOOP_ALERT_SECONDS = 2.0      # これ以上止まったらログチャンネルに通知（秒）
+LOOP_ALERT_COOLDOWN = 600     # 通知の間隔の下限（秒）
 
 # メッセージ集
 STARTUP_MESSAGES = [
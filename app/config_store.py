@@ -0,0 +1,87 @@
+# config_store.py
+# JSON設定ファイルをメモリ上に保持し、変更は少し遅らせてまとめて書き込む（write-behind）
+# 実際の読み書きは filestore の I/O スレッドで行う
+import asyncio
+import os
+import time
+import filestore
+
+class JsonConfig:
+    """
+    1つのJSON設定ファイルを表すクラス。
+    - data: メモリ上の設定（読み取りはディスクに触れません）
+    - save(): 変更を通知し、delay 秒後にまとめて保存を予約
+    - subscribe(): 変更通知のコールバックを登録
+    """
+    def __init__(self, path, delay=2.0, max_delay=10.0, indent=4):
+        self.path = path
+        self.delay = delay
+        self.max_delay = max_delay
+        self.indent = indent
+        self.data = self._load()
+        self._listeners = []
+        self._dirty_since = None
+        self._timer = None
+
+    def _load(self):
+        # 起動時に1回だけ（Cog の読み込み中）。以降の読み取りはメモリ上の data で済む
+        try:
+            return filestore.get_store().read_json_sync(self.path, {})
+        except Exception as e:
+            print(f"[Config] Failed to load {self.path}: {e}")
+            return {}
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def save(self):
+        """data を書き換えた後に呼びます。ディスクへの書き込みは後でまとめて行います。"""
+        for callback in list(self._listeners):
+            try: callback(self)
+            except Exception as e: print(f"[Config] Listener error ({self.path}): {e}")
+
+        now = time.monotonic()
+        if self._dirty_since is None:
+            self._dirty_since = now
+        if self._timer:
+            self._timer.cancel()
+        # 連続で変更が来ても max_delay を超えて保存が遅れないようにする
+        wait = min(self.delay, max(0.0, self._dirty_since + self.max_delay - now))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # イベントループ外（起動前・スクリプト）からは即保存
+            self._clear()
+            filestore.get_store().write_json_sync(self.path, self.data, indent=self.indent)
+            return
+        self._timer = loop.call_later(wait, lambda: asyncio.ensure_future(self.flush()))
+
+    def _clear(self):
+        self._dirty_since = None
+        self._timer = None
+
+    async def flush(self):
+        """保留中の変更があれば今すぐ書き込みます。"""
+        if self._dirty_since is None: return
+        if self._timer:
+            self._timer.cancel()
+        self._clear()
+        # 内容はここで bytes にしてから渡す（書き込み中に data が書き換わっても混ざらない）
+        try:
+            await filestore.get_store().write_json(self.path, self.data, indent=self.indent)
+        except Exception as e:
+            print(f"[Config] Failed to save {self.path}: {e}")
+
+_configs = {}
+
+def get_config(path, **kwargs):
+    """同じファイルに対しては常に同じ JsonConfig を返します（全Cogで共有）"""
+    key = os.path.abspath(path)
+    if key not in _configs:
+        _configs[key] = JsonConfig(path, **kwargs)
+    return _configs[key]
+
+async def flush_all():
+    """終了時に呼び、保留中の書き込みをすべて反映します。"""
+    for cfg in list(_configs.values()):
+        await cfg.flush()
@@ -0,0 +1,91 @@
+# dl_batch.py
+# プレイリスト・アルバムのまとめてダウンロード（取得 → 変換 → タグ付け → 送信 を流れ作業で）
+import asyncio
+
+class BatchItem:
+    def __init__(self, index, url, title=None):
+        self.index = index
+        self.url = url
+        self.title = title
+        self.stage = "waiting"
+        self.path = None
+        self.display_name = None
+        self.size = 0
+        self.meta = {}
+        self.quality = None
+        self.error = None
+
+async def run_pipeline(items, stages, on_change=None):
+    """
+    stages は (段階名, 同時実行数, async def 処理(item)) のリスト。
+    各段階は自分の同時実行数の範囲で動き、終わった item から次の段階へ流します。
+    どこかで失敗した item は error を記録して、以降の段階を素通りします。
+    最後の段階の処理は、本当に終わった時点で自分で item.stage = "done" にします（送信のように後でまとめて終わるものがあるため）。
+    """
+    queues = [asyncio.Queue() for _ in stages]
+    for item in items:
+        queues[0].put_nowait(item)
+
+    async def worker(i, name, process):
+        while True:
+            item = await queues[i].get()
+            try:
+                if item.error is None:
+                    item.stage = name
+                    if on_change: on_change()
+                    await process(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                item.error = str(e) or type(e).__name__
+            finally:
+                if i + 1 < len(stages):
+                    queues[i + 1].put_nowait(item)
+                elif on_change:
+                    on_change()
+                queues[i].task_done()
+
+    tasks = [asyncio.create_task(worker(i, name, process))
+             for i, (name, concurrency, process) in enumerate(stages) for _ in range(concurrency)]
+    try:
+        # 前の段階が空になれば、その item はすべて次の段階に渡っている
+        for queue in queues:
+            await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+class UploadPacker:
+    """
+    できた順に受け取ったファイルを、1メッセージ max_files 個・合計 limit バイトまでの束に詰めて送ります。
+    開いている束は max_open 個まで持ち、入る束がなければ一番詰まっている束から送り出します（First-Fit）。
+    """
+    def __init__(self, send, limit, max_files=10, max_open=2):
+        self.send = send          # async def send(items)
+        self.limit = limit
+        self.max_files = max_files
+        self.max_open = max_open
+        self.bins = []
+
+    def _fits(self, pack, item):
+        return len(pack) < self.max_files and sum(i.size for i in pack) + item.size <= self.limit
+
+    async def add(self, item):
+        for pack in self.bins:
+            if self._fits(pack, item):
+                pack.append(item)
+                if len(pack) >= self.max_files:
+                    await self._flush(pack)
+                return
+        if len(self.bins) >= self.max_open:
+            await self._flush(max(self.bins, key=lambda p: sum(i.size for i in p)))
+        self.bins.append([item])
+
+    async def _flush(self, pack):
+        self.bins.remove(pack)
+        await self.send(pack)
+
+    async def close(self):
+        for pack in list(self.bins):
+            await self._flush(pack)
@@ -0,0 +1,167 @@
+# dl_cache.py
+# ダウンロード結果のキャッシュ（同じ曲・動画の再リクエストは yt-dlp/ffmpeg を通さずに返す）
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import config
+import config_store
+import metrics
+
+INDEX_FILE = "index.json"
+# キャッシュが置くファイルの名前（<sha256>.<拡張子>）。これ以外には触れない
+CACHE_FILE_RE = re.compile(r"[0-9a-f]{64}\.\w+")
+
+# URLに付いてくるだけで中身は変わらないクエリ
+TRACKING_PARAMS = {"si", "feature", "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "ref", "igshid", "s", "t"}
+YOUTUBE_HOSTS = {"youtube.com", "m.youtube.com", "music.youtube.com", "youtu.be"}
+
+def source_key(url):
+    """
+    URLを「同じ中身なら同じ文字列」になるよう正規化します。
+    YouTube は URL の形が何通りもあるので動画IDまで落とします（youtube:<ID>）。
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/")
+    query = parse_qsl(parts.query)
+
+    if host in YOUTUBE_HOSTS:
+        video_id = None
+        if host == "youtu.be":
+            video_id = path.lstrip("/").split("/")[0]
+        elif path == "/watch":
+            video_id = dict(query).get("v")
+        elif path.startswith(("/shorts/", "/live/", "/embed/")):
+            video_id = path.split("/")[2]
+        if video_id:
+            return f"youtube:{video_id}"
+
+    if host == "x.com":
+        host = "twitter.com"
+    query = sorted((k, v) for k, v in query if k.lower() not in TRACKING_PARAMS)
+    return f"{host}{path}" + (f"?{urlencode(query)}" if query else "")
+
+def cache_key(url, file_format, quality):
+    raw = f"{source_key(url)}|{file_format}|{quality}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class DownloadCache:
+    """
+    完成ファイルを <キー>.<拡張子> で保存し、index.json に一覧と統計を持ちます。
+    - 容量が max_bytes を超えたら最後に使われたのが古いものから消す（LRU）
+    - ttl 秒を過ぎたものは期限切れとして扱う
+    """
+    def __init__(self, directory, max_bytes, ttl):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index = config_store.get_config(os.path.join(directory, INDEX_FILE), indent=None)
+        self.entries = self.index.data.setdefault("entries", {})
+        self.stats = self.index.data.setdefault("stats", {"hits": 0, "misses": 0, "bytes_saved": 0, "seconds_saved": 0.0})
+        self._drop_missing()
+
+    def _path(self, entry):
+        return os.path.join(self.directory, entry["file"])
+
+    def _drop_missing(self):
+        # 手で消されたファイルや、一覧にない取り残しを整理（共有の場所を指定されても他のファイルは消さない）
+        for key in [k for k, e in self.entries.items() if not os.path.exists(self._path(e))]:
+            del self.entries[key]
+        known = {e["file"] for e in self.entries.values()}
+        for name in os.listdir(self.directory):
+            if name not in known and CACHE_FILE_RE.fullmatch(name):
+                try: os.remove(os.path.join(self.directory, name))
+                except OSError: pass
+
+    def total_bytes(self):
+        return sum(e["size"] for e in self.entries.values())
+
+    def get(self, url, file_format, quality):
+        """
+        ヒットすれば (開いたファイル, 表示用ファイル名, サイズ) を返します。
+        ロックの中で開くので、送信中に _evict() で消されても送り終わるまで読めます（閉じるのは呼び出し側）。
+        """
+        key = cache_key(url, file_format, quality)
+        with self._lock:
+            entry = self.entries.get(key)
+            now = time.time()
+            if entry and now - entry["created"] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None or not os.path.exists(self._path(entry)):
+                self.entries.pop(key, None)
+                self.stats["misses"] += 1
+                metrics.CACHE_REQUESTS.inc(cache="download", result="miss")
+                self.index.save()
+                return None
+            entry["last_used"] = now
+            self.stats["hits"] += 1
+            metrics.CACHE_REQUESTS.inc(cache="download", result="hit")
+            self.stats["bytes_saved"] += entry["size"]
+            self.stats["seconds_saved"] += entry["elapsed"]
+            self.index.save()
+            return open(self._path(entry), "rb"), entry["display_name"], entry["size"]
+
+    async def put(self, url, file_format, quality, src_path, display_name, elapsed):
+        """
+        完成ファイルをキャッシュに移して、開いたファイルを返します（元のファイルは無くなります）。
+        キャッシュに入らない大きさならそのまま src_path を開いて返します。
+        """
+        size = os.path.getsize(src_path)
+        if size > self.max_bytes: return open(src_path, "rb")
+        key = cache_key(url, file_format, quality)
+        entry = {"file": f"{key}.{file_format}", "display_name": display_name, "size": size,
+                 "elapsed": round(elapsed, 2), "created": time.time(), "last_used": time.time()}
+        # 作業領域が tmpfs だと移動はコピーになるので、ループの外で
+        await asyncio.to_thread(shutil.move, src_path, self._path(entry))
+        with self._lock:
+            self.entries[key] = entry
+            self._evict()
+            self.index.save()
+            return open(self._path(entry), "rb")
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            try: os.remove(self._path(entry))
+            except OSError: pass
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, e in self.entries.items() if now - e["created"] > self.ttl]:
+            self._remove(key)
+        total = self.total_bytes()
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+            if total <= self.max_bytes: break
+            total -= self.entries[key]["size"]
+            self._remove(key)
+
+    def summary(self):
+        s = self.stats
+        lookups = s["hits"] + s["misses"]
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes(),
+            "hits": s["hits"],
+            "misses": s["misses"],
+            "hit_ratio": s["hits"] / lookups if lookups else 0.0,
+            "bytes_saved": s["bytes_saved"],
+            "seconds_saved": s["seconds_saved"],
+        }
+
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = DownloadCache(config.DL_CACHE_DIR, config.DL_CACHE_MAX_BYTES, config.DL_CACHE_TTL_HOURS * 3600)
+    return _cache
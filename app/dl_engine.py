@@ -0,0 +1,179 @@
+# dl_engine.py
+# yt-dlp の処理を Bot 本体とは別のプロセスで動かすエンジン
+# （GIL を取り合わない・固まった抽出や ffmpeg ごと強制終了できる）
+import asyncio
+import itertools
+import json
+import os
+import signal
+import sys
+import time
+import config
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dl_worker.py")
+# 子プロセスとの1行の上限（情報の大きい結果でも詰まらないよう広めに）
+LINE_LIMIT = 16 * 1024 * 1024
+
+class EngineError(Exception):
+    """
+    子プロセス側の失敗をまとめて表す例外。
+    kind: "timeout"（時間切れで強制終了） / "crashed"（子が落ちた） / "failed"（処理中の例外）
+    """
+    def __init__(self, kind, message, error=None, details=None):
+        super().__init__(f"{kind}: {message}")
+        self.kind = kind
+        self.message = message
+        self.error = error        # 子側の例外クラス名
+        self.details = details    # 子側のトレースバック
+
+class _Worker:
+    def __init__(self, proc):
+        self.proc = proc
+        self.jobs = 0
+        self.started = time.monotonic()
+
+    @property
+    def alive(self):
+        return self.proc.returncode is None
+
+    def kill(self):
+        # 子は自分のセッション（プロセスグループ）のリーダーなので、ffmpeg などの孫ごと止められる
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+class DownloadEngine:
+    """
+    - workers 個まで子プロセスを立て、使い回す（max_jobs 回使ったら作り直してメモリを戻す）
+    - run() は1ジョブを渡して結果（JSON）を返す。時間切れ・キャンセル時は子を kill する
+    - 子からの途中経過（type が result/error 以外の行）は on_event に渡す
+    """
+    def __init__(self, workers=2, max_jobs=20, timeout=600):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self._idle = []
+        self._slots = asyncio.Semaphore(workers)
+        self._ids = itertools.count(1)
+        self.stats = {"jobs": 0, "failed": 0, "timeouts": 0, "killed": 0, "spawned": 0}
+
+    async def prestart(self):
+        """最初のリクエストを待たせないよう、子プロセスを先に立ち上げておきます（子は起動時に温まる）。"""
+        while len(self._idle) < self.workers:
+            self._idle.append(await self._spawn())
+
+    async def _spawn(self):
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, WORKER_SCRIPT,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            start_new_session=True, limit=LINE_LIMIT,
+        )
+        self.stats["spawned"] += 1
+        return _Worker(proc)
+
+    async def _acquire(self):
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.alive: return worker
+        return await self._spawn()
+
+    async def _release(self, worker):
+        if worker.alive and worker.jobs < self.max_jobs:
+            self._idle.append(worker)
+            return
+        # 使い切ったら stdin を閉じて自然に終わらせる
+        await self._retire(worker)
+
+    async def _retire(self, worker):
+        if worker.alive:
+            worker.proc.stdin.close()
+            try:
+                await asyncio.wait_for(worker.proc.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                worker.kill()
+        await worker.proc.wait()
+
+    async def run(self, func, *args, timeout=None, on_event=None):
+        timeout = timeout or self.timeout
+        async with self._slots:
+            worker = await self._acquire()
+            job_id = next(self._ids)
+            worker.jobs += 1
+            self.stats["jobs"] += 1
+            request = json.dumps({"id": job_id, "func": func, "args": list(args)}, ensure_ascii=False) + "\n"
+            try:
+                worker.proc.stdin.write(request.encode("utf-8"))
+                await worker.proc.stdin.drain()
+                reply = await asyncio.wait_for(self._read_reply(worker, job_id, on_event), timeout)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                self._kill(worker)
+                raise EngineError("timeout", f"{func} did not finish within {timeout}s")
+            except asyncio.CancelledError:
+                self._kill(worker)
+                raise
+            except ConnectionError:
+                self._kill(worker)
+                self.stats["failed"] += 1
+                raise EngineError("crashed", f"worker exited during {func}")
+            except EngineError as e:
+                self._kill(worker)
+                self.stats["failed"] += 1
+                raise EngineError("crashed", f"{e.message} during {func}")
+            await self._release(worker)
+
+        if reply["type"] == "error":
+            self.stats["failed"] += 1
+            raise EngineError("failed", reply.get("message", ""), reply.get("error"), reply.get("traceback"))
+        return reply.get("result")
+
+    async def _read_reply(self, worker, job_id, on_event):
+        while True:
+            try:
+                line = await worker.proc.stdout.readline()
+            except ValueError:
+                # 1行が LINE_LIMIT を超えた
+                raise EngineError("crashed", "worker reply too long")
+            if not line:
+                raise EngineError("crashed", "worker closed its pipe")
+            # 途中で切れた行や壊れた行が来たら、その子はもう信用しない（呼び出し側で kill）
+            try:
+                message = json.loads(line)
+            except ValueError:
+                raise EngineError("crashed", f"malformed worker reply: {line[:200]!r}")
+            if not isinstance(message, dict):
+                raise EngineError("crashed", f"malformed worker reply: {line[:200]!r}")
+            if message.get("id") != job_id: continue
+            if message["type"] in ("result", "error"):
+                return message
+            if on_event:
+                on_event(message)
+
+    def _kill(self, worker):
+        self.stats["killed"] += 1
+        worker.kill()
+        # 待ち合わせはバックグラウンドで（ゾンビを残さない）
+        asyncio.ensure_future(worker.proc.wait())
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._retire(w) for w in idle), return_exceptions=True)
+
+_engines = {}
+
+def get_engine(pool="download"):
+    """
+    "download": 本番のダウンロード・変換用
+    "probe": 下見・タイトル取得などの軽い処理用（重いジョブの後ろで待たされないよう別枠）
+    """
+    if pool not in _engines:
+        if pool == "probe":
+            _engines[pool] = DownloadEngine(workers=config.DL_PROBE_WORKERS, max_jobs=config.DL_WORKER_MAX_JOBS, timeout=config.DL_PROBE_TIMEOUT)
+        else:
+            _engines[pool] = DownloadEngine(workers=config.DL_WORKERS, max_jobs=config.DL_WORKER_MAX_JOBS, timeout=config.DL_JOB_TIMEOUT)
+    return _engines[pool]
+
+async def close_all():
+    for engine in list(_engines.values()):
+        await engine.close()
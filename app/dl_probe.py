@@ -0,0 +1,112 @@
+# dl_probe.py
+# ダウンロード前の下見（情報だけ取って出力サイズを見積もり、入らないものは先に断る）
+import re
+import time
+import dl_cache
+import metrics
+
+# quality "0"（おまかせ）のときに想定するビットレート（kbps）
+DEFAULT_AUDIO_KBPS = {"mp3": 256, "m4a": 192, "aac": 192, "opus": 160, "ogg": 192, "vorbis": 192}
+# 可逆形式はビットレート指定が効かないので目安の値
+LOSSLESS_KBPS = {"wav": 1411, "flac": 900}
+# コンテナ・タグ・カバー画像ぶんの上乗せ
+OVERHEAD = 1.03
+# 上限ぴったりを狙わず、これだけ余裕を残す
+HEADROOM = 0.95
+# 自動で下げるときの候補（上から順に試す）
+AUDIO_LADDER = [320, 256, 192, 160, 128, 96, 64, 48, 32]
+VIDEO_LADDER = [1080, 720, 480, 360, 240, 144]
+# 動画をこれより低い総ビットレートに詰め込むのは見られたものではないので断る
+MIN_VIDEO_KBPS = 200
+# 音質の指定として受け付ける範囲（kbps）
+QUALITY_RANGE = (8, 512)
+QUALITY_PATTERN = re.compile(r"\s*(\d+)\s*(?:k|kbps)?\s*", re.IGNORECASE)
+
+def normalize_quality(quality_kbps):
+    """自由入力の音質を kbps の数字だけの文字列にします（"320k" → "320"）。読めない・範囲外なら "0"（おまかせ）"""
+    match = QUALITY_PATTERN.fullmatch(str(quality_kbps))
+    if not match: return "0"
+    kbps = int(match.group(1))
+    return str(kbps) if QUALITY_RANGE[0] <= kbps <= QUALITY_RANGE[1] else "0"
+
+def estimate_size(probe, file_format, quality_kbps):
+    """出力ファイルの見積もりサイズ（バイト）。見積もれなければ None"""
+    duration = probe.get("duration")
+    if file_format == "mp4":
+        # 動画は再エンコードしないので、選ばれる形式のサイズがほぼそのまま出力になる
+        if probe.get("source_bytes"): return int(probe["source_bytes"] * OVERHEAD)
+        if duration and probe.get("source_kbps"):
+            return int(duration * probe["source_kbps"] * 1000 / 8 * OVERHEAD)
+        return None
+    if not duration: return None
+    if file_format in LOSSLESS_KBPS:
+        kbps = LOSSLESS_KBPS[file_format]
+    else:
+        kbps = audio_kbps(file_format, quality_kbps)
+    return int(duration * kbps * 1000 / 8 * OVERHEAD)
+
+def audio_kbps(file_format, quality_kbps):
+    quality_kbps = normalize_quality(quality_kbps)
+    if quality_kbps != "0": return int(quality_kbps)
+    return DEFAULT_AUDIO_KBPS.get(file_format, 256)
+
+def plan_download(probe, file_format, quality_kbps, limit):
+    """
+    上限 limit に収まる設定を選びます。
+    戻り値は (音質, 動画の最大の高さ)。どうやっても入らないときは None
+    - 音声: 指定（おまかせなら想定値）の音質から、収まる一番高い音質まで下げる
+    - 動画: 再エンコードせずに済むよう、収まる一番高い解像度の形式を選ぶ
+            どれも入らなくても、後の補正エンコードで入る見込みがあれば最小解像度で通す
+    """
+    quality_kbps = normalize_quality(quality_kbps)
+    if probe is None: return quality_kbps, None
+    budget = limit * HEADROOM
+    duration = probe.get("duration")
+
+    if file_format == "mp4":
+        size = estimate_size(probe, file_format, quality_kbps)
+        if size is None or size <= budget: return quality_kbps, None
+        ladder = probe.get("video_ladder") or {}
+        for height in VIDEO_LADDER:
+            ladder_size = ladder.get(str(height))
+            if ladder_size and ladder_size * OVERHEAD <= budget:
+                return quality_kbps, height
+        if duration and budget * 8 / duration / 1000 >= MIN_VIDEO_KBPS:
+            return quality_kbps, VIDEO_LADDER[-1]
+        return None
+
+    if file_format in LOSSLESS_KBPS:
+        size = estimate_size(probe, file_format, quality_kbps)
+        return (quality_kbps, None) if size is None or size <= budget else None
+
+    if not duration: return quality_kbps, None
+    requested = audio_kbps(file_format, quality_kbps)
+    for kbps in [requested] + [k for k in AUDIO_LADDER if k < requested]:
+        if duration * kbps * 1000 / 8 * OVERHEAD <= budget:
+            return (quality_kbps if kbps == requested else str(kbps)), None
+    return None
+
+class ProbeCache:
+    """URL（正規化済み）と 動画/音声 の別ごとに下見結果を ttl 秒だけ覚えておきます。"""
+    def __init__(self, ttl=1800, max_entries=512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}   # キー -> (保存時刻, 結果)
+
+    @staticmethod
+    def _key(url, file_format):
+        return (dl_cache.source_key(url), "video" if file_format == "mp4" else "audio")
+
+    def get(self, url, file_format):
+        item = self._entries.get(self._key(url, file_format))
+        if item is not None and time.monotonic() - item[0] > self.ttl:
+            del self._entries[self._key(url, file_format)]
+            item = None
+        metrics.CACHE_REQUESTS.inc(cache="probe", result="miss" if item is None else "hit")
+        return None if item is None else item[1]
+
+    def put(self, url, file_format, probe):
+        if len(self._entries) >= self.max_entries:
+            # 一番古いものから捨てる（dict は挿入順）
+            del self._entries[next(iter(self._entries))]
+        self._entries[self._key(url, file_format)] = (time.monotonic(), probe)
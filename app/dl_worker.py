@@ -0,0 +1,373 @@
+# dl_worker.py
+# ダウンロード用の子プロセス（dl_engine から起動される。単体で実行はしない）
+# 親とは標準入出力で1行1JSONのやりとりをする:
+#   親 → 子: {"id": 1, "func": "download", "args": [...]}
+#   子 → 親: {"id": 1, "type": "result", "result": ...} / {"id": 1, "type": "error", ...}
+#            途中経過は {"id": 1, "type": "progress", "phase": ..., ...}
+import contextlib
+import json
+import os
+import re
+import sys
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+import config
+
+# 途中経過の送信間隔（秒）。段階が変わったときは間隔に関係なく送る
+PROGRESS_INTERVAL = 0.5
+
+class ProgressReporter:
+    """yt-dlp の progress_hooks / postprocessor_hooks を受けて、間引きながら親へ送ります。"""
+    def __init__(self, send):
+        self.send = send
+        self.phase = None
+        self.last = 0.0
+
+    def emit(self, phase, **fields):
+        now = time.monotonic()
+        if phase == self.phase and now - self.last < PROGRESS_INTERVAL: return
+        self.phase, self.last = phase, now
+        self.send({"type": "progress", "phase": phase, **fields})
+
+    def on_download(self, d):
+        if d["status"] == "downloading":
+            total = d.get("total_bytes") or d.get("total_bytes_estimate")
+            done = d.get("downloaded_bytes") or 0
+            self.emit("download", percent=(done * 100 / total) if total else None,
+                      speed=d.get("speed"), eta=d.get("eta"))
+        elif d["status"] == "finished":
+            self.emit("downloaded")
+
+    def on_postprocess(self, d):
+        if d["status"] == "started":
+            self.emit("postprocess", step=d.get("postprocessor"))
+
+# 実行中のジョブの途中経過の送り先（main() がジョブごとに差し替える）
+_progress = ProgressReporter(lambda message: None)
+
+# yt-dlp の形式指定（音声 / mp4）
+AUDIO_FORMAT = 'bestaudio/best'
+VIDEO_FORMAT = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+
+# タグ・カバー画像は tagging でまとめて1回で書くので、yt-dlp 側ではサムネイルを jpg にするだけ
+# （FFmpegMetadata / EmbedThumbnail はそれぞれファイル全体を書き直すので使わない）
+THUMBNAIL_TO_JPG = {'key': 'FFmpegThumbnailsConvertor', 'format': 'jpg', 'when': 'before_dl'}
+
+# 補正エンコードで使うコーデック
+AUDIO_CODECS = {"mp3": "libmp3lame", "m4a": "aac", "aac": "aac", "opus": "libopus", "ogg": "libvorbis", "vorbis": "libvorbis"}
+# 補正エンコードでは上限のこの割合を狙う
+SHRINK_TARGET = 0.92
+
+def video_format(max_height=None):
+    if not max_height: return VIDEO_FORMAT
+    h = f"[height<={max_height}]"
+    return f'bestvideo[ext=mp4]{h}+bestaudio[ext=m4a]/best[ext=mp4]{h}/best{h}/worst'
+
+def base_options(file_format):
+    """probe と download で同じ形式が選ばれるよう、共通のオプションをここで作ります。"""
+    # 強力な単一ファイル制限オプション
+    return {
+        'nocheckcertificate': True,
+        'quiet': True,
+        'extractor_args': {'youtube': {'player_client': ['default']}},
+        # --- 複数ファイル・プレイリスト対策 ---
+        'noplaylist': True,            # プレイリスト全体を無視
+        'playlist_items': '1',         # 最初の1項目のみ指定
+        'ignoreerrors': False,         # 1つ失敗したら即終了（次を探さない）
+        'no_entries': False,
+        # ------------------------------------
+        'format': VIDEO_FORMAT if file_format == "mp4" else AUDIO_FORMAT,
+    }
+
+# --- 使い回す YoutubeDL（オプションの組み合わせ＝プロファイルごとに1つ） ---
+# 作るたびに抽出器の登録やオプションの解釈が走るので、同じ組み合わせは作成済みのものを使う
+MAX_INSTANCES = 8
+_instances = OrderedDict()
+
+@contextlib.contextmanager
+def warm_ydl(profile, build_options):
+    ydl = _instances.get(profile)
+    if ydl is None:
+        import yt_dlp
+        options = build_options()
+        # フックはジョブごとに差し替わる _progress に転送する
+        options['progress_hooks'] = [lambda d: _progress.on_download(d)]
+        options['postprocessor_hooks'] = [lambda d: _progress.on_postprocess(d)]
+        ydl = _instances[profile] = yt_dlp.YoutubeDL(options)
+        while len(_instances) > MAX_INSTANCES:
+            _instances.popitem(last=False)[1].close()
+    _instances.move_to_end(profile)
+    try:
+        yield ydl
+    except BaseException:
+        # 途中で失敗したインスタンスは状態が怪しいので捨てる
+        _instances.pop(profile, None)
+        ydl.close()
+        raise
+
+def set_outtmpl(ydl, template):
+    ydl.params['outtmpl']['default'] = template
+
+def title_options():
+    return {'quiet': True, 'extract_flat': True, 'force_generic_extractor': False}
+
+def warm_up():
+    """起動直後に、よく使うプロファイルと YouTube の抽出器を用意しておきます。"""
+    for profile, build in [
+        (("probe", "audio"), lambda: base_options("audio")),
+        (("probe", "mp4"), lambda: base_options("mp4")),
+        (("title",), title_options),
+        (("download", "mp3", "0", None), lambda: download_options("mp3", "0", None)),
+    ]:
+        with warm_ydl(profile, build) as ydl:
+            ydl.get_info_extractor('Youtube')
+
+def first_entry(info):
+    # プレイリスト形式でデータが返ってきた場合でも最初の1つだけを参照
+    if 'entries' in info:
+        return next(iter(info['entries']))
+    return info
+
+def probe(url, file_format):
+    """ダウンロードせずに情報だけ取り、出力サイズの見積もりに使う値を返します。"""
+    kind = "mp4" if file_format == "mp4" else "audio"
+    with warm_ydl(("probe", kind), lambda: base_options(kind)) as ydl:
+        info = first_entry(ydl.extract_info(url, download=False))
+
+    # 実際に選ばれる形式（動画+音声の結合なら両方）のサイズを足す
+    selected = info.get('requested_formats') or [info]
+    sizes = [f.get('filesize') or f.get('filesize_approx') for f in selected]
+    bitrates = [f.get('tbr') or f.get('abr') for f in selected]
+    # 解像度ごとの見込みサイズ（上限に入らないとき、どこまで下げればよいかの判断用）
+    duration = info.get('duration') or 0
+    def fmt_size(f):
+        size = f.get('filesize') or f.get('filesize_approx')
+        if not size and f.get('tbr') and duration:
+            size = f['tbr'] * 1000 / 8 * duration
+        return size
+    formats = info.get('formats') or []
+    audio = [fmt_size(f) for f in formats if f.get('ext') == 'm4a' and f.get('vcodec') == 'none' and fmt_size(f)]
+    ladder = {}
+    if audio:
+        for height in (1080, 720, 480, 360, 240, 144):
+            videos = [fmt_size(f) for f in formats
+                      if f.get('ext') == 'mp4' and f.get('acodec') == 'none' and (f.get('height') or 0) <= height and fmt_size(f)]
+            if videos:
+                ladder[str(height)] = max(videos) + max(audio)
+
+    return {
+        "video_ladder": ladder,
+        "title": info.get('title'),
+        "uploader": info.get('uploader'),
+        "duration": info.get('duration'),
+        "extractor": info.get('extractor_key'),
+        "id": info.get('id'),
+        "source_bytes": sum(sizes) if all(sizes) else None,
+        "source_kbps": sum(bitrates) if all(bitrates) else None,
+    }
+
+def media_duration(path):
+    from mutagen import File
+    media = File(path)
+    return media.info.length if media is not None and media.info else None
+
+def shrink(path, file_format, limit):
+    """上限を超えたファイルを、長さから逆算したビットレートで1回だけ再エンコードします。"""
+    import subprocess
+    duration = media_duration(path)
+    if not duration: raise ValueError("cannot read duration")
+    total_kbps = int(limit * SHRINK_TARGET * 8 / duration / 1000)
+    tmp_path = f"{path}.shrink.{file_format}"
+    if file_format == "mp4":
+        audio_kbps = 96
+        video_kbps = max(total_kbps - audio_kbps, 50)
+        codec_args = ['-c:v', 'libx264', '-preset', 'veryfast', '-b:v', f'{video_kbps}k', '-maxrate', f'{video_kbps}k',
+                      '-bufsize', f'{video_kbps * 2}k', '-c:a', 'aac', '-b:a', f'{audio_kbps}k', '-movflags', '+faststart']
+    elif file_format in AUDIO_CODECS:
+        # カバー画像（映像ストリーム）はそのままコピー
+        codec_args = ['-c:a', AUDIO_CODECS[file_format], '-b:a', f'{max(total_kbps, 32)}k', '-c:v', 'copy']
+    else:
+        raise ValueError(f"cannot shrink {file_format}")
+    _progress.emit("shrink")
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', path, '-map', '0', '-map_metadata', '0', *codec_args, tmp_path],
+                   check=True, stdin=subprocess.DEVNULL)
+    os.replace(tmp_path, path)
+    return {"file_path": path, "size": os.path.getsize(path), "kbps": total_kbps}
+
+def download_options(file_format, quality_kbps, max_height):
+    ydl_opts = base_options(file_format)
+    ydl_opts.update({
+        'writethumbnail': True,
+        # 変換・補正エンコードで小さくできるので、元ファイルは上限より大きくても受け取る
+        'max_filesize': config.DL_MAX_SOURCE_SIZE,
+    })
+    if file_format == "mp4":
+        ydl_opts.update({
+            'format': video_format(max_height),
+            'merge_output_format': 'mp4',
+            'postprocessors': [THUMBNAIL_TO_JPG],
+        })
+    else:
+        pp = [{'key': 'FFmpegExtractAudio', 'preferredcodec': file_format}, THUMBNAIL_TO_JPG]
+        if quality_kbps != "0": pp[0]['preferredquality'] = quality_kbps
+        ydl_opts['postprocessors'] = pp
+    return ydl_opts
+
+def thumbnail_path(info):
+    """書き出されたサムネイル（カバー画像）のパス。無ければ None"""
+    for thumb in reversed(info.get('thumbnails') or []):
+        if thumb.get('filepath') and os.path.exists(thumb['filepath']):
+            return thumb['filepath']
+    return None
+
+def download(url, file_format, quality_kbps, max_height=None, out_dir=None):
+    import tagging
+    import utils
+
+    unique_id = str(uuid.uuid4())
+    save_path_tmpl = os.path.join(out_dir or config.DOWNLOAD_DIR, f"{unique_id}_%(title)s.%(ext)s")
+
+    profile = ("download", file_format, quality_kbps, max_height)
+    with warm_ydl(profile, lambda: download_options(file_format, quality_kbps, max_height)) as ydl:
+        set_outtmpl(ydl, save_path_tmpl)
+        # 情報を抽出（download=Trueで実処理）
+        info = ydl.extract_info(url, download=True)
+        target_data = first_entry(info)
+
+        raw_fname = ydl.prepare_filename(target_data)
+        base, _ = os.path.splitext(raw_fname)
+        final_path = f"{base}.{file_format}"
+
+        # メタデータ処理
+        raw_title = target_data.get('title', 'Unknown')
+        clean_title = utils.sanitize_filename(raw_title)
+        display_name = f"{clean_title}.{file_format}"
+
+        if os.path.exists(final_path):
+            _progress.emit("tagging")
+            tagging.write_tags(final_path, title=raw_title, artist=target_data.get('uploader'), album=raw_title,
+                               cover=thumbnail_path(target_data))
+
+        return {"file_path": final_path, "display_name": display_name}
+
+# --- まとめてダウンロード用（取得・変換・タグ付けを別々のジョブにして流れ作業にする） ---
+LOSSLESS_CODECS = {"flac": "flac", "wav": "pcm_s16le"}
+
+def playlist(url, limit):
+    """プレイリストの中身（URLとタイトル）だけを先頭から limit 件返します。単体URLなら1件"""
+    opts = lambda: {'quiet': True, 'nocheckcertificate': True, 'extract_flat': 'in_playlist', 'playlistend': limit}
+    with warm_ydl(("playlist", limit), opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if 'entries' not in info:
+        return [{"url": url, "title": info.get('title')}]
+    entries = []
+    for entry in list(info['entries'])[:limit]:
+        if not entry: continue
+        entry_url = entry.get('webpage_url') or entry.get('url')
+        if entry_url:
+            entries.append({"url": entry_url, "title": entry.get('title')})
+    return entries
+
+def fetch(url, out_dir=None):
+    """変換なしで音声だけを取ってきます。"""
+    def options():
+        ydl_opts = base_options("audio")
+        ydl_opts.update({'max_filesize': config.DL_MAX_SOURCE_SIZE, 'writethumbnail': True, 'postprocessors': [THUMBNAIL_TO_JPG]})
+        return ydl_opts
+    with warm_ydl(("fetch",), options) as ydl:
+        set_outtmpl(ydl, os.path.join(out_dir or config.DOWNLOAD_DIR, f"{uuid.uuid4()}_src.%(ext)s"))
+        info = first_entry(ydl.extract_info(url, download=True))
+        path = (info.get('requested_downloads') or [{}])[0].get('filepath') or ydl.prepare_filename(info)
+    return {"path": path, "title": info.get('title') or 'Unknown', "uploader": info.get('uploader'),
+            "album": info.get('album') or info.get('playlist_title'), "duration": info.get('duration'),
+            "cover": thumbnail_path(info)}
+
+def transcode(path, file_format, quality_kbps):
+    """取得した音声を指定の形式に変換し、元ファイルは消します。"""
+    import subprocess
+    out_path = f"{os.path.splitext(path)[0]}.{file_format}"
+    if out_path == path:
+        out_path = f"{os.path.splitext(path)[0]}_out.{file_format}"
+    if file_format in LOSSLESS_CODECS:
+        codec_args = ['-c:a', LOSSLESS_CODECS[file_format]]
+    elif file_format in AUDIO_CODECS:
+        codec_args = ['-c:a', AUDIO_CODECS[file_format]]
+        if quality_kbps != "0": codec_args += ['-b:a', f'{quality_kbps}k']
+        elif file_format == "mp3": codec_args += ['-q:a', '0']
+    else:
+        raise ValueError(f"unsupported format {file_format}")
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', path, '-vn', *codec_args, out_path],
+                   check=True, stdin=subprocess.DEVNULL)
+    os.remove(path)
+    return {"path": out_path, "size": os.path.getsize(out_path)}
+
+def title(url):
+    """ページのタイトルだけを取ります（ブックマーク用）。"""
+    with warm_ydl(("title",), title_options) as ydl:
+        info = ydl.extract_info(url, download=False)
+    return info.get('title')
+
+def tag(path, meta):
+    import tagging
+    return tagging.write_tags(path, **meta)
+
+# _VALID_URL の中のドメイン部分（youtube\.com など）。index\.php のようなファイル名は除く
+DOMAIN_IN_PATTERN = re.compile(r'(?<![\w/\\-])(?:[a-z0-9-]+\\\.)+[a-z]{2,}(?![\w\\])')
+FILE_SUFFIXES = {"html", "htm", "php", "json", "xml", "js", "asp", "aspx", "jsp", "cfm", "mp4", "mp3", "m3u8"}
+
+def domains():
+    """yt-dlp の抽出器が対応しているドメインの一覧（generic は除く）。"""
+    from yt_dlp.extractor import gen_extractor_classes
+    found = set()
+    for ie in gen_extractor_classes():
+        if ie.ie_key() == 'Generic': continue
+        patterns = ie._VALID_URL if isinstance(ie._VALID_URL, (list, tuple)) else [ie._VALID_URL]
+        for pattern in patterns:
+            if not isinstance(pattern, str): continue
+            for match in DOMAIN_IN_PATTERN.finditer(pattern):
+                domain = match.group(0).replace('\\.', '.')
+                if domain.rsplit(".", 1)[1] not in FILE_SUFFIXES: found.add(domain)
+    return sorted(found)
+
+JOBS = {
+    "probe": probe,
+    "download": download,
+    "shrink": shrink,
+    "playlist": playlist,
+    "fetch": fetch,
+    "transcode": transcode,
+    "tag": tag,
+    "title": title,
+    "domains": domains,
+}
+
+def main():
+    # 標準出力は親との通信専用にして、ライブラリの print は標準エラーへ逃がす
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8", buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def send(message):
+        channel.write(json.dumps(message, ensure_ascii=False) + "\n")
+
+    global _progress
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"[Worker] Warm-up failed: {e}", file=sys.stderr)
+
+    for line in sys.stdin:
+        if not line.strip(): continue
+        request = json.loads(line)
+        job_id = request["id"]
+        _progress = ProgressReporter(lambda message, job_id=job_id: send({"id": job_id, **message}))
+        try:
+            result = JOBS[request["func"]](*request.get("args", []))
+            send({"id": job_id, "type": "result", "result": result})
+        except Exception as e:
+            send({"id": job_id, "type": "error", "error": type(e).__name__, "message": str(e), "traceback": traceback.format_exc()})
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
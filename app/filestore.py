@@ -0,0 +1,139 @@
+# filestore.py
+# ファイルの読み書きを専用の I/O スレッド1本にまとめる（イベントループ上でディスクに触れない）
+# - 書き込みはすべて同じスレッドで順番に行うので、同じファイルへの書き込みが混ざらない
+# - まだ始まっていない書き込みに同じファイルの書き込みが来たら、新しい内容に差し替えて1回にまとめる
+# - 一時ファイルに書いて fsync してから rename するので、途中で落ちても元のファイルは壊れない
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+def atomic_write(path, data):
+    """data（bytes）を path に原子的に書き込みます。"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+    # rename をディスクに残す（対応していない環境では諦める）
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try: os.fsync(dir_fd)
+        finally: os.close(dir_fd)
+    except OSError:
+        pass
+
+def read_bytes(path):
+    if not os.path.exists(path): return None
+    with open(path, "rb") as f:
+        return f.read()
+
+def dump_json(data, indent=4):
+    return json.dumps(data, ensure_ascii=False, indent=indent).encode("utf-8")
+
+def parse_json(path, data, default=None):
+    if data is None: return default
+    try:
+        return json.loads(data)
+    except ValueError as e:
+        print(f"[FileStore] Broken JSON in {path}: {e}")
+        return default
+
+class FileStore:
+    """
+    - write_*(): 内容をその場で bytes にしてから（呼び出し後に data を書き換えても影響しない）I/O スレッドに渡す
+    - read_*(): 同じスレッドで読むので、先に頼んだ書き込みの結果が読める
+    - flush_all(): 終了時に、頼まれている書き込みがすべて終わるまで待つ
+    """
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="filestore")
+        self._lock = threading.Lock()
+        self._pending = {}   # パス -> (内容, Future)（まだ I/O スレッドが手を付けていない書き込み）
+        self._inflight = set()
+        self.stats = {"writes": 0, "coalesced": 0, "bytes": 0}
+
+    def _submit_write(self, path, data):
+        key = os.path.abspath(path)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                # 順番待ちの書き込みの内容だけ差し替える
+                self._pending[key] = (data, pending[1])
+                self.stats["coalesced"] += 1
+                return pending[1]
+            future = self._executor.submit(self._write, key)
+            self._pending[key] = (data, future)
+            self._inflight.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._inflight.discard(future)
+
+    def _write(self, key):
+        with self._lock:
+            data, _ = self._pending.pop(key)
+        atomic_write(key, data)
+        self.stats["writes"] += 1
+        self.stats["bytes"] += len(data)
+
+    # --- 書き込み ---
+    def write_bytes(self, path, data):
+        """書き込みを頼みます。await すると書き終わるまで待てます（待たなくても書かれます）。"""
+        return asyncio.wrap_future(self._submit_write(path, data))
+
+    def write_text(self, path, text):
+        return self.write_bytes(path, text.encode("utf-8"))
+
+    def write_json(self, path, data, indent=4):
+        return self.write_bytes(path, dump_json(data, indent))
+
+    def write_json_sync(self, path, data, indent=4):
+        """イベントループの外（起動前・スクリプト）から書き込んで、終わるまで待ちます。"""
+        self._submit_write(path, dump_json(data, indent)).result()
+
+    # --- 読み込み ---
+    async def read_bytes(self, path):
+        return await asyncio.wrap_future(self._executor.submit(read_bytes, path))
+
+    async def read_text(self, path, default=None):
+        data = await self.read_bytes(path)
+        return default if data is None else data.decode("utf-8")
+
+    async def read_json(self, path, default=None):
+        return parse_json(path, await self.read_bytes(path), default)
+
+    def read_json_sync(self, path, default=None):
+        """起動時の読み込み用。頼まれている書き込みの後に読みます。"""
+        return parse_json(path, self._executor.submit(read_bytes, path).result(), default)
+
+    # --- 終了 ---
+    async def flush_all(self):
+        with self._lock:
+            futures = list(self._inflight)
+        for future in futures:
+            try:
+                await asyncio.wrap_future(future)
+            except Exception as e:
+                print(f"[FileStore] Write failed: {e}")
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = FileStore()
+    return _store
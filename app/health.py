@@ -0,0 +1,110 @@
+# health.py
+# Bot と同じイベントループで動く HTTP サーバー（/healthz: 生存確認、/metrics: Prometheus）
+# ループが固まれば応答も止まるので、Koyeb のヘルスチェックがそのまま異常を検知できる
+import asyncio
+import json
+import time
+import loop_monitor
+import metrics
+
+class HealthServer:
+    """
+    /healthz の判定（どれか1つでも当てはまれば 503）
+    - ゲートウェイから max_disconnect 秒より長く切れている（再接続中の短い切断は許す）
+    - ハートビートの遅延が max_latency 秒を超えている
+    - 直近のループの遅れが max_loop_lag 秒を超えている
+    起動してから最初に繋がるまでは startup_grace 秒だけ 200（starting）を返します。
+    """
+    def __init__(self, bot, host="0.0.0.0", port=8000, max_disconnect=60.0, max_latency=10.0,
+                 max_loop_lag=5.0, startup_grace=180.0, monitor=None):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.max_disconnect = max_disconnect
+        self.max_latency = max_latency
+        self.max_loop_lag = max_loop_lag
+        self.startup_grace = startup_grace
+        self.started = time.monotonic()
+        self.connected = False
+        self.ever_connected = False
+        self.disconnected_since = self.started
+        # ループの遅れは loop_monitor のハートビートで測ったもの（起動は main で）
+        self.monitor = monitor or loop_monitor.get_monitor()
+        self._server = None
+        metrics.GATEWAY_LATENCY.set_function(self._latency)
+        bot.add_listener(self._on_connect, "on_connect")
+        bot.add_listener(self._on_connect, "on_resumed")
+        bot.add_listener(self._on_disconnect, "on_disconnect")
+
+    async def _on_connect(self):
+        self.connected = True
+        self.ever_connected = True
+        self.disconnected_since = None
+
+    async def _on_disconnect(self):
+        if self.connected:
+            self.connected = False
+            self.disconnected_since = time.monotonic()
+
+    def _latency(self):
+        latency = self.bot.latency
+        return None if latency != latency or latency == float("inf") else latency
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"[System] Health check server started on port {self.port}")
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def status(self):
+        """(正常か, 詳細の dict) を返します。"""
+        now = time.monotonic()
+        latency = self._latency()
+        loop_lag = self.monitor.max_recent()
+        problems = []
+        if not self.connected:
+            down = now - self.disconnected_since
+            if self.ever_connected or now - self.started > self.startup_grace:
+                if down > self.max_disconnect: problems.append(f"gateway disconnected for {down:.0f}s")
+        if latency is not None and latency > self.max_latency:
+            problems.append(f"heartbeat latency {latency:.1f}s")
+        if loop_lag > self.max_loop_lag:
+            problems.append(f"event loop lag {loop_lag:.1f}s")
+        state = "ok" if self.connected else ("reconnecting" if self.ever_connected else "starting")
+        if problems: state = "unhealthy"
+        return not problems, {
+            "status": state,
+            "gateway": "connected" if self.connected else "disconnected",
+            "latency": latency,
+            "loop_lag": round(loop_lag, 4),
+            "uptime": round(now - self.started),
+            "problems": problems,
+        }
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            # ヘッダーは読み捨てる
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if line in (b"\r\n", b"\n", b""): break
+            parts = request.decode("latin-1").split()
+            path = parts[1].split("?")[0] if len(parts) >= 2 else "/"
+            if path == "/metrics":
+                code, body, ctype = 200, metrics.render(), "text/plain; version=0.0.4; charset=utf-8"
+            elif path in ("/", "/healthz"):
+                healthy, detail = self.status()
+                code, body, ctype = (200 if healthy else 503), json.dumps(detail, ensure_ascii=False), "application/json"
+            else:
+                code, body, ctype = 404, "not found", "text/plain"
+            data = body.encode("utf-8")
+            reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}[code]
+            writer.write(f"HTTP/1.1 {code} {reason}\r\nContent-Type: {ctype}\r\nContent-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, UnicodeDecodeError):
+            pass
+        finally:
+            writer.close()
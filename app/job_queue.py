@@ -0,0 +1,151 @@
+# job_queue.py
+# ユーザーごとに順番を回す公平なジョブキュー（先着順 + ラウンドロビン）
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+class QueueFull(Exception):
+    """受付できないときに投げます。reason は "backlog"（全体が満杯）か "user"（その人の分が満杯）"""
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+class Job:
+    def __init__(self, user_id, run, on_position=None):
+        self.user_id = user_id
+        self.run = run                  # async def run(job)
+        self.on_position = on_position  # async def on_position(job, 順番, 目安秒) 待ち順が変わったとき
+        self.task = None
+        self.cancelled = False
+        self.position = None
+        self.enqueued_at = time.monotonic()
+
+class FairJobQueue:
+    """
+    - 同じ人が何件積んでも、実行は「Aさん→Bさん→Cさん→Aさん…」の順に回す
+    - 待ち件数は max_backlog 件、1人あたりは（実行中を含め）max_per_user 件まで
+    - 実行時間の移動平均から、待ち順に応じた目安時間を出す
+    """
+    def __init__(self, workers=2, max_backlog=20, max_per_user=2, initial_estimate=30.0):
+        self.workers = workers
+        self.max_backlog = max_backlog
+        self.max_per_user = max_per_user
+        self.avg_duration = initial_estimate
+        self._waiting = OrderedDict()   # user_id -> deque[Job]（先頭の人から順に1件ずつ取る）
+        self._running = set()
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    # --- 状態 ---
+    def backlog(self):
+        return sum(len(q) for q in self._waiting.values())
+
+    def running(self):
+        return len(self._running)
+
+    def user_jobs(self, user_id):
+        return len(self._waiting.get(user_id, ())) + sum(1 for j in self._running if j.user_id == user_id)
+
+    def check(self, user_id):
+        """受付できるなら None、できないなら理由を返します。"""
+        if self.user_jobs(user_id) >= self.max_per_user: return "user"
+        if self.backlog() >= self.max_backlog: return "backlog"
+        return None
+
+    def _order(self):
+        """今のまま取り出した場合の実行順（ラウンドロビン）で待ちジョブを並べます。"""
+        queues = [list(q) for q in self._waiting.values()]
+        order, depth = [], 0
+        while True:
+            layer = [q[depth] for q in queues if depth < len(q)]
+            if not layer: return order
+            order.extend(layer)
+            depth += 1
+
+    def eta(self, position):
+        # 空いている枠があればすぐ、なければ前に並ぶ数 ÷ 並列数 ぶんの回数待つ
+        free = max(0, self.workers - len(self._running))
+        if position < free: return 0.0
+        return ((position - free) // self.workers + 1) * self.avg_duration
+
+    # --- 操作 ---
+    def submit(self, job):
+        """ジョブを積んで待ち順（0始まり）を返します。受付できなければ QueueFull"""
+        reason = self.check(job.user_id)
+        if reason: raise QueueFull(reason)
+        self._waiting.setdefault(job.user_id, deque()).append(job)
+        self._wakeup.set()
+        order = self._order()
+        job.position = order.index(job)
+        # 新しい人のジョブは、同じ人が何件も積んでいる列の途中に割り込むので、後ろにずれた人にも知らせる
+        self._notify()
+        return job.position
+
+    def cancel(self, job):
+        """待ち中なら取り除き、実行中なら止めます。"""
+        job.cancelled = True
+        queue = self._waiting.get(job.user_id)
+        if queue and job in queue:
+            queue.remove(job)
+            if not queue: del self._waiting[job.user_id]
+            self._notify()
+            return True
+        if job.task and not job.task.done():
+            job.task.cancel()
+            return True
+        return False
+
+    def _pop(self):
+        user_id, queue = next(iter(self._waiting.items()))
+        job = queue.popleft()
+        # 取り出した人は列の最後尾に回す
+        del self._waiting[user_id]
+        if queue: self._waiting[user_id] = queue
+        return job
+
+    def _notify(self):
+        for position, job in enumerate(self._order()):
+            if job.position == position or job.on_position is None: continue
+            job.position = position
+            asyncio.create_task(self._safe_notify(job, position))
+
+    async def _safe_notify(self, job, position):
+        try:
+            await job.on_position(job, position, self.eta(position))
+        except Exception as e:
+            print(f"[Queue] Failed to update position: {e}")
+
+    # --- ワーカー ---
+    def start(self):
+        if self._tasks: return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for job in list(self._running):
+            if job.task: job.task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            while not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            job = self._pop()
+            self._notify()
+            self._running.add(job)
+            started = time.monotonic()
+            job.task = asyncio.create_task(job.run(job))
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                # ジョブだけが止められた場合はワーカーは続ける
+                if not job.task.cancelled(): raise
+            except Exception as e:
+                print(f"[Queue] Job failed: {e}")
+            finally:
+                self._running.discard(job)
+            if not job.cancelled:
+                self.avg_duration = self.avg_duration * 0.8 + (time.monotonic() - started) * 0.2
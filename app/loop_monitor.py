@@ -0,0 +1,176 @@
+# loop_monitor.py
+# イベントループの遅れの計測と、ループを止めている処理の特定
+# - ループ側: interval 秒ごとに起きて「予定より何秒遅れたか」を記録する（ハートビート）
+# - 見張りスレッド: ハートビートが threshold 秒以上途切れたら、ループのスレッドのスタックを取る
+#   止まっている間は sample_interval ごとに取り続け、再開したら1件の「詰まり」としてまとめる
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+import config
+import metrics
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+COGS_DIR = os.path.join(APP_DIR, "cogs")
+
+class Block:
+    """ループが止まっていた1回分"""
+    def __init__(self, started, duration, cog, handler, site, samples):
+        self.started = started      # time.time()
+        self.duration = duration    # 秒
+        self.cog = cog              # Cog のクラス名（Cog の外なら "-"）
+        self.handler = handler      # 一番外側のアプリ側の関数（コード オブジェクト）か、その名前
+        self.site = site            # 一番内側のアプリ側の行（ファイル:行 関数）
+        self.samples = samples
+
+def _in_app(filename):
+    return filename.startswith(APP_DIR)
+
+def attribute(frame):
+    """
+    スタックから (Cog 名, ハンドラー, 場所) を決めます。
+    ハンドラーは一番外側の cogs/ の関数（なければ一番外側のアプリ側の関数）、
+    場所は一番内側のアプリ側の行（なければライブラリの一番内側の行）です。
+    """
+    site = handler = None
+    cog = "-"
+    innermost = frame
+    while frame is not None:
+        code = frame.f_code
+        if _in_app(code.co_filename):
+            if site is None:
+                site = f"{os.path.relpath(code.co_filename, APP_DIR)}:{frame.f_lineno} {code.co_name}"
+            if code.co_filename.startswith(COGS_DIR):
+                handler = code
+                qualname = getattr(code, "co_qualname", code.co_name)
+                cog = qualname.split(".")[0] if "." in qualname else os.path.basename(code.co_filename)[:-3]
+            elif cog == "-":
+                handler = code
+        frame = frame.f_back
+    if site is None:
+        code = innermost.f_code
+        site = f"{os.path.basename(code.co_filename)}:{innermost.f_lineno} {code.co_name}"
+        handler = "(library)"
+    return cog, handler, site
+
+class LoopMonitor:
+    def __init__(self, threshold=0.25, interval=0.1, sample_interval=0.05, window=10.0, history=50):
+        self.threshold = threshold
+        self.interval = interval
+        self.sample_interval = sample_interval
+        self.window = window
+        self.lag = 0.0
+        self.started = time.time()
+        self.blocks = deque(maxlen=history)   # 最近の詰まり
+        self.offenders = {}                   # (Cog 名, ハンドラー) -> {"total", "count", "max", "sites": Counter}
+        self.on_block = None                  # 詰まりが終わるたびにループ側で呼ばれる（ログチャンネル通知用）
+        self._recent = deque()                # (ループ時刻, 遅れ)
+        self._beat = time.monotonic()
+        self._finished = deque()              # 見張りスレッド → ループ側への受け渡し
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._loop_thread = None
+
+    def start(self):
+        if self._task is not None: return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task: self._task.cancel()
+        self._task = None
+
+    # --- ループ側 ---
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            self._beat = time.monotonic()
+            self.lag = max(0.0, now - expected)
+            self._recent.append((now, self.lag))
+            while self._recent[0][0] < now - self.window:
+                self._recent.popleft()
+            metrics.LOOP_LAG.set(self.lag)
+            while self._finished:
+                self._record(self._finished.popleft())
+
+    def max_recent(self):
+        return max((lag for _, lag in self._recent), default=self.lag)
+
+    def _record(self, block):
+        self.blocks.append(block)
+        entry = self.offenders.setdefault((block.cog, block.handler), {"total": 0.0, "count": 0, "max": 0.0, "sites": Counter()})
+        entry["total"] += block.duration
+        entry["count"] += 1
+        entry["max"] = max(entry["max"], block.duration)
+        entry["sites"][block.site] += 1
+        metrics.LOOP_BLOCKS.inc(cog=block.cog)
+        metrics.LOOP_BLOCK_SECONDS.observe(block.duration)
+        if self.on_block:
+            try: self.on_block(block)
+            except Exception as e: print(f"[LoopMonitor] Report error: {e}")
+
+    def worst(self, n=5):
+        """止めていた時間の合計が長い順に (Cog 名, ハンドラー, 集計) を返します。"""
+        items = sorted(self.offenders.items(), key=lambda kv: kv[1]["total"], reverse=True)
+        return [(cog, handler, entry) for (cog, handler), entry in items[:n]]
+
+    # --- 見張りスレッド側 ---
+    def _watch(self):
+        samples = []
+        last_beat = None
+        while not self._stop.wait(self.sample_interval):
+            beat = self._beat
+            if time.monotonic() - beat - self.interval > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    samples.append(attribute(frame))
+                last_beat = beat
+            elif samples and beat != last_beat:
+                # 再開した: 止まっていたのは「前のハートビートの予定時刻」から「次のハートビート」まで
+                self._finished.append(self._summarize(samples, beat - last_beat - self.interval))
+                samples = []
+
+    def _summarize(self, samples, duration):
+        (cog, handler), _ = Counter((cog, handler) for cog, handler, _ in samples).most_common(1)[0]
+        site = Counter(s for c, h, s in samples if (c, h) == (cog, handler)).most_common(1)[0][0]
+        return Block(time.time() - duration, duration, cog, handler, site, len(samples))
+
+_monitor = None
+
+def get_monitor():
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopMonitor(threshold=config.LOOP_BLOCK_THRESHOLD)
+    return _monitor
+
+def handler_name(bot, handler):
+    """ハンドラーのコード オブジェクトを、分かればコマンド名（/dl, !sync）に直します。"""
+    if not hasattr(handler, "co_name"): return str(handler)
+    for command in bot.tree.walk_commands():
+        callback = getattr(command, "callback", None)
+        if callback is not None and callback.__code__ is handler:
+            return f"/{command.qualified_name}"
+    for command in bot.walk_commands():
+        if command.callback.__code__ is handler:
+            return f"!{command.qualified_name}"
+    return getattr(handler, "co_qualname", handler.co_name)
+
+def report_lines(bot, monitor, n=5):
+    lines = [f"lag {monitor.lag * 1000:.0f}ms (max {monitor.max_recent() * 1000:.0f}ms / {monitor.window:.0f}s), "
+             f"blocks ≥{monitor.threshold:.2f}s: {sum(e['count'] for e in monitor.offenders.values())}"]
+    for i, (cog, handler, entry) in enumerate(monitor.worst(n), 1):
+        site = entry["sites"].most_common(1)[0][0]
+        lines.append(f"{i}. {cog} {handler_name(bot, handler)}: total {entry['total']:.2f}s / "
+                     f"{entry['count']}x / max {entry['max']:.2f}s @ {site}")
+    return lines
@@ -1,37 +1,58 @@
 # main.py
+import startup  # 起動時間の計測の起点（一番最初に読み込む）
 import discord
 from discord.ext import commands
 import asyncio
 import os
 import config
+import storage
+import config_store
+import filestore
+import dl_engine
+import command_sync
+import health
+import loop_monitor
+import metrics
 import random
+import time
 from datetime import datetime
 
-# --- 追加: ヘルスチェック用サーバーのためのインポート ---
-import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
-
-# --- 追加: ヘルスチェック用サーバーの設定 ---
-class HealthCheckHandler(BaseHTTPRequestHandler):
-    """Koyebからの生存確認(GETリクエスト)に応答するクラス"""
-    def do_GET(self):
-        self.send_response(200) # 正常を意味する 200 を返す
-        self.end_headers()
-        self.wfile.write(b"Miyamoto-chan is online!")
-
-def run_health_server():
-    """別スレッドで実行するためのサーバー起動関数"""
-    # ポート番号は Dockerfile の EXPOSE で指定した 8000 に合わせます
-    server = HTTPServer(('0.0.0.0', 8000), HealthCheckHandler)
-    print("[System] Health check server started on port 8000")
-    server.serve_forever()
+startup.profile.phase("imports")
 
 # --- 既存の設定読み込み ---
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+class MaidBot(commands.Bot):
+    async def add_cog(self, cog, /, **kwargs):
+        # 拡張ごとの読み込み時間のうち、コマンド登録と cog_load の分を記録する
+        started = time.perf_counter()
+        try:
+            await super().add_cog(cog, **kwargs)
+        finally:
+            startup.profile.cog_loaded(cog.__module__, time.perf_counter() - started)
+
+    async def on_command_error(self, ctx, error):
+        if ctx.command:
+            record_command(ctx.command.qualified_name, "prefix", "error", ctx.message.created_at)
+        await super().on_command_error(ctx, error)
+
+# REST の件数・時間は aiohttp のトレースで数える
+bot = MaidBot(command_prefix="!", intents=intents, http_trace=metrics.rest_trace_config())
+
+def record_command(name, kind, status, invoked_at):
+    metrics.COMMANDS.inc(command=name, kind=kind, status=status)
+    metrics.COMMAND_SECONDS.observe((discord.utils.utcnow() - invoked_at).total_seconds(), kind=kind)
+
+default_tree_error = bot.tree.on_error
+
+async def on_tree_error(interaction, error):
+    name = interaction.command.qualified_name if interaction.command else "unknown"
+    record_command(name, "slash", "error", interaction.created_at)
+    await default_tree_error(interaction, error)
+
+bot.tree.on_error = on_tree_error
 
 EXTENSIONS = [
     "cogs.system",
@@ -50,9 +71,14 @@ async def on_ready():
     bot.tree.remove_command("say")
     bot.tree.remove_command("bm")
     
+    # 前回同期したときから変わっていなければ送らない（再接続のたびに同期しない）
     try:
-        synced = await bot.tree.sync()
-        print(f"🔄 Successfully synced {len(synced)} slash commands.")
+        synced = await command_sync.get_sync(bot.tree).sync([g.id for g in bot.guilds])
+        if synced:
+            for scope, count in synced.items():
+                print(f"🔄 Successfully synced {count} slash commands ({scope}).")
+        else:
+            print("🔄 Slash commands unchanged, skipped sync.")
     except Exception as e:
         print(f"⚠️ Failed to sync commands: {e}")
 
@@ -74,24 +100,52 @@ async def on_ready():
     
     print("------")
     print("宮本ちゃん、お仕事開始します！")
+    if startup.profile.ready():
+        print("[Startup] " + "\n[Startup] ".join(startup.profile.lines()))
+
+@bot.event
+async def on_app_command_completion(interaction, command):
+    record_command(command.qualified_name, "slash", "ok", interaction.created_at)
+
+@bot.event
+async def on_command_completion(ctx):
+    record_command(ctx.command.qualified_name, "prefix", "ok", ctx.message.created_at)
+
+async def load_extension(ext):
+    started = time.perf_counter()
+    try:
+        if ext in bot.extensions:
+            await bot.unload_extension(ext)
+        await bot.load_extension(ext)
+    except Exception as e:
+        startup.profile.extension(ext, time.perf_counter() - started, error=str(e))
+        print(f"❌ Failed to load {ext}: {e}")
+        return
+    startup.profile.extension(ext, time.perf_counter() - started)
+    print(f"✅ Loaded: {ext}")
 
 async def load_extensions():
-    for ext in EXTENSIONS:
-        try:
-            if ext in bot.extensions:
-                await bot.unload_extension(ext)
-            await bot.load_extension(ext)
-            print(f"✅ Loaded: {ext}")
-        except Exception as e:
-            print(f"❌ Failed to load {ext}: {e}")
+    # 拡張どうしは依存していないので、まとめて読み込む（cog_load の待ち時間が重なる）
+    await asyncio.gather(*(load_extension(ext) for ext in EXTENSIONS))
 
 async def main():
-    # ★ 追加: Bot起動前にヘルスチェックサーバーを別スレッドで開始
-    # これにより、Botが接続中であってもKoyebへの応答が可能になります
-    threading.Thread(target=run_health_server, daemon=True).start()
+    # ループの遅れの計測と、止めている処理の見張り（/healthz と !loopstats で使う）
+    monitor = loop_monitor.get_monitor()
+    monitor.start()
+
+    # Bot起動前にヘルスチェックサーバーを開始（同じイベントループで動く）
+    # 接続中でもKoyebに応答でき、ループが固まれば応答も止まります
+    health_server = health.HealthServer(bot, port=config.HEALTH_PORT, max_disconnect=config.HEALTH_MAX_DISCONNECT,
+                                        max_latency=config.HEALTH_MAX_LATENCY, max_loop_lag=config.HEALTH_MAX_LOOP_LAG, monitor=monitor)
+    await health_server.start()
+
+    # ブックマーク・ロール保持用DBを先に開いておく（初回はJSONから移行）
+    store = storage.get_store()
+    startup.profile.phase("storage")
 
     async with bot:
         await load_extensions()
+        startup.profile.phase("extensions")
         
         try:
             from cogs.database import RegistrationView
@@ -106,7 +160,16 @@ async def main():
         except Exception as e:
             print(f"ℹ️ Persistent views info: {e}")
 
-        await bot.start(config.TOKEN)
+        try:
+            await bot.start(config.TOKEN)
+        finally:
+            await health_server.close()
+            monitor.stop()
+            await config_store.flush_all()
+            await filestore.get_store().flush_all()
+            filestore.get_store().close()
+            await dl_engine.close_all()
+            store.close()
 
 if __name__ == "__main__":
     try:
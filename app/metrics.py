@@ -0,0 +1,167 @@
+# metrics.py
+# Prometheus 形式のメトリクス（/metrics で公開。外部ライブラリは使わない）
+import bisect
+import math
+import re
+import time
+import aiohttp
+
+# 秒単位の処理時間向けの既定のバケット
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra: pairs.append(extra)
+    if not pairs: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _number(value):
+    if value == math.inf: return "+Inf"
+    if isinstance(value, float) and value.is_integer(): return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}   # ラベル値のタプル -> 値
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: labels must be {self.labelnames}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += self._samples()
+        return lines
+
+    def _samples(self):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in sorted(self._values.items())]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """値を set() するか、読み出し時に呼ぶ関数を set_function() で渡します（キューの長さなど）。"""
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def _samples(self):
+        if self._function is None: return super()._samples()
+        try:
+            value = self._function()
+        except Exception:
+            return []
+        return [] if value is None else [f"{self.name} {_number(value)}"]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0, 0.0]   # バケットごとの件数, 件数, 合計
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets): entry[0][i] += 1
+        entry[1] += 1
+        entry[2] += value
+
+    def _samples(self):
+        lines = []
+        for key, (counts, count, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _number(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+_registry = []
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+def render():
+    """全メトリクスを Prometheus のテキスト形式で返します。"""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+# --- メトリクス一覧 ---
+
+COMMANDS = _register(Counter("maidbot_commands_total", "Commands handled, by command and outcome", ("command", "kind", "status")))
+COMMAND_SECONDS = _register(Histogram("maidbot_command_seconds", "Time from invocation to completion", ("kind",)))
+DOWNLOADS = _register(Counter("maidbot_downloads_total", "Download requests, by result", ("result",)))
+DOWNLOAD_SECONDS = _register(Histogram("maidbot_download_seconds", "Download, convert and upload time of successful downloads"))
+DL_QUEUE_WAITING = _register(Gauge("maidbot_dl_queue_waiting", "Download jobs waiting in the queue"))
+DL_QUEUE_RUNNING = _register(Gauge("maidbot_dl_queue_running", "Download jobs running"))
+CACHE_REQUESTS = _register(Counter("maidbot_cache_requests_total", "Cache lookups, by cache and hit/miss", ("cache", "result")))
+REST_REQUESTS = _register(Counter("maidbot_rest_requests_total", "Discord REST requests, by method, route and status", ("method", "route", "status")))
+REST_SECONDS = _register(Histogram("maidbot_rest_request_seconds", "Discord REST request latency", ("method",),
+                                   buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)))
+GATEWAY_LATENCY = _register(Gauge("maidbot_gateway_latency_seconds", "Heartbeat latency of the gateway connection"))
+LOOP_LAG = _register(Gauge("maidbot_event_loop_lag_seconds", "Most recent event loop lag"))
+LOOP_BLOCKS = _register(Counter("maidbot_event_loop_blocks_total", "Times a callback blocked the event loop past the threshold, by cog", ("cog",)))
+LOOP_BLOCK_SECONDS = _register(Histogram("maidbot_event_loop_block_seconds", "How long the event loop was blocked",
+                                         buckets=(0.25, 0.5, 1, 2.5, 5, 10, 30)))
+
+# /api/v10/channels/123/messages/456 → /channels/:id/messages/:id（IDごと・トークンごとに別の系列にしない）
+_ID = re.compile(r"/\d{5,}")
+_TOKEN = re.compile(r"/[\w.-]{40,}")
+_EMOJI = re.compile(r"/reactions/[^/]+")
+_API_PREFIX = re.compile(r"^/api/v\d+")
+
+def rest_route(path):
+    path = _API_PREFIX.sub("", path)
+    path = _EMOJI.sub("/reactions/:emoji", _TOKEN.sub("/:token", path))
+    return _ID.sub("/:id", path)
+
+def rest_trace_config():
+    """discord.Client(http_trace=...) に渡す aiohttp のトレース設定（REST の件数と時間を数える）"""
+    async def on_start(session, context, params):
+        context.started = time.perf_counter()
+
+    async def on_end(session, context, params):
+        # ゲートウェイへの接続（ws_connect）や CDN は数えない
+        if not params.url.path.startswith("/api/"): return
+        REST_SECONDS.observe(time.perf_counter() - context.started, method=params.method)
+        REST_REQUESTS.inc(method=params.method, route=rest_route(params.url.path), status=params.response.status)
+
+    async def on_error(session, context, params):
+        if not params.url.path.startswith("/api/"): return
+        REST_REQUESTS.inc(method=params.method, route=rest_route(params.url.path), status="error")
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_start)
+    trace.on_request_end.append(on_end)
+    trace.on_request_exception.append(on_error)
+    return trace
@@ -0,0 +1,63 @@
+# progress.py
+# 状況メッセージの編集を間引く（Discord のレート制限に当たらないように）
+import asyncio
+import time
+import discord
+
+PHASE_LABELS = {
+    "download": "📥 ダウンロード中",
+    "downloaded": "🔧 変換の準備中",
+    "postprocess": "🔧 変換中",
+    "tagging": "🏷️ タグ付け中",
+    "shrink": "🗜️ サイズ調整中",
+}
+
+def format_progress(event):
+    """エンジンから届いた途中経過を1行の文字列にします。"""
+    text = PHASE_LABELS.get(event.get("phase"), "⏳ 処理中")
+    if event.get("phase") == "download":
+        if event.get("percent") is not None:
+            filled = int(event["percent"] // 10)
+            text += f" `{'█' * filled}{'░' * (10 - filled)}` {event['percent']:.0f}%"
+        if event.get("speed"):
+            text += f" / {event['speed'] / 1024 / 1024:.1f}MB/s"
+        if event.get("eta") is not None:
+            text += f" / 残り約{int(event['eta'])}秒"
+    return text
+
+class ThrottledEditor:
+    """
+    1つのメッセージに対する編集を interval 秒に1回までに抑えます。
+    待っている間に来た更新は最後の1つだけを反映します（途中の分は捨てる）。
+    """
+    def __init__(self, message, interval=2.0):
+        self.message = message
+        self.interval = interval
+        self._pending = None
+        self._last = 0.0
+        self._task = None
+
+    def update(self, content):
+        self._pending = content
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._pending is not None:
+            wait = self._last + self.interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            content, self._pending = self._pending, None
+            self._last = time.monotonic()
+            try:
+                await self.message.edit(content=content)
+            except discord.HTTPException as e:
+                print(f"[Progress] Edit failed: {e}")
+
+    async def close(self):
+        """保留中の更新を捨てて止めます（この後に最終結果を書くため）。"""
+        self._pending = None
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
@@ -0,0 +1,81 @@
+# ratelimit.py
+# 全Cog共通のレート制限（トークンバケット + タイミングホイールでの自動削除）
+import time
+
+class TokenBucketLimiter:
+    """
+    キー（scope, user_id, guild_id など）ごとのトークンバケット。
+    capacity=1, per=N 秒にすると「N秒に1回」のクールダウンと同じ動きになります。
+
+    満タンに戻ったバケットは持っていても意味がないので、満タンになる時刻の
+    スロットに登録しておき、check/consume のついでに期限切れスロットをまとめて捨てます。
+    これで利用者がどれだけ入れ替わっても、保持するのは「回復途中のキー」だけです。
+    """
+    def __init__(self, capacity=1, per=30.0, slots=64, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.per = float(per)
+        self.rate = self.capacity / self.per   # 1秒あたりの回復量
+        self.clock = clock
+        self._buckets = {}                    # key -> [tokens, 更新時刻, 満タン時刻]
+        # タイミングホイール: 1周 = per 秒を slots 個に分割
+        self._tick = self.per / slots
+        self._wheel = [set() for _ in range(slots)]
+        self._cursor = int(clock() / self._tick)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _advance(self, now):
+        target = int(now / self._tick)
+        if target - self._cursor >= len(self._wheel):
+            # 1周以上放置されていたら全スロットを見る
+            self._cursor = target - len(self._wheel)
+        while self._cursor < target:
+            self._cursor += 1
+            slot = self._wheel[self._cursor % len(self._wheel)]
+            if not slot: continue
+            keep = set()
+            for key in slot:
+                bucket = self._buckets.get(key)
+                if bucket is None: continue
+                if bucket[2] <= now:
+                    del self._buckets[key]
+                else:
+                    # まだ満タンでない（1周より先の時刻）ならそのまま残す
+                    keep.add(key)
+            slot.clear()
+            slot.update(keep)
+
+    def _refill(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.capacity
+        return min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+
+    def retry_after(self, key):
+        """今1回使えるなら None、使えないならあと何秒待てばよいかを返します（消費はしません）"""
+        now = self.clock()
+        self._advance(now)
+        tokens = self._refill(key, now)
+        if tokens >= 1.0: return None
+        return (1.0 - tokens) / self.rate
+
+    def consume(self, key):
+        """1回分使います。使えた場合は None、足りなければ待ち秒数を返します。"""
+        now = self.clock()
+        self._advance(now)
+        tokens = self._refill(key, now)
+        if tokens < 1.0:
+            return (1.0 - tokens) / self.rate
+        tokens -= 1.0
+        full_at = now + (self.capacity - tokens) / self.rate
+        self._buckets[key] = [tokens, now, full_at]
+        self._wheel[int(full_at / self._tick) % len(self._wheel)].add(key)
+        return None
+
+    def reset(self, key):
+        self._buckets.pop(key, None)
+
+def cooldown(seconds, **kwargs):
+    """「seconds 秒に1回」のクールダウン"""
+    return TokenBucketLimiter(capacity=1, per=seconds, **kwargs)
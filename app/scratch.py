@@ -0,0 +1,131 @@
+# scratch.py
+# ダウンロード作業用の一時領域（ジョブごとのディレクトリ・取り残しの掃除・容量の予約）
+import asyncio
+import os
+import shutil
+import time
+import uuid
+import config
+
+JOB_PREFIX = "job_"
+
+class ScratchDir:
+    def __init__(self, area, path, reserved):
+        self.area = area
+        self.path = path
+        self.reserved = reserved
+        self.released = False
+
+    async def release(self):
+        """ディレクトリを中身ごと消して、予約した容量を返します。"""
+        await self.area._release(self)
+
+class ScratchArea:
+    """
+    - ジョブごとに job_<ID> ディレクトリを切り、終わったらまとめて消す（サムネイルや .part も残らない）
+    - 使う見込みの容量を acquire() で予約し、上限を超えるときは空くまで待たせる
+    - 使われていない job_* ディレクトリは sweep() で掃除する（起動時と定期実行）
+      root は /dev/shm などの共有の場所のこともあるので、それ以外の名前には触れない
+    """
+    def __init__(self, root, quota, orphan_age=7200, owns_root=False):
+        self.root = root
+        self.owns_root = owns_root   # root ごとこの Bot 専用か（DOWNLOAD_DIR のとき）
+        self.quota = quota
+        self.orphan_age = orphan_age
+        self.reserved = 0
+        self._active = {}    # パス -> ScratchDir
+        self._freed = asyncio.Condition()
+        os.makedirs(root, exist_ok=True)
+
+    async def acquire(self, nbytes):
+        """容量を予約してジョブ用ディレクトリを作ります。予約の合計が上限を超えるなら、他のジョブが終わるまで待ちます。"""
+        # 1件で上限を超える予約は上限に丸める（単独なら必ず通す）
+        nbytes = max(1, min(nbytes, self.quota))
+        async with self._freed:
+            await self._freed.wait_for(lambda: self.reserved + nbytes <= self.quota)
+            self.reserved += nbytes
+        if self._disk_free() < nbytes:
+            print(f"[Scratch] Low disk space: {self._disk_free() / 1024 / 1024:.0f}MB free")
+        path = os.path.join(self.root, f"{JOB_PREFIX}{uuid.uuid4().hex}")
+        os.makedirs(path)
+        scratch = ScratchDir(self, path, nbytes)
+        self._active[path] = scratch
+        return scratch
+
+    def _disk_free(self):
+        try:
+            return shutil.disk_usage(self.root).free
+        except OSError:
+            return self.quota
+
+    async def _release(self, scratch):
+        if scratch.released: return
+        scratch.released = True
+        try:
+            # 数百MBの削除はループを止めるのでスレッドで（消し終わるまでは sweep() の対象外のまま）
+            await asyncio.to_thread(shutil.rmtree, scratch.path, True)
+        finally:
+            self._active.pop(scratch.path, None)
+            self.reserved -= scratch.reserved
+            asyncio.ensure_future(self._notify())
+
+    async def _notify(self):
+        async with self._freed:
+            self._freed.notify_all()
+
+    def sweep(self, max_age=None, loose=False):
+        """
+        実行中のジョブ以外の job_* で、max_age 秒より古いものを消して (件数, バイト数) を返します。
+        loose=True なら、root がこの Bot 専用のとき（DOWNLOAD_DIR）に限り、以前の版が直に置いたファイルも消します。
+        """
+        max_age = self.orphan_age if max_age is None else max_age
+        limit = time.time() - max_age
+        removed, freed = 0, 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if path in self._active: continue
+            if not name.startswith(JOB_PREFIX) and not (loose and self.owns_root): continue
+            try:
+                if os.path.getmtime(path) > limit: continue
+                size = dir_size(path)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def usage(self):
+        return sum(dir_size(os.path.join(self.root, name)) for name in os.listdir(self.root) if name.startswith(JOB_PREFIX))
+
+def dir_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for base, _, files in os.walk(path):
+        for name in files:
+            try: total += os.path.getsize(os.path.join(base, name))
+            except OSError: pass
+    return total
+
+def pick_root(default, tmpfs=None):
+    """tmpfs の場所が指定されていて書き込めるならそちらを使います（I/O が速い）。"""
+    if tmpfs:
+        try:
+            os.makedirs(tmpfs, exist_ok=True)
+            if os.access(tmpfs, os.W_OK): return tmpfs
+        except OSError as e:
+            print(f"[Scratch] tmpfs unavailable ({tmpfs}): {e}")
+    return default
+
+_area = None
+
+def get_area():
+    global _area
+    if _area is None:
+        root = pick_root(config.DOWNLOAD_DIR, config.DL_SCRATCH_TMPFS)
+        _area = ScratchArea(root, config.DL_SCRATCH_QUOTA, config.DL_SCRATCH_ORPHAN_AGE, owns_root=root == config.DOWNLOAD_DIR)
+    return _area
@@ -0,0 +1,227 @@
+# search_index.py
+# 作品データベースの全文検索用インデックス（メモリ上の転置インデックス）
+import bisect
+import heapq
+import math
+import re
+import unicodedata
+
+WORD_RE = re.compile(r"[^\W_]+")
+CJK_RE = re.compile(r"[\u3040-\u30ff\u31f0-\u31ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+# フィールドごとの重み（タイトルに当たったものを上位に）
+FIELD_WEIGHTS = {"title": 3.0, "author": 2.0, "tags": 1.5, "genre": 1.0, "sub_type": 0.5}
+# 候補がこれより多いときは、重み順に並べた posting を上から見て途中で打ち切る
+BRUTE_FORCE_LIMIT = 2000
+
+def normalize(text):
+    # 全角英数・半角カナなどを揃えてから小文字化
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+def tokenize(text, for_query=False):
+    """
+    英数字は単語単位、日本語（かな・漢字）は文字2-gramに分解します。
+    索引側は1文字の検索にも当たるよう1-gramも入れておきます。
+    """
+    tokens = []
+    for word in WORD_RE.findall(normalize(text)):
+        pos = 0
+        for m in CJK_RE.finditer(word):
+            if m.start() > pos:
+                tokens.append(word[pos:m.start()])
+            run = m.group(0)
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+                if not for_query:
+                    tokens.extend(run)
+            pos = m.end()
+        if pos < len(word):
+            tokens.append(word[pos:])
+    return tokens
+
+class SearchIndex:
+    def __init__(self):
+        self.docs = {}       # entry_id -> エントリ情報
+        self.postings = {}   # guild_id -> {token -> {entry_id: 重み}}
+        self.doc_tokens = {} # entry_id -> そのエントリが持つ token（削除用）
+        self.facets = {}     # (guild_id, 項目, 値) -> {entry_id}（媒体・評価・タグの絞り込み用）
+        self.titles = {}     # guild_id -> [(正規化タイトル, entry_id)]（前方一致用、ソート済み）
+        self.tag_counts = {} # guild_id -> {タグ名 -> 件数}（オートコンプリート用。他のサーバーのタグは出さない）
+        self._ranked = {}    # (guild_id, token) -> 重みの大きい順の entry_id（検索時に作るキャッシュ）
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, entry):
+        doc_id = entry["id"]
+        if doc_id in self.docs:
+            self.remove(doc_id)
+        tags = entry.get("tags") or []
+        if isinstance(tags, str):
+            tags = tags.split()
+        doc = dict(entry, tags=tags, title_norm=normalize(entry.get("title")))
+        guild_id = doc["guild_id"]
+        self.docs[doc_id] = doc
+
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            value = " ".join(tags) if field == "tags" else doc.get(field)
+            for token in set(tokenize(value)):
+                weights[token] = weights.get(token, 0.0) + weight
+        postings = self.postings.setdefault(guild_id, {})
+        for token, weight in weights.items():
+            postings.setdefault(token, {})[doc_id] = weight
+            self._ranked.pop((guild_id, token), None)
+        self.doc_tokens[doc_id] = tuple(weights)
+
+        for key in self._facet_keys(doc):
+            self.facets.setdefault(key, set()).add(doc_id)
+        bisect.insort(self.titles.setdefault(guild_id, []), (doc["title_norm"], doc_id))
+        counts = self.tag_counts.setdefault(guild_id, {})
+        for tag in tags:
+            counts[tag] = counts.get(tag, 0) + 1
+
+    @staticmethod
+    def _facet_keys(doc):
+        guild_id = doc["guild_id"]
+        yield (guild_id, "guild", None)
+        yield (guild_id, "media", doc.get("media"))
+        yield (guild_id, "rating", doc.get("rating"))
+        for tag in doc["tags"]:
+            yield (guild_id, "tag", tag)
+
+    def remove(self, doc_id):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None: return
+        guild_id = doc["guild_id"]
+        postings = self.postings.get(guild_id, {})
+        for token in self.doc_tokens.pop(doc_id, ()):
+            self._ranked.pop((guild_id, token), None)
+            posting = postings.get(token)
+            if posting is None: continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del postings[token]
+        for key in self._facet_keys(doc):
+            facet = self.facets.get(key)
+            if facet is None: continue
+            facet.discard(doc_id)
+            if not facet:
+                del self.facets[key]
+        titles = self.titles.get(guild_id, [])
+        i = bisect.bisect_left(titles, (doc["title_norm"], doc_id))
+        if i < len(titles) and titles[i][1] == doc_id:
+            del titles[i]
+        counts = self.tag_counts.get(guild_id, {})
+        for tag in doc["tags"]:
+            counts[tag] -= 1
+            if counts[tag] <= 0:
+                del counts[tag]
+        if not counts:
+            self.tag_counts.pop(guild_id, None)
+
+    def remove_channel(self, channel_id):
+        for doc_id in [d for d, doc in self.docs.items() if doc["channel_id"] == channel_id]:
+            self.remove(doc_id)
+
+    def remove_message(self, message_id):
+        for doc_id in [d for d, doc in self.docs.items() if doc["message_id"] == message_id]:
+            self.remove(doc_id)
+
+    def _ranked_posting(self, guild_id, token, posting):
+        key = (guild_id, token)
+        ranked = self._ranked.get(key)
+        if ranked is None:
+            ranked = self._ranked[key] = sorted(posting, key=posting.__getitem__, reverse=True)
+        return ranked
+
+    def search(self, guild_id, query="", media=None, rating=None, tag=None, limit=10):
+        """AND 検索 + フィールド重み×IDF でスコア順に並べた (スコア, エントリ) のリストを返します。"""
+        docs = self.docs
+        # 絞り込み条件は facet の集合同士の積で求める
+        filters = [self.facets.get((guild_id, "guild", None), set())]
+        if media is not None: filters.append(self.facets.get((guild_id, "media", media), set()))
+        if rating is not None: filters.append(self.facets.get((guild_id, "rating", rating), set()))
+        if tag is not None: filters.append(self.facets.get((guild_id, "tag", tag), set()))
+
+        guild_postings = self.postings.get(guild_id, {})
+        tokens = list(dict.fromkeys(tokenize(query, for_query=True)))
+        if not tokens:
+            # キーワードなし: 絞り込み条件だけで新しい順
+            filters.sort(key=len)
+            hits = set(filters[0]).intersection(*filters[1:])
+            return [(0.0, docs[doc_id]) for doc_id in heapq.nlargest(limit, hits)]
+
+        postings = []
+        for token in tokens:
+            posting = guild_postings.get(token)
+            if not posting: return []
+            postings.append((token, posting))
+        postings.sort(key=lambda p: len(p[1]))
+        # 件数の少ない集合から絞り込む
+        sets = sorted([p for _, p in postings] + filters[1:], key=len)
+        candidates = set(sets[0])
+        for other in sets[1:]:
+            candidates.intersection_update(other)
+            if not candidates: return []
+
+        n_docs = len(docs)
+        weighted = [(posting, math.log(1 + n_docs / len(posting))) for _, posting in postings]
+        def base_score(doc_id):
+            return sum([posting[doc_id] * idf for posting, idf in weighted])
+
+        # タイトルが完全一致・前方一致するものはスコアを上乗せ（ソート済みタイトルを二分探索）
+        query_norm = normalize(query).strip()
+        titles = self.titles.get(guild_id, [])
+        bonus = {}
+        for i in range(bisect.bisect_left(titles, (query_norm,)), len(titles)):
+            title, doc_id = titles[i]
+            if not title.startswith(query_norm): break
+            if doc_id in candidates:
+                bonus[doc_id] = 2.0 if title == query_norm else 1.5
+
+        if len(candidates) <= BRUTE_FORCE_LIMIT:
+            scored = [(base_score(d) * bonus.get(d, 1.0), d) for d in candidates]
+            top = heapq.nlargest(limit, scored)
+        else:
+            # 候補が多いとき: 一番絞れる token の posting を重み順に見て、
+            # これ以上スコアが上がり得ない所で打ち切る（上乗せ対象は先に全部入れておく）
+            top = [(base_score(d) * b, d) for d, b in bonus.items()]
+            heapq.heapify(top)
+            while len(top) > limit:
+                heapq.heappop(top)
+            (driver_token, driver), driver_idf = postings[0], weighted[0][1]
+            # 残りの token は各 posting の最大重みで上限を見積もる
+            rest_bound = 0.0
+            for (token, posting), (_, idf) in zip(postings[1:], weighted[1:]):
+                rest_bound += posting[self._ranked_posting(guild_id, token, posting)[0]] * idf
+            for doc_id in self._ranked_posting(guild_id, driver_token, driver):
+                if len(top) >= limit and driver[doc_id] * driver_idf + rest_bound <= top[0][0]:
+                    break
+                if doc_id not in candidates or doc_id in bonus: continue
+                item = (base_score(doc_id), doc_id)
+                if len(top) < limit:
+                    heapq.heappush(top, item)
+                elif item > top[0]:
+                    heapq.heapreplace(top, item)
+            top.sort(reverse=True)
+        return [(score, docs[doc_id]) for score, doc_id in top]
+
+_index = None
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = SearchIndex()
+    return _index
+
+def build_index(entries):
+    """全エントリから索引を作って差し替えます（起動時にスレッドで実行）"""
+    global _index
+    index = SearchIndex()
+    for entry in entries:
+        index.add(entry)
+    _index = index
+    return index
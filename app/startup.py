@@ -0,0 +1,57 @@
+# startup.py
+# 起動にかかった時間の記録（import・DB・拡張ごとの読み込み・ログインして準備完了まで）
+# main.py の一番最初に import して、そこを起点に測る
+import sys
+import time
+
+# 本体のプロセスでは読み込まないはずの重いモジュール（子プロセス側だけで使う）
+HEAVY_MODULES = ("yt_dlp", "mutagen")
+
+class StartupProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._mark = self.started
+        self.phases = []        # (段階名, 秒)
+        self.extensions = {}    # 拡張名 -> {"total": 秒, "cog_load": 秒, "error": 文字列 or None}
+        self.ready_at = None
+
+    def phase(self, name):
+        """前の区切りからここまでを name の段階として記録します。"""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._mark))
+        self._mark = now
+
+    def extension(self, name, total, error=None):
+        entry = self.extensions.setdefault(name, {"cog_load": 0.0})
+        entry["total"] = total
+        entry["error"] = error
+
+    def cog_loaded(self, module, seconds):
+        """add_cog（コマンド登録と cog_load）にかかった時間。同じ拡張の Cog が複数あれば足し合わせる"""
+        entry = self.extensions.setdefault(module, {"cog_load": 0.0})
+        entry["cog_load"] += seconds
+
+    def ready(self):
+        """最初の on_ready で1回だけ呼びます（再接続では記録しない）。記録したら True"""
+        if self.ready_at is not None: return False
+        self.phase("login + gateway")
+        self.ready_at = time.perf_counter()
+        return True
+
+    def heavy_modules(self):
+        return [name for name in HEAVY_MODULES if name in sys.modules]
+
+    def lines(self):
+        lines = [f"{name:<20} {seconds * 1000:8.0f} ms" for name, seconds in self.phases]
+        for name, entry in self.extensions.items():
+            if "total" not in entry: continue
+            total, cog_load = entry["total"], entry["cog_load"]
+            status = f"  ❌ {entry['error']}" if entry["error"] else ""
+            lines.append(f"  {name:<18} {total * 1000:8.0f} ms (import+init {(total - cog_load) * 1000:.0f} / cog_load {cog_load * 1000:.0f}){status}")
+        if self.ready_at is not None:
+            lines.append(f"{'time to ready':<20} {(self.ready_at - self.started) * 1000:8.0f} ms")
+        heavy = self.heavy_modules()
+        lines.append(f"heavy modules: {', '.join(heavy) if heavy else 'none'} / modules loaded: {len(sys.modules)}")
+        return lines
+
+profile = StartupProfile()
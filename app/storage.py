@@ -0,0 +1,295 @@
+# storage.py
+# ブックマーク・ロール保持データの保存先（SQLite / WALモード）
+import sqlite3
+import asyncio
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS bookmarks (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    title   TEXT NOT NULL,
+    url     TEXT,
+    date    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bookmarks_user ON bookmarks(user_id, id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bookmarks_url ON bookmarks(user_id, url) WHERE url IS NOT NULL;
+CREATE TABLE IF NOT EXISTS role_keep (
+    user_id INTEGER NOT NULL,
+    role_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, role_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS media_channels (
+    channel_id INTEGER PRIMARY KEY,
+    indexed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media_messages (
+    message_id  INTEGER PRIMARY KEY,
+    guild_id    INTEGER NOT NULL,
+    channel_id  INTEGER NOT NULL,
+    media       TEXT NOT NULL,
+    description TEXT NOT NULL,
+    entry_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_media_messages_channel ON media_messages(channel_id, message_id);
+CREATE TABLE IF NOT EXISTS media_entries (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id   INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    media      TEXT NOT NULL,
+    title      TEXT NOT NULL,
+    message_id INTEGER NOT NULL REFERENCES media_messages(message_id) ON DELETE CASCADE,
+    sub_type   TEXT NOT NULL,
+    author     TEXT,
+    rating     TEXT,
+    genre      TEXT,
+    tags       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_media_entries_title ON media_entries(channel_id, title);
+CREATE INDEX IF NOT EXISTS idx_media_entries_key ON media_entries(guild_id, media, title);
+CREATE INDEX IF NOT EXISTS idx_media_entries_message ON media_entries(message_id);
+"""
+
+class Store:
+    """同期版のストア。1つの接続を1スレッドからだけ使う前提です。"""
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # --- meta ---
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT INTO meta(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+
+    # --- bookmarks ---
+    def add_bookmark(self, user_id, title, url, date):
+        """追加できたら True、同じURLが既にあれば False"""
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO bookmarks(user_id, title, url, date) VALUES(?, ?, ?, ?)",
+            (int(user_id), title, url, date)
+        )
+        return cur.rowcount == 1
+
+    def has_bookmark_url(self, user_id, url):
+        row = self.conn.execute("SELECT 1 FROM bookmarks WHERE user_id = ? AND url = ?", (int(user_id), url)).fetchone()
+        return row is not None
+
+    def list_bookmarks(self, user_id):
+        rows = self.conn.execute("SELECT title, url, date FROM bookmarks WHERE user_id = ? ORDER BY id", (int(user_id),)).fetchall()
+        return [dict(r) for r in rows]
+
+    def count_bookmarks(self, user_id):
+        return self.conn.execute("SELECT COUNT(*) FROM bookmarks WHERE user_id = ?", (int(user_id),)).fetchone()[0]
+
+    def list_bookmarks_page(self, user_id, offset, limit):
+        """一覧の offset 番目から limit 件だけ返します（ユーザー別インデックスを使うので全件は読みません）"""
+        rows = self.conn.execute(
+            "SELECT title, url, date FROM bookmarks WHERE user_id = ? ORDER BY id LIMIT ? OFFSET ?",
+            (int(user_id), limit, offset)
+        ).fetchall()
+        return [dict(r, index=offset + i + 1) for i, r in enumerate(rows)]
+
+    def search_bookmarks(self, user_id, query, limit=20):
+        """タイトルの部分一致検索。前方一致を先に並べ、一覧での番号も一緒に返します。"""
+        pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = self.conn.execute(
+            "SELECT b.title, b.url, b.date, "
+            "(SELECT COUNT(*) FROM bookmarks b2 WHERE b2.user_id = b.user_id AND b2.id <= b.id) AS idx "
+            "FROM bookmarks b WHERE b.user_id = ? AND b.title LIKE ? ESCAPE '\\' "
+            "ORDER BY (b.title LIKE ? ESCAPE '\\') DESC, b.id LIMIT ?",
+            (int(user_id), f"%{pattern}%", f"{pattern}%", limit)
+        ).fetchall()
+        return [{"title": r["title"], "url": r["url"], "date": r["date"], "index": r["idx"]} for r in rows]
+
+    def delete_bookmark(self, user_id, index):
+        """一覧の index 番目（0始まり）を削除して、その内容を返します。無ければ None"""
+        if index < 0: return None
+        with self.conn:
+            self.conn.execute("BEGIN")
+            row = self.conn.execute(
+                "SELECT id, title, url, date FROM bookmarks WHERE user_id = ? ORDER BY id LIMIT 1 OFFSET ?",
+                (int(user_id), index)
+            ).fetchone()
+            if row is None: return None
+            self.conn.execute("DELETE FROM bookmarks WHERE id = ?", (row["id"],))
+        return {"title": row["title"], "url": row["url"], "date": row["date"]}
+
+    # --- role keep ---
+    def get_kept_roles(self, user_id):
+        rows = self.conn.execute("SELECT role_id FROM role_keep WHERE user_id = ?", (int(user_id),)).fetchall()
+        return [r["role_id"] for r in rows]
+
+    def set_kept_roles(self, user_id, role_ids):
+        """そのユーザーの保存ロールを丸ごと置き換えます（1トランザクション）"""
+        uid = int(user_id)
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM role_keep WHERE user_id = ?", (uid,))
+            self.conn.executemany("INSERT OR IGNORE INTO role_keep(user_id, role_id) VALUES(?, ?)", [(uid, int(r)) for r in role_ids])
+
+    # --- 作品データベース（エントリ → メッセージの索引） ---
+    def is_media_channel_indexed(self, channel_id):
+        row = self.conn.execute("SELECT 1 FROM media_channels WHERE channel_id = ?", (int(channel_id),)).fetchone()
+        return row is not None
+
+    def get_open_media_message(self, channel_id):
+        """そのチャンネルで一番新しいコレクションメッセージ（追記先の候補）"""
+        row = self.conn.execute(
+            "SELECT * FROM media_messages WHERE channel_id = ? ORDER BY message_id DESC LIMIT 1", (int(channel_id),)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def find_media_entry(self, channel_id, title):
+        """タイトルから、そのエントリと載っているメッセージを引きます（同名なら新しい方）"""
+        row = self.conn.execute(
+            "SELECT e.id AS entry_id, e.title, e.sub_type, m.* FROM media_entries e "
+            "JOIN media_messages m ON m.message_id = e.message_id "
+            "WHERE e.channel_id = ? AND e.title = ? ORDER BY e.id DESC LIMIT 1",
+            (int(channel_id), title)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def save_media_append(self, message, entry):
+        """メッセージの本文更新とエントリ追加を1トランザクションで記録し、エントリIDを返します。"""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self._upsert_media_message(message)
+            return self._insert_media_entry(entry)
+
+    def list_media_entries(self, channel_id=None):
+        sql = "SELECT id, guild_id, channel_id, media, title, message_id, sub_type, author, rating, genre, tags FROM media_entries"
+        if channel_id is None:
+            rows = self.conn.execute(sql).fetchall()
+        else:
+            rows = self.conn.execute(sql + " WHERE channel_id = ?", (int(channel_id),)).fetchall()
+        return [dict(r) for r in rows]
+
+    def save_media_removal(self, entry_id, message):
+        """エントリを消し、メッセージ側も更新（本文が空ならメッセージごと）します。"""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM media_entries WHERE id = ?", (entry_id,))
+            if message["description"]:
+                self._upsert_media_message(message)
+            else:
+                self.conn.execute("DELETE FROM media_messages WHERE message_id = ?", (message["message_id"],))
+
+    def drop_media_message(self, message_id):
+        """Discord側で消えていたメッセージを索引から外します。"""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM media_messages WHERE message_id = ?", (int(message_id),))
+
+    def replace_media_channel(self, channel_id, messages, entries):
+        """チャンネル履歴から作り直した索引で、そのチャンネル分を丸ごと置き換えます。"""
+        cid = int(channel_id)
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM media_entries WHERE channel_id = ?", (cid,))
+            self.conn.execute("DELETE FROM media_messages WHERE channel_id = ?", (cid,))
+            for message in messages:
+                self._upsert_media_message(message)
+            for entry in entries:
+                self._insert_media_entry(entry)
+            self.conn.execute(
+                "INSERT INTO media_channels(channel_id, indexed_at) VALUES(?, datetime('now')) "
+                "ON CONFLICT(channel_id) DO UPDATE SET indexed_at = excluded.indexed_at", (cid,)
+            )
+
+    def _upsert_media_message(self, m):
+        self.conn.execute(
+            "INSERT INTO media_messages(message_id, guild_id, channel_id, media, description, entry_count) VALUES(?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(message_id) DO UPDATE SET description = excluded.description, entry_count = excluded.entry_count",
+            (int(m["message_id"]), int(m["guild_id"]), int(m["channel_id"]), m["media"], m["description"], m["entry_count"])
+        )
+
+    def _insert_media_entry(self, e):
+        return self.conn.execute(
+            "INSERT INTO media_entries(guild_id, channel_id, media, title, message_id, sub_type, author, rating, genre, tags) "
+            "VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (int(e["guild_id"]), int(e["channel_id"]), e["media"], e["title"], int(e["message_id"]), e["sub_type"],
+             e.get("author"), e.get("rating"), e.get("genre"), " ".join(e.get("tags") or []))
+        ).lastrowid
+
+    # --- JSONからの移行 ---
+    def migrate_json(self, bookmark_file, role_keep_file):
+        """旧JSONファイルがあれば一度だけ取り込み、元ファイルは .migrated に改名します。"""
+        if self.get_meta("json_migrated"): return
+        with self.conn:
+            self.conn.execute("BEGIN")
+            bookmarks = _read_json(bookmark_file)
+            for uid, items in bookmarks.items():
+                for bm in items:
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO bookmarks(user_id, title, url, date) VALUES(?, ?, ?, ?)",
+                        (int(uid), bm.get("title") or bm.get("url") or "", bm.get("url"), bm.get("date", ""))
+                    )
+            roles = _read_json(role_keep_file)
+            for uid, role_ids in roles.items():
+                self.conn.executemany("INSERT OR IGNORE INTO role_keep(user_id, role_id) VALUES(?, ?)", [(int(uid), int(r)) for r in role_ids])
+            self.set_meta("json_migrated", "1")
+        for path in (bookmark_file, role_keep_file):
+            if os.path.exists(path):
+                os.replace(path, path + ".migrated")
+        if bookmarks or roles:
+            print(f"[Storage] Migrated {len(bookmarks)} bookmark users / {len(roles)} role keep users from JSON")
+
+def _read_json(path):
+    if not os.path.exists(path): return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[Storage] Failed to read {path}: {e}")
+        return {}
+
+class AsyncStore:
+    """Store の非同期版。SQLite への処理はすべて専用スレッド1本で順番に実行します。"""
+    def __init__(self, path):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self._store = self._executor.submit(Store, path).result()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def __getattr__(self, name):
+        # Store の公開メソッドをそのまま専用スレッド経由で呼べるようにする
+        attr = getattr(self._store, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        async def call(*args):
+            return await self._run(attr, *args)
+        return call
+
+    def close(self):
+        self._executor.submit(self._store.close).result()
+        self._executor.shutdown(wait=True)
+
+_store = None
+
+def get_store():
+    """Bot全体で共有するストアを返します（初回呼び出し時に作成・JSON移行）"""
+    global _store
+    if _store is None:
+        _store = AsyncStore(config.DATABASE_FILE)
+        _store._executor.submit(_store._store.migrate_json, config.BOOKMARK_FILE, config.ROLE_KEEP_FILE).result()
+    return _store
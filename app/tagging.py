@@ -0,0 +1,100 @@
+# tagging.py
+# 出力ファイルへのタグ（タイトル・アーティスト・アルバム・カバー画像）書き込みを1回で済ませる
+import base64
+import os
+
+# 拡張子ごとの書き込み方法（File() で中身を総当たりで判定せず、直接その形式で開く）
+TAG_KINDS = {
+    "mp3": "id3",
+    "wav": "wave",
+    "m4a": "mp4", "mp4": "mp4", "alac": "mp4",
+    "flac": "flac",
+    "ogg": "vorbis", "vorbis": "vorbis",
+    "opus": "opus",
+}
+
+def _cover_mime(cover):
+    return "image/png" if cover.lower().endswith(".png") else "image/jpeg"
+
+def _read_cover(cover):
+    if not cover or not os.path.exists(cover): return None
+    with open(cover, "rb") as f:
+        return f.read()
+
+def _flac_picture(data, mime):
+    from mutagen.flac import Picture
+    picture = Picture()
+    picture.type = 3   # 表紙
+    picture.mime = mime
+    picture.data = data
+    return picture
+
+def _write_id3(tags, title, artist, album, cover_data, mime):
+    from mutagen.id3 import TIT2, TPE1, TALB, APIC
+    tags.delall("APIC")
+    tags.add(TIT2(encoding=3, text=[title]))
+    tags.add(TPE1(encoding=3, text=[artist]))
+    tags.add(TALB(encoding=3, text=[album]))
+    if cover_data:
+        tags.add(APIC(encoding=3, mime=mime, type=3, desc="Cover", data=cover_data))
+
+def write_tags(path, title="", artist="", album="", cover=None):
+    """
+    タグを書き込んで保存します（ファイルへの書き込みは1回）。
+    対応していない形式（aac の生ストリームなど）は何もせず False を返します。
+    """
+    kind = TAG_KINDS.get(os.path.splitext(path)[1].lstrip(".").lower())
+    if kind is None or not os.path.exists(path): return False
+    title, artist, album = title or "", artist or "", album or ""
+    cover_data = _read_cover(cover)
+    mime = _cover_mime(cover) if cover_data else None
+    try:
+        if kind == "id3":
+            from mutagen.id3 import ID3, ID3NoHeaderError
+            try:
+                tags = ID3(path)
+            except ID3NoHeaderError:
+                tags = ID3()
+            _write_id3(tags, title, artist, album, cover_data, mime)
+            tags.save(path)
+        elif kind == "wave":
+            from mutagen.wave import WAVE
+            audio = WAVE(path)
+            if audio.tags is None: audio.add_tags()
+            _write_id3(audio.tags, title, artist, album, cover_data, mime)
+            audio.save()
+        elif kind == "mp4":
+            from mutagen.mp4 import MP4, MP4Cover
+            audio = MP4(path)
+            if audio.tags is None: audio.add_tags()
+            audio["\xa9nam"] = [title]
+            audio["\xa9ART"] = [artist]
+            audio["\xa9alb"] = [album]
+            if cover_data:
+                fmt = MP4Cover.FORMAT_PNG if mime == "image/png" else MP4Cover.FORMAT_JPEG
+                audio["covr"] = [MP4Cover(cover_data, imageformat=fmt)]
+            audio.save()
+        elif kind == "flac":
+            from mutagen.flac import FLAC
+            audio = FLAC(path)
+            audio["title"], audio["artist"], audio["album"] = title, artist, album
+            if cover_data:
+                audio.clear_pictures()
+                audio.add_picture(_flac_picture(cover_data, mime))
+            audio.save()
+        else:
+            if kind == "opus":
+                from mutagen.oggopus import OggOpus as OggFile
+            else:
+                from mutagen.oggvorbis import OggVorbis as OggFile
+            audio = OggFile(path)
+            audio["title"], audio["artist"], audio["album"] = title, artist, album
+            if cover_data:
+                # Ogg ではカバー画像を FLAC の Picture ブロックを base64 にして入れる
+                picture = _flac_picture(cover_data, mime)
+                audio["metadata_block_picture"] = [base64.b64encode(picture.write()).decode("ascii")]
+            audio.save()
+        return True
+    except Exception as e:
+        print(f"[Metadata Error] {e}")
+        return False
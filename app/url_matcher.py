@@ -0,0 +1,51 @@
+# url_matcher.py
+# メッセージ中のダウンロード対象URLを拾う（毎メッセージ呼ばれるので、安い判定から順に）
+import re
+
+# URLらしき部分の切り出し。1つ目のグループがホスト部分（ドメインの判定は正規表現ではなく集合で行う）
+STOP = r'\s<>|、。「」『』（）【】'
+CANDIDATE = re.compile(rf'https?://([\w.\-:@]+)[^{STOP}]*')
+# URLの直後に付きがちな句読点・括弧はURLに含めない
+TRAILING = ".,!?)]}>'\"、。！？）」』】"
+
+class UrlMatcher:
+    """
+    1. "http" が含まれないメッセージはここで終わり（ほとんどの会話はこれ）
+    2. https?:// の部分だけを切り出し、ホスト名を取り出す
+    3. ホスト名を後ろから削りながら許可ドメインの集合を引く（m.youtube.com → youtube.com）
+    """
+    def __init__(self, domains=()):
+        self.domains = set()
+        self.add_domains(domains)
+
+    def add_domains(self, domains):
+        for domain in domains:
+            domain = domain.strip().lower().rstrip(".")
+            if domain.startswith("www."): domain = domain[4:]
+            if "." in domain: self.domains.add(domain)
+
+    def allowed(self, host):
+        if host in self.domains: return True
+        # user@host:port の host だけにする
+        host = host.rpartition("@")[2].partition(":")[0].lower().rstrip(".")
+        # 最後のラベル（TLD）だけになるまで親ドメインをたどる
+        while "." in host:
+            if host in self.domains: return True
+            host = host.partition(".")[2]
+        return False
+
+    def find_all(self, text, limit=None):
+        """許可ドメインのURLを出てきた順に返します（重複は除く）。"""
+        if "http" not in text: return []
+        urls = []
+        for match in CANDIDATE.finditer(text):
+            if not self.allowed(match.group(1)): continue
+            url = match.group(0).rstrip(TRAILING)
+            if url in urls: continue
+            urls.append(url)
+            if limit and len(urls) >= limit: break
+        return urls
+
+    def find(self, text):
+        urls = self.find_all(text, limit=1)
+        return urls[0] if urls else None
@@ -0,0 +1,48 @@
+# benchmarks/bench_ratelimit.py
+# ratelimit の 1M 回チェックのマイクロベンチマーク（利用者が入れ替わり続ける状況）
+#   python benchmarks/bench_ratelimit.py [チェック回数] [同時にいる利用者数]
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+import ratelimit
+
+class FakeClock:
+    def __init__(self): self.now = 1000.0
+    def __call__(self): return self.now
+
+def run(label, limiter, clock, keys, n):
+    peak = 0
+    allowed = 0
+    t = time.perf_counter()
+    for i in range(n):
+        # 1チェックごとに 1ms 進める（= 1秒あたり1000チェック）
+        clock.now += 0.001
+        if limiter.consume(keys[i]) is None:
+            allowed += 1
+        if i % 1000 == 0:
+            peak = max(peak, len(limiter))
+    elapsed = time.perf_counter() - t
+    print(f"{label:<32} {elapsed/n*1e9:7.0f} ns/check   allowed={allowed:>7}   peak keys={peak:>6}   final keys={len(limiter)}")
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    active = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+    random.seed(0)
+
+    # 利用者が少しずつ入れ替わる: i 番目のチェックは [i/20, i/20 + active) の誰か
+    churn = [("dl", i // 20 + random.randrange(active), 1) for i in range(n)]
+    hot = [("dl", random.randrange(100), 1) for _ in range(n)]
+
+    print(f"checks={n} active users={active} (1ms/check on a fake monotonic clock)")
+    clock = FakeClock()
+    run("cooldown 30s, churning users", ratelimit.cooldown(30, clock=clock), clock, churn, n)
+    clock = FakeClock()
+    run("cooldown 30s, 100 hot users", ratelimit.cooldown(30, clock=clock), clock, hot, n)
+    clock = FakeClock()
+    run("bucket 5/10s, churning users", ratelimit.TokenBucketLimiter(5, 10, clock=clock), clock, churn, n)
+
+if __name__ == "__main__":
+    main()
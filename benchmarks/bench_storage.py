@@ -0,0 +1,88 @@
+# benchmarks/bench_storage.py
+# JSON全書き換え方式と SQLite ストアの1操作あたりのレイテンシ比較
+#   python benchmarks/bench_storage.py [ユーザー数] [1人あたりのブックマーク数]
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+import storage
+
+def load_json(path):
+    with open(path, "r", encoding="utf-8") as f: return json.load(f)
+
+def save_json(path, data):
+    with open(path, "w", encoding="utf-8") as f: json.dump(data, f, ensure_ascii=False, indent=4)
+
+def make_data(users, per_user):
+    return {
+        str(100000000000000000 + u): [
+            {"title": f"ブックマーク {u}-{i}", "url": f"https://example.com/{u}/{i}", "date": "2025-01-01 00:00"}
+            for i in range(per_user)
+        ]
+        for u in range(users)
+    }
+
+def bench(label, ops, func):
+    samples = []
+    for args in ops:
+        t = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - t)
+    samples.sort()
+    p50 = samples[len(samples) // 2] * 1000
+    p99 = samples[int(len(samples) * 0.99)] * 1000
+    print(f"{label:<28} p50 {p50:8.3f} ms   p99 {p99:8.3f} ms")
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    n_ops = 200
+    data = make_data(users, per_user)
+    uids = list(data.keys())
+    ops = [(random.choice(uids), i) for i in range(n_ops)]
+    # JSON方式は1回で数百msかかるので回数を減らす
+    json_ops = ops[:30]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "bookmarks.json")
+        save_json(json_path, data)
+        print(f"users={users} bookmarks/user={per_user} json={os.path.getsize(json_path)/1024/1024:.1f}MB ops={n_ops} (json {len(json_ops)})")
+
+        def json_add(uid, i):
+            d = load_json(json_path)
+            d.setdefault(uid, [])
+            if not any(bm.get("url") == f"https://bench/{i}" for bm in d[uid]):
+                d[uid].append({"title": "new", "url": f"https://bench/{i}", "date": "2025-01-01 00:00"})
+            save_json(json_path, d)
+
+        def json_delete(uid, i):
+            d = load_json(json_path)
+            if d.get(uid): d[uid].pop(0)
+            save_json(json_path, d)
+
+        bench("json add", json_ops, json_add)
+        bench("json delete", json_ops, json_delete)
+
+        store = storage.Store(os.path.join(tmp, "maid.db"))
+        store.migrate_json(os.path.join(tmp, "none.json"), os.path.join(tmp, "none.json"))
+        t = time.perf_counter()
+        with store.conn:
+            store.conn.execute("BEGIN")
+            for uid, items in data.items():
+                store.conn.executemany(
+                    "INSERT INTO bookmarks(user_id, title, url, date) VALUES(?, ?, ?, ?)",
+                    [(int(uid), bm["title"], bm["url"], bm["date"]) for bm in items]
+                )
+        print(f"sqlite bulk load: {(time.perf_counter() - t)*1000:.0f} ms")
+
+        bench("sqlite add", ops, lambda uid, i: store.add_bookmark(uid, "new", f"https://bench/{i}", "2025-01-01 00:00"))
+        bench("sqlite delete", ops, lambda uid, i: store.delete_bookmark(uid, 0))
+        bench("sqlite role keep (replace)", ops, lambda uid, i: store.set_kept_roles(uid, [1, 2, 3, i]))
+        store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# benchmarks/bench_tagging.py
+# 形式ごとのタグ書き込みコスト（時間と読み書きバイト数）の比較（ffmpeg は使わずにサンプルを合成）
+#   1. 以前: FFmpegMetadata がファイル全体を書き直し、EmbedThumbnail がカバーを入れ、さらに save_metadata_to_file が mutagen で保存
+#      （ffmpeg の -c copy による書き直しは「全体を読んで別ファイルに書き、置き換える」コピーで再現。
+#        EmbedThumbnail は mp3 では ffmpeg、m4a/mp4/ogg/opus/flac では mutagen を使い、wav には入れない）
+#   2. 今: tagging.write_tags でタイトル・アーティスト・アルバム・カバーを1回で保存
+#   python benchmarks/bench_tagging.py [秒数(サンプルの長さ)]
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import wave
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+import tagging
+
+# --- サンプルの合成（中身は無音・乱数だが、mutagen が開ける構造にしておく） ---
+
+def _atom(name, payload):
+    return struct.pack(">I", 8 + len(payload)) + name + payload
+
+def _full_atom(name, payload):
+    return _atom(name, b"\x00\x00\x00\x00" + payload)
+
+def make_m4a(path, seconds):
+    ftyp = _atom(b"ftyp", b"M4A \x00\x00\x02\x00M4A mp42isom")
+    mvhd = _full_atom(b"mvhd", struct.pack(">IIII", 0, 0, 1000, int(seconds * 1000)) + b"\x00" * 80)
+    mdhd = _full_atom(b"mdhd", struct.pack(">IIIIHH", 0, 0, 44100, int(seconds * 44100), 0, 0))
+    hdlr = _full_atom(b"hdlr", b"\x00" * 4 + b"soun" + b"\x00" * 12 + b"SoundHandler\x00")
+    def moov(offset):
+        stbl = _atom(b"stbl", _full_atom(b"stsd", struct.pack(">I", 0)) + _full_atom(b"stco", struct.pack(">II", 1, offset)))
+        trak = _atom(b"trak", _atom(b"mdia", mdhd + hdlr + _atom(b"minf", stbl)))
+        return _atom(b"moov", mvhd + trak)
+    offset = len(ftyp) + len(moov(0)) + 8
+    with open(path, "wb") as f:
+        f.write(ftyp + moov(offset) + _atom(b"mdat", os.urandom(int(seconds * 16000))))
+
+def make_mp3(path, seconds):
+    # MPEG1 Layer3 128kbps 44.1kHz のフレーム（417バイト）を並べる
+    frame = b"\xff\xfb\x90\x00" + b"\x00" * 413
+    with open(path, "wb") as f:
+        f.write(frame * int(seconds * 38.28))
+
+def make_wav(path, seconds):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(44100)
+        w.writeframes(b"\x00" * int(seconds * 44100 * 4))
+
+def make_flac(path, seconds):
+    info = ((44100 << 44) | (1 << 41) | (15 << 36) | int(seconds * 44100)).to_bytes(8, "big")
+    streaminfo = struct.pack(">HH", 4096, 4096) + b"\x00" * 6 + info + b"\x00" * 16
+    with open(path, "wb") as f:
+        f.write(b"fLaC" + b"\x80" + (34).to_bytes(3, "big") + streaminfo + os.urandom(int(seconds * 90000)))
+
+def _write_ogg(path, header_pages, seconds, rate):
+    from mutagen.ogg import OggPage
+    pages = []
+    for packets in header_pages:
+        page = OggPage()
+        page.packets = packets
+        pages.append(page)
+    count = int(seconds * 4)
+    for i in range(count):
+        page = OggPage()
+        page.position = int((i + 1) * rate / 4)
+        page.packets = [os.urandom(4000)]
+        pages.append(page)
+    pages[0].first = True
+    pages[-1].last = True
+    with open(path, "wb") as f:
+        for seq, page in enumerate(pages):
+            page.serial, page.sequence = 1, seq
+            f.write(page.write())
+
+def make_opus(path, seconds):
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, 312, 48000, 0, 0)
+    tags = b"OpusTags" + struct.pack("<I", 5) + b"bench" + struct.pack("<I", 0)
+    _write_ogg(path, [[head], [tags]], seconds, 48000)
+
+def make_ogg(path, seconds):
+    ident = b"\x01vorbis" + struct.pack("<IBIiiiBB", 0, 2, 44100, 0, 128000, 0, 0xb8, 1)
+    comment = b"\x03vorbis" + struct.pack("<I", 5) + b"bench" + struct.pack("<I", 0) + b"\x01"
+    setup = b"\x05vorbis" + os.urandom(200)
+    _write_ogg(path, [[ident], [comment, setup]], seconds, 44100)
+
+SAMPLES = [("mp3", make_mp3), ("m4a", make_m4a), ("mp4", make_m4a), ("opus", make_opus),
+           ("ogg", make_ogg), ("flac", make_flac), ("wav", make_wav)]
+
+# --- 計測 ---
+
+def io_counters():
+    """このプロセスがこれまでに読み書きしたバイト数（Linux の /proc/self/io）。"""
+    counters = {}
+    with open("/proc/self/io") as f:
+        for line in f:
+            key, value = line.split(":")
+            counters[key] = int(value)
+    return counters["rchar"], counters["wchar"]
+
+def remux(path):
+    """ffmpeg -i in -c copy out → 置き換え と同じ読み書き量。"""
+    tmp = path + ".temp"
+    shutil.copyfile(path, tmp)
+    os.replace(tmp, path)
+
+def old_path(path, cover):
+    remux(path)   # FFmpegMetadata
+    ext = path.rsplit(".", 1)[1]
+    if ext == "mp3":
+        remux(path)   # EmbedThumbnail (ffmpeg)
+    elif ext != "wav":
+        tagging.write_tags(path, "", "", "", cover=cover)   # EmbedThumbnail (mutagen)
+    tagging.write_tags(path, "Title", "Artist", "Album")   # save_metadata_to_file
+
+def new_path(path, cover):
+    tagging.write_tags(path, "Title", "Artist", "Album", cover=cover)
+
+def measure(func, path, cover, runs):
+    elapsed, read, written = 0.0, 0, 0
+    for _ in range(runs):
+        base = path + ".orig"
+        shutil.copyfile(base, path)
+        r0, w0 = io_counters()
+        t = time.perf_counter()
+        func(path, cover)
+        elapsed += time.perf_counter() - t
+        r1, w1 = io_counters()
+        read += r1 - r0
+        written += w1 - w0
+    return elapsed / runs, read / runs, written / runs
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 240
+    runs = 5
+    mb = 1024 * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        cover = os.path.join(tmp, "cover.jpg")
+        with open(cover, "wb") as f:
+            f.write(b"\xff\xd8\xff\xe0" + os.urandom(80 * 1024))
+        print(f"{'format':6} {'size':>8}  {'old ms':>8} {'old I/O':>10}  {'new ms':>8} {'new I/O':>10}")
+        for ext, make in SAMPLES:
+            path = os.path.join(tmp, f"sample.{ext}")
+            make(path + ".orig", seconds)
+            size = os.path.getsize(path + ".orig")
+            o_t, o_r, o_w = measure(old_path, path, cover, runs)
+            n_t, n_r, n_w = measure(new_path, path, cover, runs)
+            print(f"{ext:6} {size / mb:6.1f}MB  {o_t*1000:8.1f} {(o_r + o_w) / mb:8.1f}MB  {n_t*1000:8.1f} {(n_r + n_w) / mb:8.1f}MB")
+
+if __name__ == "__main__":
+    main()
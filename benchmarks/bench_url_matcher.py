@@ -0,0 +1,121 @@
+# benchmarks/bench_url_matcher.py
+# on_message の URL 判定コストの比較（会話・関係ないリンク・対象URLを混ぜたメッセージで）
+#   1. 以前: すべてのメッセージに固定ドメインの正規表現を当ててから、チャンネルを確認
+#   2. 今: チャンネルを先に確認し、"http" の有無 → ホスト名を許可ドメインの集合で引く
+#   python benchmarks/bench_url_matcher.py [メッセージ数]
+import os
+import random
+import re
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+import config
+import url_matcher
+
+OLD_PATTERN = re.compile(r'https?://(?:www\.)?(?:youtube\.com|youtu\.be|soundcloud\.com|bandcamp\.com|twitter\.com|x\.com|tiktok\.com|instagram\.com)[^\s]+')
+
+CHAT = [
+    "おはようございます！", "今日の配信何時からだっけ？", "それな", "草", "ちょっとご飯食べてくる",
+    "昨日のアプデで装備の仕様変わったの知ってる？耐久の減り方がだいぶマイルドになってて助かる",
+    "わかる〜😂", "了解です🙏", "明日テストなんだけど全然勉強してない…", "おつかれさまでした！✨",
+    "このバグ再現できた人いる？ログイン直後にインベントリ開くと落ちるっぽい",
+    "lol", "gg", "brb", "that boss fight was insane, took us like 40 tries",
+]
+OTHER_LINKS = [
+    "https://github.com/yt-dlp/yt-dlp/issues/1234", "https://tenor.com/view/cat-dance-gif-12345",
+    "https://discord.com/channels/1/2/3", "https://www.google.com/search?q=%E5%A4%A9%E6%B0%97",
+    "https://ja.wikipedia.org/wiki/%E3%83%A1%E3%82%A4%E3%83%89", "https://store.steampowered.com/app/570/",
+]
+TARGET_LINKS = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "https://youtu.be/dQw4w9WgXcQ?si=abcdEFGH",
+    "https://m.youtube.com/watch?v=abcdefghijk&t=42s", "https://soundcloud.com/artist/track-name",
+    "https://x.com/user/status/1790000000000000000", "https://www.tiktok.com/@user/video/7300000000000000000",
+    "https://artist.bandcamp.com/track/song",
+]
+
+def make_corpus(n, seed=1):
+    """会話 85%・関係ないリンク 10%・対象URL 5%（うち一部は2つ入り）。チャンネルは20個で、DL用はその1つ。"""
+    rng = random.Random(seed)
+    channels = [config.ALLOWED_DL_CHANNEL_ID] + list(range(1, 20))
+    corpus = []
+    for _ in range(n):
+        r = rng.random()
+        text = rng.choice(CHAT)
+        if r > 0.95:
+            text = f"これお願いします {rng.choice(TARGET_LINKS)}"
+            if rng.random() < 0.2: text += f" と {rng.choice(TARGET_LINKS)}"
+        elif r > 0.85:
+            text = f"{text} {rng.choice(OTHER_LINKS)}"
+        corpus.append((rng.choice(channels), text))
+    return corpus
+
+def old_on_message(corpus):
+    hits = 0
+    for channel, text in corpus:
+        match = OLD_PATTERN.search(text)
+        if match:
+            if channel != config.ALLOWED_DL_CHANNEL_ID: continue
+            hits += 1
+    return hits
+
+def new_on_message(matcher):
+    def run(corpus):
+        hits = 0
+        for channel, text in corpus:
+            if channel != config.ALLOWED_DL_CHANNEL_ID: continue
+            hits += len(matcher.find_all(text, limit=config.DL_MESSAGE_MAX_URLS))
+        return hits
+    return run
+
+def matching_only(find):
+    def run(corpus):
+        return sum(1 for _, text in corpus if find(text))
+    return run
+
+def timed(func, corpus, repeat=5):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = func(corpus)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(corpus), result
+
+def extractor_matcher():
+    """yt-dlp の抽出器からドメインを集めた場合（DL_DOMAINS_FROM_EXTRACTORS = True）"""
+    try:
+        import dl_worker
+        domains = dl_worker.domains()
+    except ImportError:
+        return None
+    matcher = url_matcher.UrlMatcher(config.DL_ALLOWED_DOMAINS)
+    matcher.add_domains(domains)
+    return matcher
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    corpus = make_corpus(n)
+    matcher = url_matcher.UrlMatcher(config.DL_ALLOWED_DOMAINS)
+    rows = [
+        ("old: regex on every message", old_on_message),
+        ("new: channel first + matcher", new_on_message(matcher)),
+        ("regex only (all channels)", matching_only(OLD_PATTERN.search)),
+        ("matcher only (all channels)", matching_only(matcher.find_all)),
+    ]
+    big = extractor_matcher()
+    if big:
+        # 同じドメインを正規表現の選択肢で並べた場合（以前の書き方のまま増やしたとき）
+        alternation = "|".join(re.escape(d) for d in sorted(big.domains, key=len, reverse=True))
+        big_pattern = re.compile(rf'https?://(?:[\w-]+\.)*(?:{alternation})[/?#:]\S*')
+        rows.append((f"regex, {len(big.domains)} extractor domains", matching_only(big_pattern.search)))
+        rows.append((f"matcher, {len(big.domains)} extractor domains", matching_only(big.find_all)))
+    print(f"{n} messages")
+    for name, func in rows:
+        per, hits = timed(func, corpus)
+        print(f"{name:38} {per*1e9:8.0f} ns/message  ({hits} hits)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# benchmarks/bench_ydl_warm.py
+# 1リクエストあたりの yt-dlp 準備コストの比較（ネットワークには繋がない）
+#   1. 新しいプロセスで import から（子プロセスを毎回立てた場合）
+#   2. import 済みのプロセスで毎回 YoutubeDL を作る（以前の run_dl / fetch_url_title）
+#   3. dl_worker の温めたインスタンスを使い回す（今の子プロセス）
+#   python benchmarks/bench_ydl_warm.py [回数]
+import os
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+COLD_SNIPPET = (
+    "import yt_dlp, dl_worker;"
+    "y = yt_dlp.YoutubeDL(dl_worker.download_options('mp3', '0', None));"
+    "y.get_info_extractor('Youtube'); y.close()"
+)
+
+def cold(n):
+    t = time.perf_counter()
+    for _ in range(n):
+        subprocess.run([sys.executable, "-c", COLD_SNIPPET], cwd=APP_DIR, check=True)
+    return (time.perf_counter() - t) / n
+
+def fresh(n):
+    import yt_dlp
+    import dl_worker
+    t = time.perf_counter()
+    for _ in range(n):
+        ydl = yt_dlp.YoutubeDL(dl_worker.download_options("mp3", "0", None))
+        ydl.get_info_extractor('Youtube')
+        ydl.close()
+    return (time.perf_counter() - t) / n
+
+def warm(n):
+    import dl_worker
+    profile = ("download", "mp3", "0", None)
+    build = lambda: dl_worker.download_options("mp3", "0", None)
+    with dl_worker.warm_ydl(profile, build):
+        pass
+    t = time.perf_counter()
+    for i in range(n):
+        with dl_worker.warm_ydl(profile, build) as ydl:
+            dl_worker.set_outtmpl(ydl, f"job_{i}/%(title)s.%(ext)s")
+            ydl.get_info_extractor('Youtube')
+    return (time.perf_counter() - t) / n
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    c = cold(max(1, n // 5))
+    f = fresh(n)
+    w = warm(n * 50)
+    print(f"cold process (import + init)     {c*1000:9.1f} ms/request")
+    print(f"fresh YoutubeDL per request      {f*1000:9.2f} ms/request")
+    print(f"warm instance reused             {w*1000:9.3f} ms/request")
+    print(f"saved vs fresh: {(f - w)*1000:.2f} ms/request, vs cold: {(c - w)*1000:.0f} ms/request")
+
+if __name__ == "__main__":
+    main()